@@ -0,0 +1,88 @@
+import copy
+import random
+import time
+
+from bobo_db import construct_sending_data_obj
+from bench_invoice_ingest import invoice
+
+INVOICES = 100_000
+
+#hand-written mappers as they were before INVOICE_SPEC, kept here as baseline
+def format_ocr_doc_to_obj(input_obj):
+    return {
+        'document_type' : input_obj.get('document_type'),
+        'extraction_timestamp' : input_obj.get('extraction_timestamp'),
+        'source_format': input_obj.get('source_format'),
+        'source_file': input_obj.get('source_file')
+    }
+
+def extract_data_from_metadata(metadata_obj):
+    return {
+        'confidence_score': metadata_obj.get('confidence_score'),
+        'extracted_text_sample': metadata_obj.get('extracted_text_sample')
+    }
+
+def get_document_data_through_relation(input_obj):
+    result = format_ocr_doc_to_obj(input_obj)
+    result['vendor'] = input_obj.get('vendor')
+    result['customer'] = input_obj.get('customer')
+    return result
+
+def get_totals_data_through_relation(input_obj):
+    totals = input_obj.get('totals')
+    tax_breakdown = totals.get('tax_breakdown')
+    if 'tax_breakdown' in totals:
+        del totals['tax_breakdown']
+    totals['tax_breakdowns'] = tax_breakdown
+    return totals
+
+def format_string_list_to_obj_list(string_list, attribute_name):
+    result = []
+    for string in string_list:
+        result.append({f'{attribute_name}' : string})
+    return result
+
+def get_metadata_through_relation(input_obj):
+    temp_metadata = input_obj.get('metadata')
+    metadata_input = extract_data_from_metadata(temp_metadata)
+    metadata_input['processing_notes'] = format_string_list_to_obj_list(temp_metadata.get('processing_notes'), 'note')
+    metadata_input['warnings'] = format_string_list_to_obj_list(temp_metadata.get('warnings'), 'warning')
+    return metadata_input
+
+def legacy_construct_sending_data_obj(input_obj):
+    invoice_details = input_obj.get('invoice_details', {})
+    return {
+        'invoice_number': invoice_details.get('invoice_number'),
+        'invoice_date': invoice_details.get('invoice_date'),
+        'due_date': invoice_details.get('due_date'),
+        'order_number': invoice_details.get('order_number'),
+        'order_date': invoice_details.get('order_date'),
+        'delivery_date': invoice_details.get('delivery_date'),
+        'payment_terms': invoice_details.get('payment_terms'),
+        'currency': invoice_details.get('currency'),
+        'document': get_document_data_through_relation(input_obj),
+        'line_items': input_obj.get('line_items'),
+        'totals': get_totals_data_through_relation(input_obj),
+        'metadata': get_metadata_through_relation(input_obj)
+    }
+
+def measure(label, function, invoices):
+    start = time.perf_counter()
+    for input_obj in invoices:
+        function(input_obj)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed * 1000:>10.1f} ms{len(invoices) / elapsed:>12.0f} invoices/s")
+
+def main():
+    generator = random.Random(0)
+    invoices = [invoice(generator, number) for number in range(INVOICES)]
+    #legacy mappers modify their input, so they get their own copy
+    legacy_invoices = copy.deepcopy(invoices)
+    expected = [legacy_construct_sending_data_obj(input_obj) for input_obj in copy.deepcopy(invoices[:1000])]
+    assert [construct_sending_data_obj(input_obj) for input_obj in invoices[:1000]] == expected
+    print(f"{INVOICES} invoices")
+    measure("hand-written mappers", legacy_construct_sending_data_obj, legacy_invoices)
+    measure("INVOICE_SPEC compiled", construct_sending_data_obj, invoices)
+
+if __name__ == '__main__':
+    main()
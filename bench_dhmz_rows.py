@@ -0,0 +1,61 @@
+import datetime
+import random
+import re
+import time
+
+from dhmz_rows import Type, parse_rows
+
+ROWS = 10_000
+
+def legacy_format_sending_data(cells_text_array):
+    #format_sending_data as it was before the column spec, kept here as baseline
+    data = {}
+    topics = ["wind_direction", "wind_velocity", "air_temperature",
+              "relative_moisture", "air_pressure", "air_tendency",
+              "weather_state", "time"]
+    types = [Type.STRING, Type.STRING, Type.FLOAT, Type.FLOAT, Type.INT, Type.FLOAT, Type.FLOAT, Type.STRING]
+
+    data["station"] = {"name": cells_text_array[0]}
+    for i in range(1, len(cells_text_array)):
+        cleaned = re.sub(r'[^a-zA-Z0-9.čžšČŽŠ\-\s]','',cells_text_array[i]).strip()
+        if (not cleaned or cleaned == '-'):
+            continue
+        elif (types[i] == Type.FLOAT):
+            cleaned = float(cleaned.replace('−', '-'))
+        elif (types[i] == Type.INT):
+            cleaned = int(cleaned)
+        data[topics[i - 1]] = cleaned
+    data[topics[-1]] = datetime.datetime.fromtimestamp(time.time(), datetime.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return data
+
+def synthetic_table(rows, seed=0):
+    generator = random.Random(seed)
+    directions = ["N", "NE", "E", "SE", "S", "SW", "W", "NW", "-"]
+    states = ["vedro", "pretežno oblačno", "kiša", "snijeg", "magla"]
+    return [[f"Postaja {i}",
+             generator.choice(directions),
+             f"{generator.uniform(0, 20):.1f}",
+             f"{generator.uniform(-15, 38):.1f}",
+             str(generator.randint(10, 100)),
+             f"{generator.uniform(980, 1040):.1f}*",
+             f"{generator.uniform(-3, 3):+.1f}",
+             generator.choice(states)]
+            for i in range(rows)]
+
+def measure(label, function, rows):
+    start = time.perf_counter()
+    function(rows)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{len(rows) / elapsed:>14,.0f} rows/s")
+    return elapsed
+
+def main():
+    rows = synthetic_table(ROWS)
+    print(f"Parsing synthetic table with {ROWS} rows")
+    before = measure("legacy format_sending_data", lambda r: [legacy_format_sending_data(c) for c in r], rows)
+    after = measure("parse_rows", parse_rows, rows)
+    measure("parse_rows (columnar)", lambda r: parse_rows(r, columnar=True), rows)
+    print(f"Speedup: {before / after:.1f}x")
+
+if __name__ == '__main__':
+    main()
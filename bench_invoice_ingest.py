@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import uuid
+
+import invoice_ingest
+from invoice_ingest import IngestLedger, InvoiceIndex, ingest
+
+INVOICES = 2000
+#simulated round trip of one request to eywa
+LATENCY = 0.02
+#every FAILURE_RATE-th request fails, to exercise retries
+FAILURE_RATE = 200
+#share of invoices that change when the folder is processed by OCR again
+CHANGED_RATE = 20
+
+def invoice(generator, number, extraction_timestamp="2024-05-01T10:00:00"):
+    return {
+        "document_type": "invoice",
+        "extraction_timestamp": extraction_timestamp,
+        "source_format": "pdf",
+        "source_file": f"invoice_{number}.pdf",
+        "invoice_details": {"invoice_number": f"INV-{number:06}", "invoice_date": "2024-04-30", "currency": "EUR"},
+        "vendor": {"name": f"Vendor {number % 37}", "tax_id": f"HR{number % 37:011}"},
+        "customer": {"name": f"Customer {number % 101}"},
+        "line_items": [{"line_number": n, "description": f"Item {n}", "quantity": generator.randint(1, 9),
+                        "unit_price": round(generator.random() * 100, 2)} for n in range(1, generator.randint(2, 12))],
+        "totals": {"subtotal": 100.0, "total": 125.0,
+                   "tax_breakdown": [{"rate": 25, "amount": 25.0}]},
+        "metadata": {"confidence_score": 0.97, "extracted_text_sample": "INVOICE",
+                     "processing_notes": ["ocr", "table detected"], "warnings": []},
+    }
+
+class GraphQLStub:
+    """
+    Answers stackInvoiceDetailsList and aliased stackInvoiceDetails mutations after LATENCY.
+    """
+    def __init__(self):
+        self.requests = 0
+
+    async def __call__(self, query, variables=None):
+        self.requests += 1
+        await asyncio.sleep(LATENCY)
+        if self.requests % FAILURE_RATE == 0:
+            return {"errors": [{"message": "stub failure"}]}
+        if "stackInvoiceDetailsList" in query:
+            return {"data": {"stackInvoiceDetailsList": [{"euuid": str(uuid.uuid4())} for _ in variables["data"]]}}
+        return {"data": {f"i{name[1:]}": {"euuid": str(uuid.uuid4())} for name in variables}}
+
+def write_invoices(input_dir, extraction_timestamp="2024-05-01T10:00:00", changed_rate=0):
+    generator = random.Random(0)
+    for number in range(INVOICES):
+        #invoices arrive in nested folders
+        directory = os.path.join(input_dir, f"batch_{number // 500}")
+        os.makedirs(directory, exist_ok=True)
+        data = invoice(generator, number, extraction_timestamp)
+        if changed_rate and number % changed_rate == 0:
+            data["totals"]["total"] += 1
+        with open(os.path.join(directory, f"invoice_{number}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+def run(input_dir, **options):
+    directory = tempfile.mkdtemp()
+    ledger = IngestLedger(os.path.join(directory, "ledger.sqlite"))
+    index = InvoiceIndex(os.path.join(directory, "index.sqlite"))
+    stub = GraphQLStub()
+    stats = asyncio.run(ingest(input_dir, stub, retries=3, backoff=0.01, ledger=ledger, index=index, **options))
+    rerun = asyncio.run(ingest(input_dir, stub, ledger=ledger, index=index, **options))
+    #same folder after OCR ran again: every file is rewritten, few invoices really changed
+    write_invoices(input_dir, "2024-06-01T10:00:00", CHANGED_RATE)
+    requests = stub.requests
+    reprocessed = asyncio.run(ingest(input_dir, stub, retries=3, backoff=0.01, ledger=ledger, index=index, **options))
+    reprocessed["requests"] = stub.requests - requests
+    write_invoices(input_dir)
+    ledger.close()
+    index.close()
+    return stats, rerun, reprocessed
+
+def main():
+    input_dir = tempfile.mkdtemp()
+    write_invoices(input_dir)
+    print(f"{INVOICES} invoices, {LATENCY * 1000:.0f} ms per request, {os.cpu_count()} CPUs")
+    print(f"{'mode':<10}{'batch':>6}{'senders':>8}{'invoices/s':>12}{'requests':>10}{'rerun skipped':>15}"
+          f"{'reprocessed sent':>18}{'requests':>10}")
+    for mode, batch_size, concurrency in (("list", 1, 1), ("list", 25, 1), ("list", 25, 4), ("list", 100, 8),
+                                          ("aliased", 25, 4)):
+        stats, rerun, reprocessed = run(input_dir, mode=mode, batch_size=batch_size, concurrency=concurrency)
+        assert stats["sent"] + stats["failed"] == INVOICES
+        print(f"{mode:<10}{batch_size:>6}{concurrency:>8}{stats['invoices_per_second']:>12.1f}{stats['requests']:>10}"
+              f"{rerun['skipped']:>15}{reprocessed['sent']:>18}{reprocessed['requests']:>10}")
+
+if __name__ == '__main__':
+    invoice_ingest.ingest_max_backoff = 0.1
+    main()
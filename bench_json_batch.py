@@ -0,0 +1,35 @@
+import json
+import os
+import random
+import tempfile
+
+from json_difference_comparison import compare_directories
+
+PAIRS = 400
+INVOICES = 200
+
+def invoice_document(generator, changed):
+    return {f"invoice_{i}": {"line_items": [{"line_number": n, "amount": round(generator.random(), 2) if changed and n == 0 else n}
+                                            for n in range(5)],
+                             "vendor": {"name": f"Vendor {i % 97}"}}
+            for i in range(INVOICES)}
+
+def main():
+    reference_dir, comparison_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    generator = random.Random(0)
+    for i in range(PAIRS):
+        for directory, changed in ((reference_dir, False), (comparison_dir, i % 10 == 0)):
+            with open(os.path.join(directory, f"ocr_{i:05}.json"), "w", encoding="utf-8") as f:
+                json.dump(invoice_document(generator, changed), f)
+    print(f"{PAIRS} pairs, {os.cpu_count()} CPUs")
+    baseline = None
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        summary = compare_directories(reference_dir, comparison_dir, workers)["summary"]
+        baseline = baseline or summary["seconds"]
+        print(f"{workers:>3} workers{summary['seconds'] * 1000:>10.1f} ms{summary['pairs_per_second']:>10.1f} pairs/s"
+              f"{baseline / summary['seconds']:>8.2f}x")
+        workers *= 2
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import local_state
+
+from json_difference_comparison import (ADD_MACRO, DIFF_MACRO, MISS_MACRO, ReportSink, add_report, build_rules,
+                                        compare_files, compare_many, iter_differences, iter_file_differences,
+                                        write_to_json_file)
+from json_diff_sinks import JsonLinesSink, MsgpackSink, SummarySink, emit
+from json_merkle import file_hashes, subtree_hashes
+
+WIDE_KEYS = 200_000
+CANDIDATES = 4
+IGNORED_KEYS = build_rules().ignored_keys()
+DEEP_DEPTH = 5_000
+
+def legacy_compare_json_files(reference_value, comparison_value, path, diffs):
+    #recursive compare_json_files as it was before iter_differences, kept here as baseline
+    if isinstance(reference_value, dict) and isinstance(comparison_value, dict):
+        all_keys = set(reference_value.keys()) | set(comparison_value.keys())
+        for combined_key in all_keys:
+            if combined_key == "extraction_timestamp":
+                continue
+            ref_value = reference_value.get(combined_key, None)
+            comp_value = comparison_value.get(combined_key, None)
+            if combined_key not in reference_value:
+                diffs.get(ADD_MACRO).append(f"{path}{'.' if path else ''}{combined_key}")
+            if combined_key not in comparison_value:
+                diffs.get(MISS_MACRO).append(f"{path}{'.' if path else ''}{combined_key}")
+            if combined_key in reference_value and combined_key in comparison_value:
+                new_path = f"{path}{'.' if path != '' else ''}{combined_key}"
+                legacy_compare_json_files(ref_value, comp_value, new_path, diffs)
+    elif isinstance(reference_value, list) and isinstance(comparison_value, list):
+        for i in range(len(reference_value)):
+            legacy_compare_json_files(reference_value[i], comparison_value[i], f"{path}[{i + 1}]", diffs)
+    elif reference_value != comparison_value:
+        diffs.get(DIFF_MACRO).append({path: {"original": reference_value, "new": comparison_value}})
+
+def wide_document(seed):
+    generator = random.Random(seed)
+    return {f"invoice_{i}": {"line_items": [{"line_number": n, "amount": round(generator.random(), 2) if seed and i % 1000 == 0 else n}
+                                            for n in range(3)],
+                             "vendor": {"name": f"Vendor {i % 97}"}}
+            for i in range(WIDE_KEYS // 5)}
+
+def deep_text(depth, leaf):
+    #json.dumps can't write documents nested this deep, so text is built directly
+    return '{"child": ' * depth + json.dumps(leaf) + '}' * depth
+
+def empty_diffs():
+    return {ADD_MACRO: [], MISS_MACRO: [], DIFF_MACRO: []}
+
+def measure(label, function):
+    #"in memory" runs get already loaded documents, their peak doesn't include parsing
+    start = time.perf_counter()
+    try:
+        function()
+    except RecursionError:
+        print(f"{label:<36}RecursionError")
+        return
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<36}{elapsed * 1000:>10.1f} ms{peak / 2 ** 20:>10.1f} MiB peak")
+
+def legacy(reference, comparison):
+    legacy_compare_json_files(reference, comparison, "", empty_diffs())
+
+def iterative(reference, comparison):
+    add_report(iter_differences(reference, comparison), empty_diffs())
+
+def loaded(reference_path, comparison_path):
+    with open(reference_path, encoding="utf-8") as reference, open(comparison_path, encoding="utf-8") as comparison:
+        iterative(json.load(reference), json.load(comparison))
+
+def streaming(reference_path, comparison_path):
+    add_report(iter_file_differences(reference_path, comparison_path), empty_diffs())
+
+def near_identical(document, changes):
+    #copy of document with a few leaves changed
+    copy = json.loads(json.dumps(document))
+    keys = list(copy)
+    for i in range(changes):
+        copy[keys[i * len(keys) // changes]]["line_items"][1]["amount"] = -1
+    return copy
+
+def hashed(reference_path, comparison_path, reference, comparison):
+    hashes = (file_hashes(reference_path, reference, IGNORED_KEYS), file_hashes(comparison_path, comparison, IGNORED_KEYS))
+    add_report(iter_differences(reference, comparison, hashes=hashes), empty_diffs())
+
+def every_leaf_changed(document):
+    return {key: {"line_items": [{"line_number": item["line_number"], "amount": -1} for item in invoice["line_items"]],
+                  "vendor": {"name": invoice["vendor"]["name"] + "!"}}
+            for key, invoice in document.items()}
+
+def report(reference, comparison, directory):
+    sink = ReportSink()
+    emit(iter_differences(reference, comparison), sink)
+    write_to_json_file(sink.diffs, directory, "difference.json")
+
+def to_sink(reference, comparison, sink):
+    with sink:
+        emit(iter_differences(reference, comparison), sink)
+
+def main():
+    directory = tempfile.mkdtemp()
+    local_state.STATE_DIR = directory
+    reference, comparison = wide_document(0), wide_document(1)
+    paths = {}
+    for name, document in (("wide_reference", reference), ("wide_comparison", comparison)):
+        paths[name] = os.path.join(directory, f"{name}.json")
+        with open(paths[name], "w", encoding="utf-8") as f:
+            json.dump(document, f)
+    print(f"Wide documents: {WIDE_KEYS // 5} invoices, {os.path.getsize(paths['wide_reference']) / 2 ** 20:.1f} MiB each")
+    measure("recursive (in memory)", lambda: legacy(reference, comparison))
+    measure("iterative (in memory)", lambda: iterative(reference, comparison))
+    measure("json.load + iterative", lambda: loaded(paths["wide_reference"], paths["wide_comparison"]))
+    measure("iterative (streamed from files)", lambda: streaming(paths["wide_reference"], paths["wide_comparison"]))
+
+    comparison = near_identical(reference, 10)
+    paths["near_comparison"] = os.path.join(directory, "near_comparison.json")
+    with open(paths["near_comparison"], "w", encoding="utf-8") as f:
+        json.dump(comparison, f)
+    print("Near identical documents: 10 changed invoices")
+    measure("iterative (in memory)", lambda: iterative(reference, comparison))
+    measure("hashing both (no cache)", lambda: (subtree_hashes(reference, IGNORED_KEYS), subtree_hashes(comparison, IGNORED_KEYS)))
+    #first call fills the cache, measured runs use cached digests
+    hashed(paths["wide_reference"], paths["near_comparison"], reference, comparison)
+    measure("hash short-circuit (cached)", lambda: hashed(paths["wide_reference"], paths["near_comparison"], reference, comparison))
+    hashes = (subtree_hashes(reference, IGNORED_KEYS), subtree_hashes(comparison, IGNORED_KEYS))
+    measure("hash short-circuit (only walk)", lambda: add_report(iter_differences(reference, comparison, hashes=hashes), empty_diffs()))
+    #same invoices one level deeper, in a list
+    nested_reference = {"export": {"invoices": list(reference.values())}}
+    nested_comparison = {"export": {"invoices": list(comparison.values())}}
+    hashes = (subtree_hashes(nested_reference, IGNORED_KEYS), subtree_hashes(nested_comparison, IGNORED_KEYS))
+    print("Near identical nested documents: 10 changed invoices in export.invoices")
+    measure("iterative (in memory)", lambda: iterative(nested_reference, nested_comparison))
+    measure("hash short-circuit (only walk)",
+            lambda: add_report(iter_differences(nested_reference, nested_comparison, hashes=hashes), empty_diffs()))
+
+    comparison = every_leaf_changed(reference)
+    print(f"Many differences: {len(list(iter_differences(reference, comparison)))} differences")
+    measure("report (difference.json)", lambda: report(reference, comparison, directory))
+    measure("jsonl sink", lambda: to_sink(reference, comparison, JsonLinesSink(os.path.join(directory, "d.jsonl"))))
+    measure("msgpack sink", lambda: to_sink(reference, comparison, MsgpackSink(os.path.join(directory, "d.msgpack"))))
+    measure("summary sink", lambda: to_sink(reference, comparison, SummarySink()))
+
+    candidate_paths = []
+    for i in range(CANDIDATES):
+        candidate_paths.append(os.path.join(directory, f"candidate_{i}.json"))
+        with open(candidate_paths[-1], "w", encoding="utf-8") as f:
+            json.dump(near_identical(reference, 10 * (i + 1)), f)
+    print(f"N-way: {CANDIDATES} candidates compared with one reference")
+    rules = build_rules()
+    measure("pair by pair (compare_files)", lambda: [compare_files(paths["wide_reference"], path, rules) for path in candidate_paths])
+    measure("one pass (compare_many)", lambda: compare_many(paths["wide_reference"], candidate_paths, rules))
+
+    for name, leaf in (("deep_reference", 1), ("deep_comparison", 2)):
+        paths[name] = os.path.join(directory, f"{name}.json")
+        with open(paths[name], "w", encoding="utf-8") as f:
+            f.write(deep_text(DEEP_DEPTH, leaf))
+    #only loading needs higher limit, comparison runs with the default one
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(DEEP_DEPTH * 4)
+    with open(paths["deep_reference"]) as f:
+        reference = json.load(f)
+    with open(paths["deep_comparison"]) as f:
+        comparison = json.load(f)
+    sys.setrecursionlimit(limit)
+    print(f"Deep documents: nesting depth {DEEP_DEPTH}")
+    measure("recursive (in memory)", lambda: legacy(reference, comparison))
+    measure("iterative (in memory)", lambda: iterative(reference, comparison))
+    measure("iterative (streamed from files)", lambda: streaming(paths["deep_reference"], paths["deep_comparison"]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import copy
+import json
+import time
+import tracemalloc
+import uuid
+
+from transit_model import decode
+
+MODEL_FILE = "Neyho_DHMZ_Test_1_2_1.json"
+ENTITY_COPIES = 2000
+ERD_ENTITY = "~#neyho.eywa.dataset.core.ERDEntity"
+ERD_ATTRIBUTE = "~#neyho.eywa.dataset.core.ERDEntityAttribute"
+
+def enlarged_model(copies):
+    """
+    Dataset export with entities of the real model copied under new euuids and names.
+    """
+    with open(MODEL_FILE, 'r', encoding='utf-8') as f:
+        version = json.load(f)
+    model = version["~:model"]["~#neyho.eywa.dataset.core.ERDModel"]
+    originals = list(model["~:entities"].values())
+    entities = {}
+    for i in range(copies):
+        for original in originals:
+            entity = copy.deepcopy(original)
+            body = entity[ERD_ENTITY]
+            euuid = f"~u{uuid.uuid4()}"
+            body["~:euuid"] = euuid
+            body["~:name"] = f"{body['~:name']} {i}"
+            for attribute in body["~:attributes"]:
+                attribute[ERD_ATTRIBUTE]["~:euuid"] = f"~u{uuid.uuid4()}"
+            entities[euuid] = entity
+    model["~:entities"] = entities
+    return json.dumps(version, indent=2)
+
+def generic_index(text):
+    #baseline: decode whole export into generic tree, then walk it
+    version = json.loads(text)
+    model = version["~:model"]["~#neyho.eywa.dataset.core.ERDModel"]
+    index = {}
+    for key, entity in model["~:entities"].items():
+        body = entity[ERD_ENTITY]
+        index[body["~:name"]] = {a[ERD_ATTRIBUTE]["~:name"]: a[ERD_ATTRIBUTE]["~:type"] for a in body["~:attributes"]}
+    return version, index
+
+def measure(label, function, text):
+    #timed without tracemalloc, it slows down python level hooks a lot more than C decoding
+    start = time.perf_counter()
+    result = function(text)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<24}{elapsed * 1000:>10.1f} ms{peak / 2 ** 20:>10.1f} MiB peak")
+    return result
+
+def main():
+    text = enlarged_model(ENTITY_COPIES)
+    print(f"Synthetic export: {len(text) / 2 ** 20:.1f} MiB, {ENTITY_COPIES * 2} entities")
+    measure("json.loads + walk", generic_index, text)
+    index = measure("transit_model.decode", decode, text)
+    print(f"Indexed {len(index.entities)} entities, {len(index.attributes)} attributes")
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ import os
 import eywa
 import asyncio
 
+from transform_spec import Rename, WrapEach, compile_spec
+
 sys.path.insert(1, r"C:\Users\Marko\Desktop\Neyho\Neyho_TEST")
 if os.name == 'posix':  # (macOS, Linux)
     sys.path.insert(1, os.path.join("..", ".."))
@@ -30,70 +32,37 @@ def get_input(input_dir, input_file):
     except:
         print(f'Failed to read {input_file} from {input_dir}.')
 
-def format_ocr_doc_to_obj(input_obj):
-    return {
-        'document_type' : input_obj.get('document_type'),
-        'extraction_timestamp' : input_obj.get('extraction_timestamp'),
-        'source_format': input_obj.get('source_format'),
-        'source_file': input_obj.get('source_file')
-    }
+#InvoiceDetailsInput built from OCR invoice json: target field -> source path (see transform_spec)
+INVOICE_SPEC = {
+    'invoice_number': 'invoice_details.invoice_number',
+    'invoice_date': 'invoice_details.invoice_date',
+    'due_date': 'invoice_details.due_date',
+    'order_number': 'invoice_details.order_number',
+    'order_date': 'invoice_details.order_date',
+    'delivery_date': 'invoice_details.delivery_date',
+    'payment_terms': 'invoice_details.payment_terms',
+    'currency': 'invoice_details.currency',
+    'document': {
+        'document_type': 'document_type',
+        'extraction_timestamp': 'extraction_timestamp',
+        'source_format': 'source_format',
+        'source_file': 'source_file',
+        'vendor': 'vendor',
+        'customer': 'customer',
+    },
+    'line_items': 'line_items',
+    'totals': Rename('totals', {'tax_breakdown': 'tax_breakdowns'}),
+    'metadata': {
+        'confidence_score': 'metadata.confidence_score',
+        'extracted_text_sample': 'metadata.extracted_text_sample',
+        'processing_notes': WrapEach('metadata.processing_notes', 'note'),
+        'warnings': WrapEach('metadata.warnings', 'warning'),
+    },
+}
+
+#input json is not modified
+construct_sending_data_obj = compile_spec(INVOICE_SPEC, "construct_sending_data_obj")
 
-def extract_data_from_metadata(metadata_obj):
-    return {
-        'confidence_score': metadata_obj.get('confidence_score'),
-        'extracted_text_sample': metadata_obj.get('extracted_text_sample')
-    }
-
-def get_document_data_through_relation(input_obj):
-    result = format_ocr_doc_to_obj(input_obj)
-    vendor_data_input = input_obj.get('vendor')
-    customer_data_input = input_obj.get('customer')
-    result['vendor'] = vendor_data_input
-    result['customer'] = customer_data_input
-    return result
-
-def get_totals_data_through_relation(input_obj):
-    totals = input_obj.get('totals')
-    tax_breakdown = totals.get('tax_breakdown')
-    if 'tax_breakdown' in totals:
-        del totals['tax_breakdown']
-    totals['tax_breakdowns'] = tax_breakdown
-    # print(f"{tax_breakdown=}")
-    return totals
-
-def format_string_list_to_obj_list(string_list, attribute_name):
-    result = []
-    for string in string_list:
-        result.append({f'{attribute_name}' : string})
-    return result
-
-def get_metadata_through_relation(input_obj):
-    temp_metadata = input_obj.get('metadata')
-    metadata_input = extract_data_from_metadata(temp_metadata)
-    metadata_input['processing_notes'] = format_string_list_to_obj_list(temp_metadata.get('processing_notes'), 'note')
-    metadata_input['warnings'] = format_string_list_to_obj_list(temp_metadata.get('warnings'), 'warning')
-    return metadata_input
-
-def construct_sending_data_obj(input_obj):
-    invoice_details = input_obj.get('invoice_details', {})
-    # print(f"{invoice_details=}")
-    line_items = input_obj.get('line_items')
-
-    # print(f"{input_obj.get('totals').get('tax_breakdown')}")
-    return {
-        'invoice_number': invoice_details.get('invoice_number'),
-        'invoice_date': invoice_details.get('invoice_date'),
-        'due_date': invoice_details.get('due_date'),
-        'order_number': invoice_details.get('order_number'),
-        'order_date': invoice_details.get('order_date'),
-        'delivery_date': invoice_details.get('delivery_date'),
-        'payment_terms': invoice_details.get('payment_terms'),
-        'currency': invoice_details.get('currency'),
-        'document': get_document_data_through_relation(input_obj),
-        'line_items': line_items,
-        'totals': get_totals_data_through_relation(input_obj),
-        'metadata': get_metadata_through_relation(input_obj)
-    }
 async def send_data_to_db(data_obj):
     print("SENDING")
     return await eywa.graphql("""
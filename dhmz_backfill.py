@@ -0,0 +1,151 @@
+import asyncio
+import datetime
+import time
+
+from dhmz_html import croatian_time, fetch_page, parse_station_page
+from dhmz_rows import parse_rows, scrape_timestamp
+
+#page with station table for one past hour, formatted with observation datetime as {time}
+#(Croatian local time, same as the page). Page is only imported if the hour written on it is
+#the requested one, so a wrong template fails pages instead of importing other hours' data
+HISTORY_URL_TEMPLATE = "https://meteo.hr/naslovnica_aktpod.php?tab=aktpod&datum={time:%d.%m.%Y}&sat={time:%H}"
+
+backfill_concurrency = 4
+#maximum page requests started per second, meteo.hr shouldn't be hammered
+backfill_rate = 2.0
+backfill_batch_size = 500
+
+class RateLimiter:
+    """
+    Spaces out starts of requests so that at most rate of them start per second.
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+def backfill_hours(start, end):
+    """
+    Yields every full hour (UTC) from start up to and including end. When clocks go back
+    two hours have the same local time (and page), only the first of them is yielded.
+    """
+    current = start.replace(minute=0, second=0, microsecond=0)
+    if current.tzinfo is None:
+        current = current.replace(tzinfo=datetime.UTC)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=datetime.UTC)
+    previous = None
+    while current <= end:
+        local = croatian_time(current)
+        if local != previous:
+            yield current
+        previous = local
+        current += datetime.timedelta(hours=1)
+
+async def backfill(start, end, import_function, url_template=HISTORY_URL_TEMPLATE,
+                   concurrency=None, rate=None, batch_size=None, fetch=fetch_page, validate=None):
+    """
+    Fetches station table for every hour between start and end and imports parsed measurements.
+
+    Pages are fetched by concurrency workers (blocking fetch runs in threads) under a rate limit.
+    Parsed measurements go through a bounded queue to a single importer that calls
+    import_function with at most batch_size measurements, so at most a few batches are
+    held in memory no matter how long the range is.
+
+    Page is imported only if it shows the requested hour. Page that fails to fetch or parse,
+    or shows another hour, is listed in failed_pages/mismatched_pages and the rest carry on.
+    Parsed measurements of every page go through validate (e.g. main.validate_measurements)
+    if it's passed, so a bad cell drops its row instead of getting the whole batch rejected.
+
+    Returns:
+      Dictionary with number of fetched/failed pages, imported measurements and pages per second.
+    """
+    concurrency = concurrency or backfill_concurrency
+    batch_size = batch_size or backfill_batch_size
+    limiter = RateLimiter(backfill_rate if rate is None else rate)
+    hours = asyncio.Queue()
+    for hour in backfill_hours(start, end):
+        hours.put_nowait(hour)
+    measurements = asyncio.Queue(maxsize=2 * batch_size)
+    stats = {"pages": 0, "failed_pages": [], "mismatched_pages": [], "measurements": 0, "rejected": 0,
+             "batches": 0, "failed_batches": 0}
+    started = time.perf_counter()
+
+    async def fetch_worker():
+        while True:
+            try:
+                hour = hours.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            local_hour = croatian_time(hour)
+            url = url_template.format(time=local_hour)
+            await limiter.wait()
+            try:
+                html = await asyncio.to_thread(fetch, url)
+                rows, observed_hour = parse_station_page(html)
+                if rows is None:
+                    raise ValueError("station table not found")
+                if observed_hour != local_hour:
+                    print(f"Page {url} shows hour {observed_hour}, expected {local_hour}, skipping it")
+                    stats["mismatched_pages"].append(url)
+                    continue
+                parsed = parse_rows(rows, scrape_timestamp(hour.timestamp()))
+                if validate is not None:
+                    valid = validate(parsed)
+                    stats["rejected"] += len(parsed) - len(valid)
+                    parsed = valid
+            except Exception as e:
+                print(f"Failed to fetch {url}: {e}")
+                stats["failed_pages"].append(url)
+                continue
+            stats["pages"] += 1
+            for data in parsed:
+                await measurements.put(data)
+
+    async def send(batch):
+        try:
+            response = await import_function(batch)
+            errors = (response or {}).get("errors") if isinstance(response, dict) else None
+            if errors:
+                raise RuntimeError(errors)
+            stats["measurements"] += len(batch)
+        except Exception as e:
+            stats["failed_batches"] += 1
+            print(f"Failed to import batch of {len(batch)} measurements: {e}")
+        stats["batches"] += 1
+
+    async def importer():
+        batch = []
+        while True:
+            data = await measurements.get()
+            if data is None:
+                break
+            batch.append(data)
+            if len(batch) >= batch_size:
+                await send(batch)
+                batch = []
+        if batch:
+            await send(batch)
+
+    importer_task = asyncio.create_task(importer())
+    try:
+        await asyncio.gather(*(fetch_worker() for _ in range(concurrency)))
+    finally:
+        await measurements.put(None)
+        await importer_task
+
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = elapsed
+    stats["pages_per_second"] = stats["pages"] / elapsed if elapsed else 0.0
+    print(f"Backfilled {stats['pages']} pages ({len(stats['failed_pages'])} failed, "
+          f"{len(stats['mismatched_pages'])} for another hour), "
+          f"{stats['measurements']} measurements ({stats['rejected']} rejected) in {elapsed:.2f} s, {stats['pages_per_second']:.1f} pages/s")
+    return stats
@@ -0,0 +1,149 @@
+import datetime
+import re
+import urllib.request
+from html.parser import HTMLParser
+
+STATION_TABLE_CLASS = "table--aktualni-podaci"
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) Neyho_TEST"
+HTTP_TIMEOUT = 10
+#observation date and hour in page text, e.g. "18.10.2026. u 16 h" or "18.10.2026. 16:00" (Croatian local time)
+DATE_PATTERN = r"(?P<day>\d{1,2})\.\s*(?P<month>\d{1,2})\.\s*(?P<year>\d{4})\.?"
+HOUR_PATTERN = r"(?P<hour>\d{1,2})(?:[:.]00\b|\s*h\b|\s*sati\b)"
+OBSERVED_HOUR_PATTERNS = (
+    re.compile(DATE_PATTERN + r"\D{0,20}?" + HOUR_PATTERN),
+    re.compile(HOUR_PATTERN + r"\D{0,20}?" + DATE_PATTERN),
+)
+
+class StationTableParser(HTMLParser):
+    """
+    Collects text of every <td> inside <tbody> of the DHMZ station table in one pass
+    over the document. Text inside <sup> tags is dropped, same as the script that
+    main.py injects into the browser. Text outside the table is kept in before_table
+    and after_table (observation hour is read from it).
+    """
+    def __init__(self, table_class=STATION_TABLE_CLASS):
+        super().__init__(convert_charrefs=True)
+        self.table_class = table_class
+        self.found = False
+        self.rows = []
+        self._table_depth = 0
+        self._in_tbody = False
+        self._row = None
+        self._cell = None
+        self._sup_depth = 0
+        self.before_table = []
+        self.after_table = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            if self._table_depth:
+                self._table_depth += 1
+            elif self.table_class in (dict(attrs).get("class") or "").split():
+                self.found = True
+                self._table_depth = 1
+            return
+        #nested tables are skipped, only direct content of station table is wanted
+        if self._table_depth != 1:
+            return
+        if tag == "tbody":
+            self._in_tbody = True
+        elif not self._in_tbody:
+            return
+        elif tag == "tr":
+            self._row = []
+        elif tag == "td" and self._row is not None:
+            self._cell = []
+        elif tag == "sup" and self._cell is not None:
+            self._sup_depth += 1
+
+    def handle_endtag(self, tag):
+        if not self._table_depth:
+            return
+        if tag == "table":
+            self._table_depth -= 1
+            return
+        if self._table_depth != 1:
+            return
+        if tag == "tbody":
+            self._in_tbody = False
+        elif tag == "sup" and self._sup_depth:
+            self._sup_depth -= 1
+        elif tag == "td" and self._cell is not None:
+            self._row.append("".join(self._cell).strip())
+            self._cell = None
+            self._sup_depth = 0
+        elif tag == "tr" and self._row is not None:
+            if self._row:
+                self.rows.append(self._row)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None and not self._sup_depth:
+            self._cell.append(data)
+        elif not self._table_depth:
+            (self.after_table if self.found else self.before_table).append(data)
+
+def parse_observed_hour(text):
+    """
+    Returns observation hour (naive datetime, Croatian local time) found in page text, or None.
+    """
+    for pattern in OBSERVED_HOUR_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                return datetime.datetime(int(match["year"]), int(match["month"]), int(match["day"]), int(match["hour"]))
+            except ValueError:
+                continue
+    return None
+
+def croatian_time(moment):
+    """
+    Converts aware datetime to naive local time of Croatia (CET, CEST from the last Sunday of March
+    to the last Sunday of October, switching at 01:00 UTC), the time DHMZ pages are written in.
+    """
+    moment = moment.astimezone(datetime.UTC)
+    def last_sunday(month):
+        day = datetime.datetime(moment.year, month, 31, 1, tzinfo=datetime.UTC)
+        return day - datetime.timedelta(days=(day.weekday() + 1) % 7)
+    offset = 2 if last_sunday(3) <= moment < last_sunday(10) else 1
+    return (moment + datetime.timedelta(hours=offset)).replace(tzinfo=None)
+
+def parse_station_page(html, table_class=STATION_TABLE_CLASS):
+    """
+    Returns tuple (list of rows (list of cell texts) from station table in html or None if the table
+    is not present in the document, observation hour or None if page doesn't say which hour it is).
+    Hour is looked for in text before the table (headings) first.
+    """
+    parser = StationTableParser(table_class)
+    parser.feed(html)
+    parser.close()
+    observed_hour = parse_observed_hour(" ".join(parser.before_table)) or parse_observed_hour(" ".join(parser.after_table))
+    return (parser.rows if parser.found else None), observed_hour
+
+def parse_station_rows(html, table_class=STATION_TABLE_CLASS):
+    """
+    Returns list of rows (list of cell texts) from station table in html,
+    or None if the table is not present in the document.
+    """
+    return parse_station_page(html, table_class)[0]
+
+def fetch_page(link, timeout=HTTP_TIMEOUT):
+    request = urllib.request.Request(link, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        charset = response.headers.get_content_charset() or "utf-8"
+        return response.read().decode(charset, errors="replace")
+
+def fetch_station_page(link, timeout=HTTP_TIMEOUT):
+    """
+    Fetches link over plain HTTP and parses station table and observation hour out of it
+    (see parse_station_page). Rows are None if the page couldn't be fetched or doesn't contain
+    the table (e.g. the table is rendered by javascript), so caller can fall back to selenium.
+    """
+    try:
+        html = fetch_page(link, timeout)
+    except (OSError, ValueError) as e:
+        print(f"Failed to fetch {link}: {e}")
+        return None, None
+    return parse_station_page(html)
+
+def fetch_station_rows(link, timeout=HTTP_TIMEOUT):
+    return fetch_station_page(link, timeout)[0]
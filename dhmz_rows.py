@@ -0,0 +1,97 @@
+import datetime
+import re
+import time
+from collections import namedtuple
+from enum import Enum
+
+class Type(Enum):
+    INT = 0
+    FLOAT = 1
+    STRING = 2
+
+#leaves letters, digits, dot, minus and whitespace, everything else in a cell is noise (units, arrows...)
+CLEAN_PATTERN = re.compile(r'[^a-zA-Z0-9.čžšČŽŠ\-\s]')
+#DHMZ writes negative values with unicode minus sign which the cleaner would remove
+MINUS_SIGN_TABLE = str.maketrans({'−': '-'})
+
+Column = namedtuple("Column", ["name", "type", "convert"])
+
+CONVERTERS = {
+    Type.INT: int,
+    Type.FLOAT: float,
+    Type.STRING: None,
+}
+
+def column(name, column_type):
+    return Column(name, column_type, CONVERTERS[column_type])
+
+#cells of station table after the first one (station name), in order
+MEASUREMENT_COLUMNS = (
+    column("wind_direction", Type.STRING),
+    column("wind_velocity", Type.FLOAT),
+    column("air_temperature", Type.FLOAT),
+    column("relative_moisture", Type.INT),
+    column("air_pressure", Type.FLOAT),
+    column("air_tendency", Type.FLOAT),
+    column("weather_state", Type.STRING),
+)
+STATION_TOPIC = "station"
+TIME_TOPIC = "time"
+
+def scrape_timestamp(timestamp=None):
+    """
+    Time of scrape formatted the way Measurement.time expects it, one per batch of rows.
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    return datetime.datetime.fromtimestamp(timestamp, datetime.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def convert(spec, cleaned):
+    """
+    Converts cleaned cell text to column type. Text that doesn't convert (e.g. "70.5" in INT column)
+    is returned as it is, so the row is rejected by validation with a reason instead of one
+    cell failing the whole batch.
+    """
+    try:
+        return spec.convert(cleaned)
+    except ValueError:
+        return cleaned
+
+def parse_row(cells_text_array, timestamp, columns=MEASUREMENT_COLUMNS):
+    data = {STATION_TOPIC: {"name": cells_text_array[0]}}
+    for spec, text in zip(columns, cells_text_array[1:]):
+        cleaned = CLEAN_PATTERN.sub('', text.translate(MINUS_SIGN_TABLE)).strip()
+        if not cleaned or cleaned == '-':
+            continue
+        data[spec.name] = convert(spec, cleaned) if spec.convert else cleaned
+    data[TIME_TOPIC] = timestamp
+    return data
+
+def parse_rows(rows, timestamp=None, columnar=False, columns=MEASUREMENT_COLUMNS):
+    """
+    Parses rows of station table cell texts. All rows get the same time.
+
+    Returns:
+      List of MeasurementInput dicts, or if columnar is True dict of lists (one per topic,
+      None where cell was empty) with station names under "station".
+    """
+    timestamp = scrape_timestamp() if timestamp is None else timestamp
+    if not columnar:
+        return [parse_row(cells, timestamp, columns) for cells in rows]
+
+    result = {STATION_TOPIC: [cells[0] for cells in rows]}
+    clean = CLEAN_PATTERN.sub
+    for index, spec in enumerate(columns, start=1):
+        values = []
+        for cells in rows:
+            cleaned = clean('', cells[index].translate(MINUS_SIGN_TABLE)).strip() if index < len(cells) else ''
+            if not cleaned or cleaned == '-':
+                values.append(None)
+            else:
+                values.append(convert(spec, cleaned) if spec.convert else cleaned)
+        result[spec.name] = values
+    result[TIME_TOPIC] = [timestamp] * len(rows)
+    return result
+
+def format_sending_data(cells_text_array, timestamp=None):
+    return parse_row(cells_text_array, scrape_timestamp() if timestamp is None else timestamp)
@@ -0,0 +1,133 @@
+import contextlib
+import functools
+import threading
+
+@functools.cache
+def chrome_driver_path():
+    """
+    Resolves ChromeDriver binary once per process, ChromeDriverManager().install()
+    does version lookup (and possibly download) on every call.
+    """
+    #imported here so the pool can be used with other factories without webdriver_manager installed
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+class DriverPool:
+    """
+    Small pool of reusable WebDriver sessions.
+
+    Args:
+      factory: Callable without arguments that returns new driver (e.g. main.setup_driver).
+      size: Maximum number of sessions that exist at the same time.
+      max_uses: Session is quit and replaced after it was handed out this many times.
+    """
+    def __init__(self, factory, size=1, max_uses=50):
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.created = 0
+        self.recycled = 0
+        self.in_use = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._available = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def warm(self, count=None):
+        """
+        Starts sessions up front so first scrape doesn't pay browser start, until count sessions
+        (idle and handed out) exist. Every session is started under a slot of the pool, so warming
+        next to running scrapes never makes more than size sessions, and outside of the lock,
+        so handing out idle sessions doesn't wait for a browser to start.
+        """
+        count = self.size if count is None else min(count, self.size)
+        while True:
+            with self._lock:
+                if self._closed or len(self._idle) + self.in_use >= count:
+                    return
+            if not self._available.acquire(blocking=False):
+                #every slot is taken by sessions in use (or being started)
+                return
+            try:
+                self._release(self._create())
+            finally:
+                self._available.release()
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Hands out healthy driver and always returns it to the pool when the block exits.
+        """
+        self._available.acquire()
+        with self._lock:
+            self.in_use += 1
+        entry = None
+        try:
+            entry = self._checkout()
+            entry.uses += 1
+            yield entry.driver
+        finally:
+            if entry is not None:
+                self._release(entry)
+            with self._lock:
+                self.in_use -= 1
+            self._available.release()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._quit(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _create(self):
+        self.created += 1
+        return PooledDriver(self.factory())
+
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                return self._create()
+            if self._is_healthy(entry.driver):
+                return entry
+            #browser crashed or session expired while idle
+            self._quit(entry)
+
+    def _release(self, entry):
+        if entry.uses >= self.max_uses:
+            self._quit(entry)
+            return
+        with self._lock:
+            if not self._closed:
+                self._idle.append(entry)
+                return
+        self._quit(entry)
+
+    def _quit(self, entry):
+        self.recycled += 1
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            print(f"Failed to quit driver: {e}")
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            return driver.execute_script("return 1") == 1
+        except Exception:
+            return False
@@ -0,0 +1,145 @@
+import asyncio
+import bisect
+import contextlib
+import functools
+import json
+import os
+import time
+
+#upper bounds (seconds) of histogram buckets, from a cached lookup to a cold browser start
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def summary(self):
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "mean": self.sum / self.count if self.count else None}
+
+class Metrics:
+    """
+    Stage timings (spans), counters and histograms of one run or of the whole process.
+    """
+    def __init__(self, prefix="dhmz"):
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """
+        Times block as stage, time is recorded even if the block raises.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        """
+        Decorator version of span, works for regular and async functions.
+        """
+        def decorator(function):
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(stage):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def merge(self, other):
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for name, histogram in other.histograms.items():
+            self.histograms.setdefault(name, Histogram(histogram.buckets)).merge(histogram)
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def summary(self):
+        return {
+            "started": self.started,
+            "seconds": time.time() - self.started,
+            "stages": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            "counters": dict(self.counters),
+        }
+
+    def write_json(self, path):
+        write_atomically(path, json.dumps(self.summary(), indent=4, ensure_ascii=False))
+
+    def prometheus_text(self):
+        lines = []
+        if self.histograms:
+            name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Duration of scrape pipeline stages.")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        for counter, value in sorted(self.counters.items()):
+            name = f"{self.prefix}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes metrics in Prometheus text format (e.g. for node_exporter textfile collector).
+        """
+        write_atomically(path, self.prometheus_text())
+
+def write_atomically(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
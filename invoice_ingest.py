@@ -0,0 +1,462 @@
+import argparse
+import asyncio
+import collections
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import eywa
+
+import bobo_db
+from local_state import state_path
+
+#invoices per request, requests in flight, retries of failed request and backoff (seconds) between them
+ingest_batch_size = 25
+ingest_concurrency = 4
+ingest_retries = 3
+ingest_backoff = 1.0
+ingest_max_backoff = 30.0
+#"list": whole batch in one stackInvoiceDetailsList mutation (all or nothing),
+#"aliased": one aliased stackInvoiceDetails per invoice, so one bad invoice doesn't fail the rest
+ingest_mode = "list"
+#processes that read and transform input files, None => number of CPUs
+transform_workers = None
+LEDGER_FILE = "invoice_ledger.sqlite"
+#invoices already in eywa by (invoice_number, vendor), with hash of their content
+INDEX_FILE = "invoice_index.sqlite"
+#fields that change every time OCR runs again, left out of content hash so reprocessed
+#invoices that are otherwise the same aren't sent again
+dedup_ignored = ("document.extraction_timestamp", "document.source_file")
+
+LIST_MUTATION = """
+    mutation($data: [InvoiceDetailsInput])
+    {
+        stackInvoiceDetailsList(data: $data)
+        {
+            euuid
+        }
+    }
+    """
+
+@functools.lru_cache(maxsize=None)
+def aliased_mutation(size: int) -> str:
+    variables = ", ".join(f"$d{i}: InvoiceDetailsInput!" for i in range(size))
+    fields = "\n".join(f"        i{i}: stackInvoiceDetails(data: $d{i}) {{ euuid }}" for i in range(size))
+    return f"""
+    mutation({variables})
+    {{
+{fields}
+    }}
+    """
+
+class IngestLedger:
+    """
+    Per-file record of ingestion (sent, failed or invalid), kept in SQLite so reruns
+    skip files that were already sent and haven't changed since.
+    """
+    def __init__(self, path=None):
+        self.connection = sqlite3.connect(path or state_path(LEDGER_FILE))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                digest TEXT,
+                status TEXT NOT NULL,
+                euuid TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL
+            )""")
+        self.connection.commit()
+
+    def sent(self) -> dict:
+        """
+        Returns {path: (size, mtime_ns, digest)} of sent files.
+        """
+        return {path: (size, mtime_ns, digest) for path, size, mtime_ns, digest in
+                self.connection.execute("SELECT path, size, mtime_ns, digest FROM files WHERE status = 'sent'")}
+
+    def record(self, rows) -> None:
+        """
+        rows: Iterable of (path, size, mtime_ns, digest, status, euuid, error).
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO files (path, size, mtime_ns, digest, status, euuid, error, attempts, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    size = excluded.size, mtime_ns = excluded.mtime_ns, digest = excluded.digest,
+                    status = excluded.status, euuid = COALESCE(excluded.euuid, files.euuid),
+                    error = excluded.error, attempts = files.attempts + 1, updated = excluded.updated
+                """, [(*row, now) for row in rows])
+
+    def summary(self) -> dict:
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM files GROUP BY status"))
+
+    def close(self):
+        self.connection.close()
+
+class InvoiceIndex:
+    """
+    Invoices that were sent, by invoice_number and vendor, with hash of normalised content
+    (see invoice_key), kept in SQLite so reprocessed invoices are only sent when they changed.
+    """
+    def __init__(self, path=None):
+        self.connection = sqlite3.connect(path or state_path(INDEX_FILE))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS invoices (
+                invoice_number TEXT NOT NULL,
+                vendor TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                euuid TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (invoice_number, vendor)
+            )""")
+        self.connection.commit()
+
+    def lookup(self, keys) -> dict:
+        """
+        keys: Iterable of (invoice_number, vendor).
+
+        Returns:
+          {(invoice_number, vendor): (content_hash, euuid)} of keys that are in the index.
+        """
+        keys = set(keys)
+        numbers = list({number for number, vendor in keys})
+        found = {}
+        #older SQLite versions allow at most 999 parameters per query
+        for i in range(0, len(numbers), 500):
+            chunk = numbers[i:i + 500]
+            for number, vendor, content_hash, euuid in self.connection.execute(
+                    f"SELECT invoice_number, vendor, content_hash, euuid FROM invoices "
+                    f"WHERE invoice_number IN ({', '.join('?' * len(chunk))})", chunk):
+                if (number, vendor) in keys:
+                    found[number, vendor] = (content_hash, euuid)
+        return found
+
+    def record(self, rows) -> None:
+        """
+        rows: Iterable of (invoice_number, vendor, content_hash, euuid).
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("""
+                INSERT INTO invoices (invoice_number, vendor, content_hash, euuid, updated)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(invoice_number, vendor) DO UPDATE SET
+                    content_hash = excluded.content_hash, euuid = COALESCE(excluded.euuid, invoices.euuid),
+                    updated = excluded.updated
+                """, [(*row, now) for row in rows])
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+def normalise(value):
+    """
+    Copy of json value that hashes the same regardless of whitespace around and inside strings
+    and of whole numbers written as floats (100.0 and 100).
+    """
+    if value.__class__ is dict:
+        return {key: normalise(item) for key, item in value.items()}
+    if value.__class__ is list:
+        return [normalise(item) for item in value]
+    if value.__class__ is str:
+        return " ".join(value.split())
+    if value.__class__ is float and value.is_integer():
+        return int(value)
+    return value
+
+def invoice_key(invoice: dict):
+    """
+    Returns ((invoice_number, vendor), content_hash) of InvoiceDetailsInput, or None when it
+    has no invoice_number (such invoices are always sent). Vendor is its tax id, or name
+    when there is no tax id, content hash is sha256 of normalised invoice without dedup_ignored fields.
+    """
+    number = invoice.get('invoice_number')
+    if number is None or not str(number).strip():
+        return None
+    content = normalise(invoice)
+    for path in dedup_ignored:
+        *parents, last = path.split(".")
+        parent = content
+        for key in parents:
+            parent = parent.get(key) if parent.__class__ is dict else None
+        if parent.__class__ is dict:
+            parent.pop(last, None)
+    vendor = (invoice.get('document') or {}).get('vendor')
+    if vendor.__class__ is dict:
+        vendor = vendor.get('tax_id') or vendor.get('name')
+    vendor = " ".join(str(vendor).split()).casefold() if vendor is not None else ""
+    content_hash = hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()).hexdigest()
+    return (" ".join(str(number).split()), vendor), content_hash
+
+def iter_input_files(input_dir: str):
+    for directory, subdirectories, files in os.walk(input_dir):
+        subdirectories.sort()
+        for name in sorted(files):
+            if name.endswith('.json'):
+                yield os.path.join(directory, name)
+
+def transform_file(path: str) -> tuple:
+    """
+    Worker of ingest: reads input file and builds InvoiceDetailsInput from it.
+
+    Returns:
+      Tuple (path, sha256 of file content, invoice or None, invoice_key or None, error or None).
+    """
+    digest = None
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        invoice = bobo_db.construct_sending_data_obj(json.loads(content))
+        return path, digest, invoice, invoice_key(invoice), None
+    except Exception as e:
+        return path, digest, None, None, f"{type(e).__name__}: {e}"
+
+async def send_batch(graphql, invoices: list, mode: str, retries: int, backoff: float, stats: dict) -> list:
+    """
+    Sends invoices, failed request is retried with exponential backoff. In aliased mode
+    only invoices that failed are retried.
+
+    Returns:
+      List of (euuid, None) or (None, error) for every invoice.
+    """
+    results = [None] * len(invoices)
+    todo = list(range(len(invoices)))
+    attempt = 0
+    while todo:
+        stats["requests"] += 1
+        try:
+            if mode == "aliased":
+                response = await graphql(aliased_mutation(len(todo)), {f"d{n}": invoices[i] for n, i in enumerate(todo)})
+                data = (response or {}).get("data") or {}
+                errors = {}
+                for error in (response or {}).get("errors") or []:
+                    alias = (error.get("path") or [None])[0]
+                    errors.setdefault(alias, error.get("message", str(error)))
+                failed = []
+                for n, i in enumerate(todo):
+                    item = data.get(f"i{n}")
+                    if item:
+                        results[i] = (item.get("euuid"), None)
+                    else:
+                        failed.append(i)
+                        results[i] = (None, errors.get(f"i{n}") or errors.get(None) or "no result")
+                todo = failed
+                if not todo:
+                    break
+                error = results[todo[0]][1]
+            else:
+                response = await graphql(LIST_MUTATION, {"data": [invoices[i] for i in todo]})
+                errors = (response or {}).get("errors")
+                if errors:
+                    raise RuntimeError(errors)
+                items = ((response or {}).get("data") or {}).get("stackInvoiceDetailsList")
+                if items is None:
+                    raise RuntimeError("no data in response")
+                #result without euuid (or missing, if response is shorter) means invoice wasn't stored
+                items = list(items) + [None] * (len(todo) - len(items))
+                for i, item in zip(todo, items):
+                    euuid = (item or {}).get("euuid")
+                    results[i] = (euuid, None) if euuid else (None, "no result")
+                break
+        except Exception as e:
+            error = str(e)
+            for i in todo:
+                results[i] = (None, error)
+        stats["failed_attempts"] += 1
+        attempt += 1
+        if attempt > retries:
+            break
+        wait = min(backoff * 2 ** (attempt - 1), ingest_max_backoff)
+        print(f"Failed to send {len(todo)} invoices ({error}), retrying in {wait:.1f} s")
+        await asyncio.sleep(wait)
+    return results
+
+async def ingest(input_dir=None, graphql=None, batch_size=None, concurrency=None, mode=None,
+                 retries=None, backoff=None, workers=None, ledger=None, index=None) -> dict:
+    """
+    Sends every invoice json in input_dir (recursively) that wasn't sent yet. Files are read
+    and transformed in a pool of processes, batches are sent by concurrency senders,
+    outcome of every file is written to the ledger. Invoices whose invoice_number, vendor and
+    content are already in the index are not sent again, even if they come from a new file.
+    Changed invoice is sent with the euuid it got the first time, so eywa updates it.
+
+    Args:
+      graphql: Coroutine function used for requests (eywa.graphql by default, a stub for benchmarks).
+      ledger: IngestLedger, the one in state directory by default.
+      index: InvoiceIndex, the one in state directory by default.
+    Returns:
+      Dictionary with numbers of files, skipped (file already sent), unchanged (invoice already sent),
+      changed (new content of invoice that was sent before), invalid, sent and failed invoices,
+      requests, failed attempts and throughput.
+    """
+    input_dir = input_dir or bobo_db.INPUT_DIR
+    graphql = graphql or eywa.graphql
+    batch_size = batch_size or ingest_batch_size
+    concurrency = concurrency or ingest_concurrency
+    mode = mode or ingest_mode
+    retries = ingest_retries if retries is None else retries
+    backoff = ingest_backoff if backoff is None else backoff
+    own_ledger = ledger is None
+    ledger = ledger or IngestLedger()
+    own_index = index is None
+    if own_index:
+        index = InvoiceIndex()
+    stats = {"files": 0, "skipped": 0, "unchanged": 0, "changed": 0, "invalid": 0, "sent": 0, "failed": 0,
+             "requests": 0, "failed_attempts": 0}
+    start = time.perf_counter()
+
+    sent = ledger.sent()
+    pending = []
+    for path in iter_input_files(input_dir):
+        stats["files"] += 1
+        stat = os.stat(path)
+        previous = sent.get(path)
+        if previous and previous[:2] == (stat.st_size, stat.st_mtime_ns):
+            stats["skipped"] += 1
+        else:
+            pending.append((path, stat))
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    loop = asyncio.get_running_loop()
+    #(invoice_number, vendor) -> content_hash of invoices queued in this run, so duplicates
+    #among input files are sent once
+    queued = {}
+    #(invoice_number, vendor) -> euuid of queued invoices that were sent, and ledger rows
+    #(without status) of their duplicates that wait for the outcome of the send
+    sent_euuids = {}
+    waiting = {}
+
+    async def transform(pool, chunk):
+        results = await asyncio.gather(*(loop.run_in_executor(pool, transform_file, path) for path, stat in chunk))
+        known = index.lookup(key[0] for *_, key, error in results if key)
+        batch = []
+        rows = []
+        for (path, stat), (_, digest, invoice, key, error) in zip(chunk, results):
+            if error:
+                stats["invalid"] += 1
+                rows.append((path, stat.st_size, stat.st_mtime_ns, digest, "invalid", None, error))
+            #file was touched, but its content is what was already sent
+            elif path in sent and sent[path][2] == digest:
+                stats["skipped"] += 1
+                rows.append((path, stat.st_size, stat.st_mtime_ns, digest, "sent", None, None))
+            else:
+                identity, content_hash = key or (None, None)
+                previous_hash, euuid = known.get(identity, (None, None))
+                #same invoice was already sent, from another file or before OCR ran again
+                if identity and content_hash == previous_hash:
+                    stats["unchanged"] += 1
+                    rows.append((path, stat.st_size, stat.st_mtime_ns, digest, "sent", euuid, None))
+                #same invoice is sent in this run, file is recorded as its send turns out
+                elif identity and content_hash == queued.get(identity):
+                    stats["unchanged"] += 1
+                    if identity in sent_euuids:
+                        rows.append((path, stat.st_size, stat.st_mtime_ns, digest, "sent", sent_euuids[identity], None))
+                    else:
+                        waiting.setdefault(identity, []).append((path, stat.st_size, stat.st_mtime_ns, digest))
+                else:
+                    if previous_hash:
+                        stats["changed"] += 1
+                    #eywa updates InvoiceDetails sent before (or earlier in this run) instead of adding another one
+                    euuid = euuid or sent_euuids.get(identity)
+                    if euuid:
+                        invoice["euuid"] = euuid
+                    if identity:
+                        queued[identity] = content_hash
+                    batch.append((path, stat, digest, invoice, key))
+        ledger.record(rows)
+        return batch
+
+    async def produce():
+        with ProcessPoolExecutor(max_workers=workers or transform_workers) as pool:
+            #a few chunks are transformed ahead, so senders don't wait for the pool
+            in_flight = collections.deque()
+            #invoices left after skipping are packed into full batches again, so a reprocessed
+            #folder with few changed invoices takes few requests
+            ready = []
+
+            async def put(invoices):
+                ready.extend(invoices)
+                while len(ready) >= batch_size:
+                    await queue.put(ready[:batch_size])
+                    del ready[:batch_size]
+
+            for i in range(0, len(pending), batch_size):
+                in_flight.append(asyncio.ensure_future(transform(pool, pending[i:i + batch_size])))
+                if len(in_flight) > concurrency:
+                    await put(await in_flight.popleft())
+            while in_flight:
+                await put(await in_flight.popleft())
+            if ready:
+                await queue.put(ready)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def send():
+        while (batch := await queue.get()) is not None:
+            results = await send_batch(graphql, [invoice for path, stat, digest, invoice, key in batch], mode, retries, backoff, stats)
+            rows = []
+            indexed = []
+            for (path, stat, digest, invoice, key), (euuid, error) in zip(batch, results):
+                stats["failed" if error else "sent"] += 1
+                rows.append((path, stat.st_size, stat.st_mtime_ns, digest, "failed" if error else "sent", euuid, error))
+                if key and not error:
+                    indexed.append((*key[0], key[1], euuid))
+                    sent_euuids[key[0]] = euuid
+                if not key or queued.get(key[0]) != key[1]:
+                    continue
+                duplicates = waiting.pop(key[0], [])
+                if not error:
+                    rows.extend((*row, "sent", euuid, None) for row in duplicates)
+                else:
+                    #identical invoice that comes later in this run is sent instead of skipped,
+                    #earlier duplicates are failed so the next run sends them
+                    del queued[key[0]]
+                    stats["unchanged"] -= len(duplicates)
+                    stats["failed"] += len(duplicates)
+                    rows.extend((*row, "failed", None, f"same invoice as {path}: {error}") for row in duplicates)
+            ledger.record(rows)
+            index.record(indexed)
+
+    try:
+        await asyncio.gather(produce(), *(send() for _ in range(concurrency)))
+    finally:
+        if own_ledger:
+            ledger.close()
+        if own_index:
+            index.close()
+    stats["seconds"] = time.perf_counter() - start
+    stats["invoices_per_second"] = stats["sent"] / stats["seconds"] if stats["seconds"] else None
+    return stats
+
+async def main(input_dir=None, **options):
+    eywa.open_pipe()
+    try:
+        stats = await ingest(input_dir, **options)
+        print(f"Sent {stats['sent']} invoices ({stats['changed']} changed), {stats['failed']} failed, "
+              f"{stats['invalid']} invalid, {stats['skipped'] + stats['unchanged']} already sent "
+              f"({stats['invoices_per_second'] or 0:.1f} invoices/s)")
+    finally:
+        eywa.exit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sends OCR invoice json files to eywa.")
+    parser.add_argument("--input-dir", help="directory with invoice json files (default: json_input)")
+    parser.add_argument("--batch-size", type=int, help=f"invoices per request (default: {ingest_batch_size})")
+    parser.add_argument("--concurrency", type=int, help=f"requests in flight (default: {ingest_concurrency})")
+    parser.add_argument("--mode", choices=("list", "aliased"), help=f"mutation type (default: {ingest_mode})")
+    args = parser.parse_args()
+    asyncio.run(main(args.input_dir, batch_size=args.batch_size, concurrency=args.concurrency, mode=args.mode))
@@ -0,0 +1,204 @@
+import re
+
+#pattern segments: "*" any dictionary key, "[*]" any list element, "**" any number of segments
+ANY_KEY = "*"
+ANY_INDEX = "[*]"
+ANY_DEPTH = "**"
+
+SEGMENT_PATTERN = re.compile(r'\[(\*|\d+)\]|\.?([^.\[]+)')
+
+def parse_pattern(pattern: str) -> list:
+    """
+    Splits path pattern into segments, e.g. "**.line_items[*].line_number" ->
+    ["**", "line_items", "[*]", "line_number"]. List indexes are 1 based like in reported paths.
+    """
+    segments = []
+    for index, key in SEGMENT_PATTERN.findall(pattern):
+        if index == "*":
+            segments.append(ANY_INDEX)
+        elif index:
+            segments.append(int(index) - 1)
+        else:
+            segments.append(key)
+    return segments
+
+class RuleNode:
+    __slots__ = ("children", "any_key", "any_index", "any_depth", "deep", "rules", "order")
+
+    def __init__(self, deep=False):
+        self.children = {}
+        self.any_key = None
+        self.any_index = None
+        self.any_depth = None
+        self.deep = deep
+        self.rules = None
+        self.order = 0
+
+#transition keys for dictionary keys and list indexes that no pattern names explicitly
+OTHER_KEY = object()
+OTHER_INDEX = object()
+
+class RuleState:
+    """
+    Set of trie nodes matching current path, with their rules merged. States are interned
+    by RuleSet and remember their transitions, so one step down the document is usually
+    a single dictionary lookup.
+    """
+    __slots__ = ("nodes", "rules", "ignore", "keys", "transitions")
+
+    def __init__(self, nodes: tuple):
+        self.nodes = nodes
+        self.rules = {}
+        #when several patterns match the same path, rules of the pattern added later win
+        for node in sorted((node for node in nodes if node.rules), key=lambda node: node.order):
+            self.rules.update(node.rules)
+        self.ignore = bool(self.rules.get("ignore"))
+        self.keys = frozenset(key for node in nodes for key in node.children)
+        self.transitions = {}
+
+class RuleSet:
+    """
+    Path patterns compiled into a trie. While the diff engine descends it keeps a state
+    (RuleState, trie nodes matching current path), so rules for a node are found in O(depth)
+    in total. There are only as many states as distinct combinations of matching patterns.
+    When several patterns match the same path, rules of the pattern added later win.
+    """
+    def __init__(self):
+        self.root = RuleNode()
+        self._added = 0
+        self._states = {}
+
+    def _node(self, segments):
+        node = self.root
+        for segment in segments:
+            if segment == ANY_DEPTH:
+                node.any_depth = node.any_depth or RuleNode(deep=True)
+                node = node.any_depth
+            elif segment == ANY_KEY:
+                node.any_key = node.any_key or RuleNode()
+                node = node.any_key
+            elif segment == ANY_INDEX:
+                node.any_index = node.any_index or RuleNode()
+                node = node.any_index
+            else:
+                node = node.children.setdefault(segment, RuleNode())
+        #states are rebuilt from the changed trie
+        self._states = {}
+        self._added += 1
+        node.order = self._added
+        return node
+
+    def add(self, pattern: str, **rules) -> None:
+        self.add_rules(parse_pattern(pattern), **rules)
+
+    def add_ignore(self, pattern: str) -> None:
+        """
+        Values on matching paths are not compared, their subtrees are never visited.
+        """
+        self.add(pattern, ignore=True)
+
+    def add_tolerance(self, pattern: str, absolute: float = 0.0, relative: float = 0.0) -> None:
+        """
+        Numbers on matching paths are equal if they differ by at most absolute,
+        or by relative times the bigger of them.
+        """
+        self.add(pattern, tolerance=(absolute, relative))
+
+    def add_string_compare(self, pattern: str, ignore_case: bool = False, ignore_whitespace: bool = False) -> None:
+        """
+        Strings on matching paths are compared case-insensitively and/or with whitespace runs
+        collapsed (and stripped at both ends).
+        """
+        self.add(pattern, ignore_case=ignore_case, ignore_whitespace=ignore_whitespace)
+
+    def ignored_keys(self) -> frozenset:
+        """
+        Keys ignored at any depth (patterns "**.<key>"), which is the form json_merkle digests understand.
+        """
+        deep = self.root.any_depth
+        if deep is None:
+            return frozenset()
+        return frozenset(key for key, node in deep.children.items()
+                         if isinstance(key, str) and node.rules and node.rules.get("ignore"))
+
+    def add_list_key(self, pattern: str) -> None:
+        """
+        Elements of list are matched by identity key instead of position,
+        pattern is path of element key, e.g. "**.line_items[*].line_number".
+        """
+        segments = parse_pattern(pattern)
+        if len(segments) < 2 or segments[-2] != ANY_INDEX or not isinstance(segments[-1], str):
+            raise ValueError(f"List key pattern {pattern} has to end with [*].<key>")
+        self.add_rules(segments[:-2], list_key=segments[-1])
+
+    def add_rules(self, segments: list, **rules) -> None:
+        node = self._node(segments)
+        node.rules = {**(node.rules or {}), **rules}
+
+    @staticmethod
+    def _closure(nodes):
+        result = []
+        for node in nodes:
+            #"**" can match zero segments, so its node is active together with its parent
+            while node is not None and node not in result:
+                result.append(node)
+                node = node.any_depth
+        return tuple(result)
+
+    def _state(self, nodes) -> RuleState|None:
+        if not nodes:
+            return None
+        nodes = self._closure(nodes)
+        state = self._states.get(nodes)
+        if state is None:
+            state = self._states[nodes] = RuleState(nodes)
+        return state
+
+    def start(self) -> RuleState|None:
+        return self._state((self.root,))
+
+    def step(self, state: RuleState|None, key) -> RuleState|None:
+        if state is None:
+            return None
+        transition = key if key in state.keys else OTHER_INDEX if key.__class__ is int else OTHER_KEY
+        try:
+            return state.transitions[transition]
+        except KeyError:
+            pass
+        nodes = []
+        for node in state.nodes:
+            if node.deep:
+                nodes.append(node)
+            child = node.children.get(key)
+            if child is not None:
+                nodes.append(child)
+            wildcard = node.any_index if key.__class__ is int else node.any_key
+            if wildcard is not None:
+                nodes.append(wildcard)
+        next_state = state.transitions[transition] = self._state(nodes)
+        return next_state
+
+    @staticmethod
+    def rules(state: RuleState|None) -> dict:
+        """
+        Rules of all patterns matching current path merged together.
+        """
+        return state.rules if state is not None else {}
+
+def values_equal(rules: dict, reference_value, comparison_value) -> bool:
+    """
+    Compares two different leaf values using tolerance and string rules of their path.
+    """
+    tolerance = rules.get("tolerance")
+    if tolerance and reference_value.__class__ in (int, float) and comparison_value.__class__ in (int, float):
+        absolute, relative = tolerance
+        return abs(reference_value - comparison_value) <= max(absolute, relative * max(abs(reference_value), abs(comparison_value)))
+    if reference_value.__class__ is str and comparison_value.__class__ is str:
+        if rules.get("ignore_whitespace"):
+            reference_value = " ".join(reference_value.split())
+            comparison_value = " ".join(comparison_value.split())
+        if rules.get("ignore_case"):
+            reference_value = reference_value.casefold()
+            comparison_value = comparison_value.casefold()
+        return reference_value == comparison_value
+    return False
@@ -0,0 +1,87 @@
+import json
+import os
+
+#lines written between explicit flushes, keeps output file close behind the comparison
+FLUSH_EVERY = 1000
+
+class Sink:
+    """
+    Receives differences as iter_differences yields them and counts them by kind.
+    Subclasses write them somewhere, nothing is accumulated in memory.
+    """
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, kind, path, original, new):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SummarySink(Sink):
+    """
+    Only counts differences.
+    """
+
+class JsonLinesSink(Sink):
+    """
+    Writes one json object per difference: {"kind", "path", "original", "new"},
+    path is list of dictionary keys and (0 based) list indexes.
+    """
+    def __init__(self, path):
+        super().__init__()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, 'w', encoding='utf-8')
+        self.pending = 0
+
+    def add(self, kind, path, original, new):
+        super().add(kind, path, original, new)
+        self.file.write(json.dumps({"kind": kind, "path": path, "original": original, "new": new}, ensure_ascii=False))
+        self.file.write("\n")
+        self.pending += 1
+        if self.pending >= FLUSH_EVERY:
+            self.file.flush()
+            self.pending = 0
+
+    def close(self):
+        self.file.close()
+
+class MsgpackSink(Sink):
+    """
+    Writes differences as a stream of msgpack arrays [kind, path, original, new] (requires msgpack),
+    read back with msgpack.Unpacker(file).
+    """
+    def __init__(self, path):
+        import msgpack
+
+        super().__init__()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, 'wb')
+        self.packer = msgpack.Packer()
+        self.pending = 0
+
+    def add(self, kind, path, original, new):
+        super().add(kind, path, original, new)
+        self.file.write(self.packer.pack((kind, path, original, new)))
+        self.pending += 1
+        if self.pending >= FLUSH_EVERY:
+            self.file.flush()
+            self.pending = 0
+
+    def close(self):
+        self.file.close()
+
+def emit(differences, sink: Sink) -> dict:
+    """
+    Passes differences to sink and returns counts of differences by kind.
+    """
+    add = sink.add
+    for kind, path, original, new in differences:
+        add(kind, path, original, new)
+    return sink.counts
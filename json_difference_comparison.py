@@ -1,15 +1,66 @@
+import argparse
 import json
 import os
 import sys
+import time
+import bisect
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
+
+from json_diff_rules import RuleSet, values_equal
+from json_merkle import file_hashes, subtree_hashes
+from json_diff_sinks import Sink, SummarySink, JsonLinesSink, MsgpackSink, emit
 
 REF_FILE = 'reference.json'
 COMP_FILE = 'comparison.json'
+#read input files incrementally (requires ijson) instead of loading them whole
+STREAM_INPUT = False
 DIFFERENCE_DIR = 'difference'
 DIFFERENCE_FILE = 'difference.json'
+#where differences go: "report" (DIFFERENCE_FILE, everything collected in memory), "jsonl" or "msgpack"
+#(written to DIFFERENCE_DIR as they are found) or "summary" (only counts)
+OUTPUT_SINK = "report"
+#run history counters (total_runs, total_diffs), updated in place
+HISTORY_FILE = 'history.sqlite'
+#batch mode: consolidated report (in DIFFERENCE_DIR), whether it lists differences of every file
+BATCH_REPORT_FILE = 'batch_report.json'
+BATCH_REPORT_DIFFS = True
+#n-way mode: agreement matrix of candidates compared with REF_FILE (in DIFFERENCE_DIR)
+NWAY_REPORT_FILE = 'nway_report.json'
 
 ADD_MACRO = "ADDED to new file"
 MISS_MACRO = "MISSING from new file"
 DIFF_MACRO = "DIFFERENT from reference file"
+MOVE_MACRO = "MOVED in new file"
+
+#skip subtrees with equal Merkle digests (see json_merkle), digests of files are cached in state/json_hashes.
+#Hashing a file costs a few times as much as comparing it, so this pays off when files are compared repeatedly
+#(one reference with many files, nightly runs over mostly unchanged files). Ignored when STREAM_INPUT is set.
+HASH_SHORT_CIRCUIT = False
+
+#path patterns (see json_diff_rules) of values that are not compared at all
+IGNORE = ("**.extraction_timestamp",)
+#path pattern -> (absolute, relative) tolerance for numbers, later patterns override earlier ones
+TOLERANCES = {
+    "**": (1e-6, 0.0),
+    "**.confidence_score": (0.01, 0.0),
+}
+#path pattern -> (ignore case, ignore whitespace) for strings
+STRING_COMPARE = {
+    "**.extracted_text_sample": (True, True),
+}
+
+#lists whose elements are matched by identity key instead of position (see json_diff_rules)
+LIST_KEYS = ("**.line_items[*].line_number",)
+#how other lists are matched: "position" or "lcs" (equal elements are aligned, insertions don't shift the rest)
+LIST_MATCH = "lcs"
+#"lcs" gives up looking for common elements of a part of two lists after this many edits and
+#compares that part by position instead, which bounds the O((n + m) * edits) cost of very different lists
+LCS_MAX_EDITS = 1000
+
+#marks missing element when iterating over lists of different length
+MISSING = object()
 
 sys.path.insert(1, r"C:\Users\Marko\Desktop\Neyho\Neyho_TEST")
 if os.name == 'posix':  # (macOS, Linux)
@@ -39,91 +90,814 @@ def write_to_json_file(data: dict, directory: str, file_name: str) -> None:
     with open(os.path.join(directory, file_name), "w", encoding="utf-8") as f:
         f.write(json_str)
 
+def materialise_path(node) -> tuple:
+    """
+    Turns linked path node (parent node, key) into tuple of keys and list indexes.
+    Paths are kept linked while traversing so descending one level costs O(1),
+    tuple is built only for paths that end up in a reported difference.
+    """
+    keys = []
+    while node is not None:
+        node, key = node
+        keys.append(key)
+    keys.reverse()
+    return tuple(keys)
+
+def format_path(path: tuple) -> str:
+    """
+    Formats path tuple the way differences are reported, e.g. ("items", 0, "price") -> "items[1].price".
+    """
+    result = ""
+    for key in path:
+        if isinstance(key, int):
+            result += f"[{key + 1}]"
+        else:
+            result += f"{'.' if result else ''}{key}"
+    return result
+
+def fingerprints(items: list, hashes: dict, ignored_keys=frozenset()) -> list:
+    """
+    Hashable values used to find equal elements of unkeyed lists. Dictionaries and lists are
+    represented by their subtree digest (see json_merkle), digests missing from hashes are computed
+    (without ignored_keys) and added to it, so every container is hashed once no matter how deep
+    lists are nested.
+    """
+    result = []
+    for item in items:
+        if item.__class__ is dict or item.__class__ is list:
+            digest = hashes.get(id(item))
+            if digest is None:
+                hashes.update(subtree_hashes(item, ignored_keys))
+                digest = hashes[id(item)]
+            result.append(digest)
+        else:
+            result.append((type(item).__name__, item))
+    return result
+
+def middle_snake(a: list, b: list, a0: int, a1: int, b0: int, b1: int, max_edits: int):
+    """
+    Myers' bisection of a[a0:a1] and b[b0:b1]: searches shortest edit script from both ends
+    at once and returns the point (index in a, index in b) where the two searches meet, which
+    splits the problem in two. Returns None if lists have nothing in common or the search
+    needed more than max_edits edits.
+    """
+    n = a1 - a0
+    m = b1 - b0
+    max_d = min((n + m + 1) // 2, max_edits)
+    offset = max_d + 1
+    length = 2 * offset + 1
+    forward = [-1] * length
+    forward[offset + 1] = 0
+    reverse = [-1] * length
+    reverse[offset + 1] = 0
+    delta = n - m
+    #with odd delta forward paths can meet reverse ones, otherwise the other way round
+    front = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and forward[k1_offset - 1] < forward[k1_offset + 1]):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[a0 + x1] == b[b0 + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1_end += 2
+            elif y1 > m:
+                k1_start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < length and reverse[k2_offset] != -1 and x1 >= n - reverse[k2_offset]:
+                    return a0 + x1, b0 + y1
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and reverse[k2_offset - 1] < reverse[k2_offset + 1]):
+                x2 = reverse[k2_offset + 1]
+            else:
+                x2 = reverse[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[a1 - 1 - x2] == b[b1 - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            reverse[k2_offset] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < length and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    if x1 >= n - x2:
+                        return a0 + x1, b0 + x1 - (k1_offset - offset)
+    return None
+
+def common_subsequence(a: list, b: list, max_edits: int = LCS_MAX_EDITS) -> list:
+    """
+    Longest common subsequence of a and b (Myers' O((n + m) * edits) diff in linear space,
+    split into subproblems on an explicit stack).
+
+    Returns:
+      (index in a, index in b) pairs of equal elements in increasing order.
+    """
+    pairs = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            pairs.append((a0, b0))
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            pairs.append((a1, b1))
+        if a0 == a1 or b0 == b1:
+            continue
+        split = middle_snake(a, b, a0, a1, b0, b1, max_edits)
+        if split is not None:
+            x, y = split
+            stack.append((x, a1, y, b1))
+            stack.append((a0, x, b0, y))
+    pairs.sort()
+    return pairs
+
+def stable_positions(positions: list) -> set:
+    """
+    Returns indexes of items of positions that form the longest increasing subsequence.
+    Matched list elements outside of it changed their relative order (were moved),
+    elements inside it only shifted because of insertions and removals around them.
+    """
+    tails = []
+    tail_indexes = []
+    previous = [-1] * len(positions)
+    for i, position in enumerate(positions):
+        j = bisect.bisect_left(tails, position)
+        if j == len(tails):
+            tails.append(position)
+            tail_indexes.append(i)
+        else:
+            tails[j] = position
+            tail_indexes[j] = i
+        previous[i] = tail_indexes[j - 1] if j else -1
+    result = set()
+    i = tail_indexes[-1] if tail_indexes else -1
+    while i != -1:
+        result.add(i)
+        i = previous[i]
+    return result
+
+def identities(items: list, key: str) -> list|None:
+    """
+    Returns identity keys of list elements, or None if some element doesn't have
+    a (unique, hashable) identity key so the list can't be matched by it.
+    """
+    result = [item.get(key, MISSING) if item.__class__ is dict else MISSING for item in items]
+    try:
+        unique = len(set(result)) == len(result)
+    except TypeError:
+        return None
+    return result if unique and MISSING not in result else None
+
+def match_lists(reference_list: list, comparison_list: list, key: str|None, list_match: str,
+                hashes: tuple[dict, dict]|None = None, ignored_keys=frozenset()):
+    """
+    Aligns elements of two lists. hashes are digests used (and filled in) by "lcs", see fingerprints.
+
+    Returns:
+      Tuple (matched (reference index, comparison index) pairs in reference order,
+      reference indexes of removed elements, comparison indexes of added elements,
+      pairs whose relative order changed). Keyed elements that moved are also in matched pairs
+      so their content is still compared, moved elements of unkeyed lists are equal.
+    """
+    if key:
+        reference_ids = identities(reference_list, key)
+        comparison_ids = identities(comparison_list, key) if reference_ids is not None else None
+        #same identities in the same order (the usual case) => nothing was added, removed or moved
+        if comparison_ids is not None and reference_ids == comparison_ids:
+            return [(i, i) for i in range(len(reference_ids))], [], [], []
+        if comparison_ids is not None:
+            reference_index = {identity: i for i, identity in enumerate(reference_ids)}
+            comparison_index = {identity: j for j, identity in enumerate(comparison_ids)}
+            matched = [(i, comparison_index[identity]) for identity, i in reference_index.items()
+                       if identity in comparison_index]
+            removed = [i for identity, i in reference_index.items() if identity not in comparison_index]
+            added = [j for identity, j in comparison_index.items() if identity not in reference_index]
+            stable = stable_positions([j for i, j in matched])
+            moved = [pair for n, pair in enumerate(matched) if n not in stable]
+            return matched, removed, added, moved
+
+    if list_match == "lcs":
+        reference_hashes, comparison_hashes = hashes if hashes is not None else ({}, {})
+        reference_fingerprints = fingerprints(reference_list, reference_hashes, ignored_keys)
+        comparison_fingerprints = fingerprints(comparison_list, comparison_hashes, ignored_keys)
+        matched, removed, added = [], [], []
+        previous_i = previous_j = -1
+        for i, j in common_subsequence(reference_fingerprints, comparison_fingerprints) + [(len(reference_list), len(comparison_list))]:
+            #elements between two equal ones were changed: they are compared pairwise,
+            #the rest of the longer side is added/removed
+            i1, j1 = previous_i + 1, previous_j + 1
+            pairs = min(i - i1, j - j1)
+            matched.extend(zip(range(i1, i1 + pairs), range(j1, j1 + pairs)))
+            removed.extend(range(i1 + pairs, i))
+            added.extend(range(j1 + pairs, j))
+            previous_i, previous_j = i, j
+        #removed element that shows up as added somewhere else was moved
+        removed_by_fingerprint = {}
+        for i in removed:
+            removed_by_fingerprint.setdefault(reference_fingerprints[i], []).append(i)
+        moved = []
+        still_added = []
+        for j in added:
+            candidates = removed_by_fingerprint.get(comparison_fingerprints[j])
+            if candidates:
+                moved.append((candidates.pop(0), j))
+            else:
+                still_added.append(j)
+        moved_from = {i for i, j in moved}
+        return matched, [i for i in removed if i not in moved_from], still_added, moved
+
+    common = min(len(reference_list), len(comparison_list))
+    return ([(i, i) for i in range(common)], list(range(common, len(reference_list))),
+            list(range(common, len(comparison_list))), [])
+
+def is_ignored(rules: RuleSet, state, key) -> bool:
+    child_state = rules.step(state, key)
+    return child_state is not None and child_state.ignore
+
+def iter_differences(reference_value, comparison_value, path: tuple = (),
+                     rules: RuleSet|None = None, list_match: str = "position", hashes: tuple[dict, dict]|None = None):
+    """
+    Iterative (explicit stack) comparison of two json values, differences are yielded
+    as soon as they are found so nothing is accumulated here.
+
+    Args:
+      reference_value: Content of reference json (or its part).
+      comparison_value: Content of json that is compared to reference.
+      path: Path of the compared values inside the whole document.
+      rules: Path rules (see json_diff_rules.RuleSet): ignored paths, number tolerances, string
+      comparison and keys by which list elements are matched.
+      list_match: How other lists are matched: "position" compares elements with the same index,
+      "lcs" aligns equal elements (longest common subsequence) first.
+      hashes: Subtree digests of reference and comparison value (json_merkle.subtree_hashes or file_hashes
+      computed with rules.ignored_keys()), subtrees with equal digests are skipped without descending into them.
+    Yields:
+      Tuples (kind, path, original, new), where kind is one of ADD_MACRO, MISS_MACRO, DIFF_MACRO, MOVE_MACRO
+      and path is tuple of dictionary keys and (0 based) list indexes. For moved elements
+      original and new are indexes in reference and comparison list.
+    """
+    root = None
+    state = rules.start() if rules else None
+    for key in path:
+        root = (root, key)
+        state = rules.step(state, key) if state else state
+    reference_hashes, comparison_hashes = hashes or ({}, {})
+    #cached digests (json_merkle.CachedDigests) of children are added as the traversal descends
+    expand_reference = getattr(reference_hashes, "expand", None)
+    expand_comparison = getattr(comparison_hashes, "expand", None)
+    #digests of list elements for "lcs", when not given they are computed as lists are matched
+    #and shared by the whole traversal, so nested lists don't hash the same subtrees again
+    list_hashes = hashes or ({}, {})
+    ignored_keys = rules.ignored_keys() if rules else frozenset()
+    #subtrees with equal digests are skipped before they are pushed, value without digest gets MISSING
+    if hashes and reference_hashes.get(id(reference_value), MISSING) == comparison_hashes.get(id(comparison_value)):
+        return
+    stack = [(root, state, reference_value, comparison_value)]
+    while stack:
+        node, state, reference_value, comparison_value = stack.pop()
+        if isinstance(reference_value, dict) and isinstance(comparison_value, dict):
+            if expand_reference:
+                expand_reference(reference_value)
+            if expand_comparison:
+                expand_comparison(comparison_value)
+            children = []
+            for key, ref_value in reference_value.items():
+                child_state = rules.step(state, key) if state else state
+                if child_state and child_state.ignore:
+                    continue
+                if key in comparison_value:
+                    comp_value = comparison_value[key]
+                    if hashes and reference_hashes.get(id(ref_value), MISSING) == comparison_hashes.get(id(comp_value)):
+                        continue
+                    children.append(((node, key), child_state, ref_value, comp_value))
+                #key doesn't exist in comparison_value => file that we are comparing is missing some data
+                else:
+                    yield MISS_MACRO, materialise_path((node, key)), ref_value, None
+            for key, comp_value in comparison_value.items():
+                #key doesn't exist in reference_value => file that we are comparing has some extra data
+                if key not in reference_value and not (state and is_ignored(rules, state, key)):
+                    yield ADD_MACRO, materialise_path((node, key)), None, comp_value
+            #reversed so that children are compared in document order
+            stack.extend(reversed(children))
+        elif isinstance(reference_value, list) and isinstance(comparison_value, list):
+            if expand_reference:
+                expand_reference(reference_value)
+            if expand_comparison:
+                expand_comparison(comparison_value)
+            key = state.rules.get("list_key") if state else None
+            matched, removed, added, moved = match_lists(reference_value, comparison_value, key, list_match, list_hashes, ignored_keys)
+            for i in removed:
+                if not (state and is_ignored(rules, state, i)):
+                    yield MISS_MACRO, materialise_path((node, i)), reference_value[i], None
+            for j in added:
+                if not (state and is_ignored(rules, state, j)):
+                    yield ADD_MACRO, materialise_path((node, j)), None, comparison_value[j]
+            for i, j in moved:
+                yield MOVE_MACRO, materialise_path((node, i)), i, j
+            children = []
+            for i, j in matched:
+                child_state = rules.step(state, i) if state else state
+                if child_state and child_state.ignore:
+                    continue
+                if hashes and reference_hashes.get(id(reference_value[i]), MISSING) == comparison_hashes.get(id(comparison_value[j])):
+                    continue
+                children.append(((node, i), child_state, reference_value[i], comparison_value[j]))
+            stack.extend(reversed(children))
+        #values are leaves (or aggregate compared to something else) => they must be compared directly
+        elif reference_value != comparison_value:
+            if state and values_equal(state.rules, reference_value, comparison_value):
+                continue
+            yield DIFF_MACRO, materialise_path(node), reference_value, comparison_value
+
+def iter_file_differences(reference_path: str, comparison_path: str,
+                          rules: RuleSet|None = None, list_match: str = "position"):
+    """
+    Same as iter_differences, but reads both files incrementally (requires ijson).
+    Top level values of object (or items of array) are parsed one at a time and compared
+    as soon as their counterpart from the other file is available, so when both files
+    have keys in the same order only one top level value per file is held in memory.
+    Items of top level array are always compared by position.
+    """
+    import ijson
+
+    state = rules.start() if rules else None
+
+    with open(reference_path, 'rb') as f:
+        reference_type = next(ijson.parse(f))[1]
+    with open(comparison_path, 'rb') as f:
+        comparison_type = next(ijson.parse(f))[1]
+
+    with open(reference_path, 'rb') as reference_file, open(comparison_path, 'rb') as comparison_file:
+        if reference_type == comparison_type == "start_map":
+            reference_items = ijson.kvitems(reference_file, '', use_float=True)
+            comparison_items = ijson.kvitems(comparison_file, '', use_float=True)
+            pending_reference = {}
+            pending_comparison = {}
+            for reference_item, comparison_item in zip_longest(reference_items, comparison_items):
+                if reference_item is not None:
+                    key, value = reference_item
+                    if key in pending_comparison:
+                        yield from iter_differences(value, pending_comparison.pop(key), (key,), rules=rules, list_match=list_match)
+                    elif not (state and is_ignored(rules, state, key)):
+                        pending_reference[key] = value
+                if comparison_item is not None:
+                    key, value = comparison_item
+                    if key in pending_reference:
+                        yield from iter_differences(pending_reference.pop(key), value, (key,), rules=rules, list_match=list_match)
+                    elif not (state and is_ignored(rules, state, key)):
+                        pending_comparison[key] = value
+            for key, value in pending_reference.items():
+                yield MISS_MACRO, (key,), value, None
+            for key, value in pending_comparison.items():
+                yield ADD_MACRO, (key,), None, value
+        elif reference_type == comparison_type == "start_array":
+            reference_items = ijson.items(reference_file, 'item', use_float=True)
+            comparison_items = ijson.items(comparison_file, 'item', use_float=True)
+            for i, (ref_value, comp_value) in enumerate(zip_longest(reference_items, comparison_items, fillvalue=MISSING)):
+                if state and is_ignored(rules, state, i):
+                    continue
+                if comp_value is MISSING:
+                    yield MISS_MACRO, (i,), ref_value, None
+                elif ref_value is MISSING:
+                    yield ADD_MACRO, (i,), None, comp_value
+                else:
+                    yield from iter_differences(ref_value, comp_value, (i,), rules=rules, list_match=list_match)
+        else:
+            yield from iter_differences(json.load(reference_file), json.load(comparison_file), (), rules=rules, list_match=list_match)
+
+def iter_many_differences(reference_value, candidate_values: list, rules: RuleSet|None = None,
+                          list_match: str = "position", hashes: tuple[dict, list]|None = None):
+    """
+    Compares many candidates with one reference in a single traversal of the reference.
+    Candidate values are carried down the traversal together (MISSING where candidate has
+    nothing more to compare), so shared reference work (rules, paths, keyed list indexes of
+    reference) is done once instead of once per candidate.
+
+    Args:
+      candidate_values: Values compared to reference.
+      rules, list_match: See iter_differences.
+      hashes: (reference digests, list of digests of every candidate), see iter_differences.
+    Yields:
+      Tuples (path, reference value (None for added values), statuses) for paths where at least
+      one candidate differs. statuses has one item per candidate: None if it agrees with reference,
+      otherwise (kind, value of candidate) - for MOVE_MACRO value is index in candidate list.
+    """
+    count = len(candidate_values)
+    reference_hashes, candidate_hashes = hashes or ({}, None)
+    #see list_hashes in iter_differences
+    list_hashes = hashes or ({}, [{} for _ in candidate_values])
+    #see expand_reference in iter_differences
+    expand_reference = getattr(reference_hashes, "expand", None)
+    expand_candidates = [getattr(digests, "expand", None) for digests in candidate_hashes] if hashes else [None] * count
+    ignored_keys = rules.ignored_keys() if rules else frozenset()
+    stack = [(None, rules.start() if rules else None, reference_value, tuple(candidate_values))]
+    while stack:
+        node, state, reference_value, values = stack.pop()
+        if hashes:
+            digest = reference_hashes.get(id(reference_value), MISSING)
+            values = tuple(MISSING if value is MISSING or candidate_hashes[c].get(id(value)) == digest else value
+                           for c, value in enumerate(values))
+        reference_type = dict if isinstance(reference_value, dict) else list if isinstance(reference_value, list) else None
+        statuses = [None] * count
+        active = []
+        for c, value in enumerate(values):
+            if value is MISSING:
+                continue
+            if reference_type is not None and isinstance(value, reference_type):
+                active.append(c)
+            #leaves (or aggregate compared to something else) are compared directly
+            elif value != reference_value and not (state and values_equal(state.rules, reference_value, value)):
+                statuses[c] = (DIFF_MACRO, value)
+        if any(statuses):
+            yield materialise_path(node), reference_value, tuple(statuses)
+        if not active:
+            continue
+        if expand_reference:
+            expand_reference(reference_value)
+        for c in active:
+            if expand_candidates[c]:
+                expand_candidates[c](values[c])
+
+        children = []
+        if reference_type is dict:
+            added = {}
+            for key, ref_value in reference_value.items():
+                child_state = rules.step(state, key) if state else state
+                if child_state and child_state.ignore:
+                    continue
+                child_values = [MISSING] * count
+                missing = None
+                for c in active:
+                    value = values[c].get(key, MISSING)
+                    if value is MISSING:
+                        missing = missing or [None] * count
+                        missing[c] = (MISS_MACRO, None)
+                    else:
+                        child_values[c] = value
+                if missing:
+                    yield materialise_path((node, key)), ref_value, tuple(missing)
+                if any(value is not MISSING for value in child_values):
+                    children.append(((node, key), child_state, ref_value, tuple(child_values)))
+            for c in active:
+                for key, value in values[c].items():
+                    if key not in reference_value and not (state and is_ignored(rules, state, key)):
+                        added.setdefault(key, [None] * count)[c] = (ADD_MACRO, value)
+            for key, added_statuses in added.items():
+                yield materialise_path((node, key)), None, tuple(added_statuses)
+        else:
+            key = state.rules.get("list_key") if state else None
+            child_values = [[MISSING] * count for _ in reference_value]
+            rows = {}
+            for c in active:
+                candidate = values[c]
+                matched, removed, added, moved = match_lists(
+                    reference_value, candidate, key, list_match,
+                    (list_hashes[0], list_hashes[1][c]), ignored_keys)
+                for i, j in matched:
+                    child_values[i][c] = candidate[j]
+                for i in removed:
+                    if not (state and is_ignored(rules, state, i)):
+                        rows.setdefault((MISS_MACRO, i), [None] * count)[c] = (MISS_MACRO, None)
+                for j in added:
+                    if not (state and is_ignored(rules, state, j)):
+                        rows.setdefault((ADD_MACRO, j), [None] * count)[c] = (ADD_MACRO, candidate[j])
+                for i, j in moved:
+                    rows.setdefault((MOVE_MACRO, i), [None] * count)[c] = (MOVE_MACRO, j)
+            for (kind, i), row_statuses in rows.items():
+                yield materialise_path((node, i)), reference_value[i] if kind != ADD_MACRO else None, tuple(row_statuses)
+            for i, ref_value in enumerate(reference_value):
+                if any(value is not MISSING for value in child_values[i]):
+                    child_state = rules.step(state, i) if state else state
+                    if not (child_state and child_state.ignore):
+                        children.append(((node, i), child_state, ref_value, tuple(child_values[i])))
+        #reversed so that children are compared in document order
+        stack.extend(reversed(children))
+
 def compare_json_files(reference_value : dict|str|float|list, 
                        comparison_value : dict|str|float|list,
-                       path : str, diffs : dict[str, list[str]]) -> None:
+                       path : str, diffs : dict[str, list[str]],
+                       rules : RuleSet|None = None, list_match : str = "position") -> None:
     """
-    Recursive function that goes deeper into data structure if reference_value
-    and comparison_value are aggregates (like dicts and lists), otherwise it compares
-    passed values. Function goes all the way down to the leaves (values that can be compared).
+    Compares reference_value and comparison_value all the way down to the leaves (values that
+    can be compared) and adds found differences to diffs.
 
     Args:
-      reference_value: Starts as dictionary (full content of referent json file), and is gradually
-      broken down as program is going down the structure to the leaf elements
-      (until it gets to the values it can compare).
-      comparison_value: Same as reference_value, but contains full content of json that needs to be
-      compared.
-      path: String that represents path to the potentionally different value. It is gradually updated
-      as program descends further into the structure (it is made out of keys and list names).
+      reference_value: Full content of referent json file.
+      comparison_value: Full content of json that needs to be compared.
+      path: Key under which compared values are in the whole document ("" for whole documents).
       diffs: Dictionary containing information about: added, missing and different elements and values
       compared to reference data. 
+      rules: Path rules (ignored paths, tolerances, list keys...), module settings (build_rules()) by default.
+      list_match: How lists without key are matched, see iter_differences.
     Returns: 
         None.
     """
-    #both values are dicts => go deeper in the structure
-    if isinstance(reference_value, dict) and isinstance(comparison_value, dict):
-        all_keys = set(reference_value.keys()) |set(comparison_value.keys())
-        for combined_key in all_keys:
-            if combined_key == "extraction_timestamp":
-                continue
-            ref_value = reference_value.get(combined_key, None)
-            comp_value = comparison_value.get(combined_key, None)
-
-            #combined_key doesn't exist in reference_value => File that we are comparing
-            #has some extra data relative to reference file
-            if combined_key not in reference_value:
-                diffs.get(ADD_MACRO).append(f"{path}{'.' if path else ''}{combined_key}")
-            #combined_key doesn't exist in comparison_value => File that we are comparing
-            #is missing some data relative to reference file
-            if combined_key not in comparison_value:
-                diffs.get(MISS_MACRO).append(f"{path}{'.' if path else ''}{combined_key}")
-
-            if combined_key in reference_value and combined_key in comparison_value:
-                new_path = f"{path}{'.' if path != "" else ""}{combined_key}"
-                compare_json_files(ref_value, comp_value, new_path, diffs)
-    
-    elif not isinstance(reference_value, dict) and not isinstance(comparison_value, dict):
-        if isinstance(reference_value, list) and isinstance(comparison_value, list):
-            for i in range(len(reference_value)):
-                new_path = f"{path}[{i + 1}]"
-                compare_json_files(reference_value[i], comparison_value[i], new_path, diffs)
-        #both values are neither dict nor list => can't go deeper into the structure
-        #they must be comparable values
-        elif not isinstance(reference_value, list) and not isinstance(comparison_value, list):
-            if reference_value != comparison_value:
-                diffs.get(DIFF_MACRO).append({path: {"original": reference_value, "new": comparison_value}})
-                return
-            #values are the same, no need to add them to difference dictionary
-            else:
-                return
+    add_report(iter_differences(reference_value, comparison_value, (path,) if path else (),
+                                rules=rules or build_rules(), list_match=list_match), diffs)
+
+class ReportSink(Sink):
+    """
+    Collects differences into diffs dictionary in the format of difference.json.
+    """
+    def __init__(self, diffs: dict|None = None):
+        super().__init__()
+        self.diffs = diffs if diffs is not None else {ADD_MACRO: [], MISS_MACRO: [], DIFF_MACRO: [], MOVE_MACRO: []}
+
+    def add(self, kind, path, original, new):
+        super().add(kind, path, original, new)
+        formatted = format_path(path)
+        if kind == DIFF_MACRO:
+            self.diffs.get(DIFF_MACRO).append({formatted: {"original": original, "new": new}})
+        elif kind == MOVE_MACRO:
+            self.diffs.setdefault(MOVE_MACRO, []).append({formatted: {"original": original + 1, "new": new + 1}})
         else:
-            diffs.append(path)
-            return
-    #either reference_value or comparison value is dict, while the other is not
+            self.diffs.get(kind).append(formatted)
+
+def add_report(differences, diffs: dict) -> None:
+    """
+    Adds differences yielded by iter_differences to diffs dictionary.
+    """
+    emit(differences, ReportSink(diffs))
+
+def make_sink(name: str, directory: str = DIFFERENCE_DIR) -> Sink:
+    if name == "report":
+        return ReportSink()
+    if name == "jsonl":
+        return JsonLinesSink(os.path.join(directory, 'difference.jsonl'))
+    if name == "msgpack":
+        return MsgpackSink(os.path.join(directory, 'difference.msgpack'))
+    if name == "summary":
+        return SummarySink()
+    raise ValueError(f"Unknown output sink {name}")
+
+def record_run(has_differences: bool) -> dict:
+    """
+    Adds run to history counters and returns them ({"total_runs": ..., "total_diffs": ...}).
+    Counters are incremented in place inside one SQLite transaction, so concurrent runs can't
+    lose updates and nothing else has to be read or rewritten. Counters are seeded from
+    difference.json the first time.
+    """
+    os.makedirs(DIFFERENCE_DIR, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(DIFFERENCE_DIR, HISTORY_FILE), timeout=30, isolation_level=None)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        if connection.execute("SELECT COUNT(*) FROM counters").fetchone()[0] == 0:
+            try:
+                with open(os.path.join(DIFFERENCE_DIR, DIFFERENCE_FILE), 'r', encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError):
+                previous = {}
+            connection.executemany("INSERT INTO counters VALUES (?, ?)",
+                                   [(name, previous.get(name) or 0) for name in ("total_runs", "total_diffs")])
+        connection.execute("UPDATE counters SET value = value + 1 WHERE name = 'total_runs'")
+        if has_differences:
+            connection.execute("UPDATE counters SET value = value + 1 WHERE name = 'total_diffs'")
+        counters = dict(connection.execute("SELECT name, value FROM counters"))
+        connection.execute("COMMIT")
+        return counters
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+def build_rules() -> RuleSet:
+    """
+    Compiles module settings (IGNORE, TOLERANCES, STRING_COMPARE, LIST_KEYS) into a RuleSet.
+    """
+    rules = RuleSet()
+    for pattern in IGNORE:
+        rules.add_ignore(pattern)
+    for pattern, (absolute, relative) in TOLERANCES.items():
+        rules.add_tolerance(pattern, absolute, relative)
+    for pattern, (ignore_case, ignore_whitespace) in STRING_COMPARE.items():
+        rules.add_string_compare(pattern, ignore_case, ignore_whitespace)
+    for pattern in LIST_KEYS:
+        rules.add_list_key(pattern)
+    return rules
+
+def compare_files(reference_path: str, comparison_path: str, rules: RuleSet|None = None,
+                  sink: Sink|None = None) -> Sink:
+    """
+    Compares two json files using module settings (STREAM_INPUT, HASH_SHORT_CIRCUIT, LIST_MATCH)
+    and passes differences to sink (ReportSink by default). Returns the sink.
+    """
+    sink = sink if sink is not None else ReportSink()
+    if STREAM_INPUT:
+        differences = iter_file_differences(reference_path, comparison_path, rules=rules, list_match=LIST_MATCH)
     else:
-        diffs.append(path)
-        return 
+        with open(reference_path, 'r', encoding='utf-8') as f:
+            reference_value = json.load(f)
+        with open(comparison_path, 'r', encoding='utf-8') as f:
+            comparison_value = json.load(f)
+        hashes = None
+        if HASH_SHORT_CIRCUIT:
+            ignored_keys = rules.ignored_keys() if rules else frozenset()
+            hashes = (file_hashes(reference_path, reference_value, ignored_keys), file_hashes(comparison_path, comparison_value, ignored_keys))
+        differences = iter_differences(reference_value, comparison_value, rules=rules, list_match=LIST_MATCH, hashes=hashes)
+    emit(differences, sink)
+    return sink
 
-def main():
+def pair_files(reference_dir: str, comparison_dir: str) -> tuple[list, list, list]:
+    """
+    Pairs json files of two directories by name.
+
+    Returns:
+      Tuple (pairs (name, reference path, comparison path), names only in reference_dir,
+      names only in comparison_dir).
+    """
+    reference_names = {name for name in os.listdir(reference_dir) if name.endswith('.json')}
+    comparison_names = {name for name in os.listdir(comparison_dir) if name.endswith('.json')}
+    pairs = [(name, os.path.join(reference_dir, name), os.path.join(comparison_dir, name))
+             for name in sorted(reference_names & comparison_names)]
+    return pairs, sorted(reference_names - comparison_names), sorted(comparison_names - reference_names)
+
+#rules of worker process, built once per process instead of being sent with every pair
+_worker_rules = None
+
+def compare_pair(pair: tuple) -> dict:
+    """
+    Worker of compare_directories, compares one pair of files and returns its statistics.
+    """
+    global _worker_rules
+    if _worker_rules is None:
+        _worker_rules = build_rules()
+    name, reference_path, comparison_path = pair
+    start = time.perf_counter()
+    try:
+        sink = compare_files(reference_path, comparison_path, _worker_rules,
+                             ReportSink() if BATCH_REPORT_DIFFS else SummarySink())
+    except Exception as e:
+        return {"file": name, "error": f"{type(e).__name__}: {e}", "seconds": time.perf_counter() - start}
+    counts = sink.counts
+    result = {
+        "file": name,
+        "added": counts.get(ADD_MACRO, 0),
+        "missing": counts.get(MISS_MACRO, 0),
+        "different": counts.get(DIFF_MACRO, 0),
+        "moved": counts.get(MOVE_MACRO, 0),
+        "seconds": time.perf_counter() - start,
+    }
+    if BATCH_REPORT_DIFFS and counts:
+        result["diffs"] = sink.diffs
+    return result
+
+def compare_directories(reference_dir: str, comparison_dir: str, workers: int|None = None) -> dict:
+    """
+    Compares every pair of equally named json files in reference_dir and comparison_dir
+    in a pool of worker processes.
+
+    Args:
+      workers: Number of processes, defaults to number of CPUs.
+    Returns:
+      Report with per file results ("files") and aggregate statistics ("summary").
+    """
+    pairs, only_reference, only_comparison = pair_files(reference_dir, comparison_dir)
+    workers = workers or os.cpu_count() or 1
+    #biggest pairs are started first so that one big file doesn't end up last and keep a single worker busy
+    pairs.sort(key=lambda pair: os.path.getsize(pair[1]) + os.path.getsize(pair[2]), reverse=True)
+    #small chunks keep workers evenly loaded, but still spare one round trip per pair
+    chunksize = max(1, len(pairs) // (workers * 16))
+    start = time.perf_counter()
+    if workers == 1:
+        results = [compare_pair(pair) for pair in pairs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(compare_pair, pairs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda result: result["file"])
+
+    failed = [result for result in results if "error" in result]
+    compared = [result for result in results if "error" not in result]
+    totals = {kind: sum(result[kind] for result in compared) for kind in ("added", "missing", "different", "moved")}
+    different_files = sum(1 for result in compared if any(result[kind] for kind in totals))
+    return {
+        "summary": {
+            "pairs": len(pairs),
+            "identical": len(compared) - different_files,
+            "with_differences": different_files,
+            "failed": len(failed),
+            "only_in_reference": len(only_reference),
+            "only_in_comparison": len(only_comparison),
+            **totals,
+            "workers": workers,
+            "seconds": elapsed,
+            "pairs_per_second": len(pairs) / elapsed if elapsed else None,
+        },
+        "only_in_reference": only_reference,
+        "only_in_comparison": only_comparison,
+        "files": results,
+    }
+
+def run_batch(reference_dir: str, comparison_dir: str, workers: int|None = None) -> dict:
+    print("=" * 100)
+    report = compare_directories(reference_dir, comparison_dir, workers)
+    summary = report["summary"]
+    print(f"Compared {summary['pairs']} pairs in {summary['seconds']:.1f} s with {summary['workers']} workers: "
+          f"{summary['identical']} identical, {summary['with_differences']} with differences, {summary['failed']} failed")
+    os.makedirs(DIFFERENCE_DIR, exist_ok=True)
+    write_to_json_file(report, DIFFERENCE_DIR, BATCH_REPORT_FILE)
+    return report
+
+def compare_many(reference_path: str, candidate_paths: list, rules: RuleSet|None = None) -> dict:
+    """
+    Compares many candidate files with one reference. Reference is loaded (and hashed when
+    HASH_SHORT_CIRCUIT is set) once and traversed once for all candidates.
+
+    Returns:
+      Report with candidate names, per candidate counts ("summary") and agreement matrix ("paths"):
+      for every path where some candidate differs, reference value, names of candidates that
+      agree and what the others have there.
+    """
+    rules = rules or build_rules()
+    names = [os.path.basename(path) for path in candidate_paths]
+    #candidates from different directories can share file name
+    if len(set(names)) != len(names):
+        names = list(candidate_paths)
+    with open(reference_path, 'r', encoding='utf-8') as f:
+        reference_value = json.load(f)
+    candidate_values = []
+    for path in candidate_paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            candidate_values.append(json.load(f))
+    hashes = None
+    if HASH_SHORT_CIRCUIT:
+        ignored_keys = rules.ignored_keys()
+        hashes = (file_hashes(reference_path, reference_value, ignored_keys),
+                  [file_hashes(path, value, ignored_keys) for path, value in zip(candidate_paths, candidate_values)])
+
+    summary = {name: {ADD_MACRO: 0, MISS_MACRO: 0, DIFF_MACRO: 0, MOVE_MACRO: 0} for name in names}
+    paths = {}
+    for path, reference, statuses in iter_many_differences(reference_value, candidate_values, rules, LIST_MATCH, hashes):
+        row = paths.setdefault(format_path(path), {"differ": {}})
+        for name, status in zip(names, statuses):
+            if status is None:
+                continue
+            kind, value = status
+            summary[name][kind] += 1
+            if kind != ADD_MACRO:
+                row["reference"] = reference
+            row["differ"][name] = {"kind": kind, "value": value + 1 if kind == MOVE_MACRO else value}
+    for row in paths.values():
+        row["agree"] = [name for name in names if name not in row["differ"]]
+    return {"reference": reference_path, "candidates": names, "summary": summary, "paths": paths}
+
+def run_many(candidate_paths: list) -> dict:
+    print("=" * 100)
+    report = compare_many(os.path.join(INPUT_DIR, REF_FILE), candidate_paths)
+    for name, counts in report["summary"].items():
+        differences = sum(counts.values())
+        print(f"{name}: " + (", ".join(f"{count} {kind}" for kind, count in counts.items() if count) if differences else "NO differences"))
+    os.makedirs(DIFFERENCE_DIR, exist_ok=True)
+    write_to_json_file(report, DIFFERENCE_DIR, NWAY_REPORT_FILE)
+    return report
+
+def main(sink_name: str = OUTPUT_SINK):
     # reference_value = {'a': 2, 'b': { 'b1': 2.1 }, 'c' : { 'c1' : { 'c2' : 2.11 } }, 'l' : [{'a': 1}, {'b': 2}] }
     # comparison_value = {'a': 4, 'c' : { 'c2' : { 'c2' : 2.711 } }, 'b': { 'b1': 2.2, 'b2': 2.3 }, 'l' : [{'a': 1}, {'b': 3}] }
     print("=" * 100)
-    reference_value = load_json_file(INPUT_DIR, REF_FILE)
-    comparison_value = load_json_file(INPUT_DIR, COMP_FILE)
-    diffs = {"total_runs": 0, "total_diffs": 0, ADD_MACRO: [], MISS_MACRO: [], DIFF_MACRO: []}
-    path = ""
-    compare_json_files(reference_value, comparison_value, path, diffs)
-    diff_content = load_json_file(DIFFERENCE_DIR, DIFFERENCE_FILE)
-    if not any((diffs.get(ADD_MACRO), diffs.get(MISS_MACRO), diffs.get(DIFF_MACRO))):
+    with make_sink(sink_name) as sink:
+        compare_files(os.path.join(INPUT_DIR, REF_FILE), os.path.join(INPUT_DIR, COMP_FILE), build_rules(), sink)
+    if not sink.counts:
         print("NO differences")
-        diffs['total_diffs'] = diff_content.get('total_diffs')
     else:
-        print("Files contain some differences")
-        diffs['total_diffs'] = diff_content.get('total_diffs') + 1
-    diffs['total_runs'] = diff_content.get('total_runs') + 1
-    write_to_json_file(diffs, DIFFERENCE_DIR, DIFFERENCE_FILE)
+        print("Files contain some differences: " + ", ".join(f"{count} {kind}" for kind, count in sink.counts.items()))
+    counters = record_run(bool(sink.counts))
+    if isinstance(sink, ReportSink):
+        write_to_json_file({**counters, **sink.diffs}, DIFFERENCE_DIR, DIFFERENCE_FILE)
     
     return
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Compares json files with reference ones.")
+    parser.add_argument("--batch", nargs=2, metavar=("REFERENCE_DIR", "COMPARISON_DIR"),
+                        help="compare equally named files of two directories and write consolidated report")
+    parser.add_argument("--workers", type=int, help="number of worker processes in batch mode (default: CPU count)")
+    parser.add_argument("--candidates", nargs="+", metavar="FILE",
+                        help="compare every file with reference.json in one pass and write agreement matrix")
+    parser.add_argument("--sink", choices=("report", "jsonl", "msgpack", "summary"), default=OUTPUT_SINK,
+                        help="where differences of single comparison go (default: %(default)s)")
+    args = parser.parse_args()
+    if args.batch:
+        run_batch(*args.batch, workers=args.workers)
+    elif args.candidates:
+        run_many(args.candidates)
+    else:
+        main(args.sink)
\ No newline at end of file
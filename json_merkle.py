@@ -0,0 +1,150 @@
+import array
+import hashlib
+import os
+
+import local_state
+
+#cache files are named after file path, size, modification time and ignored keys,
+#FORMAT_VERSION changes the names whenever the way hashes are computed (or stored) changes
+FORMAT_VERSION = 3
+HASH_CACHE_DIR = "json_hashes"
+DIGEST_SIZE = 16
+#cache file is digests of all containers in pre-order followed by their descendant counts (uint32)
+COUNT_FORMAT = "I"
+COUNT_SIZE = 4
+
+def containers(value) -> list:
+    """
+    Returns dictionaries and lists of json value in pre-order (explicit stack, so nesting depth
+    isn't limited by recursion). The order only depends on the document, so it's used to find
+    cached digests of containers of freshly loaded document.
+    """
+    order = []
+    stack = [value] if value.__class__ is dict or value.__class__ is list else []
+    push = stack.append
+    pop = stack.pop
+    append = order.append
+    while stack:
+        node = pop()
+        append(node)
+        #ignored keys are only skipped when digest is computed, subtree under them is never used
+        for child in (node.values() if node.__class__ is dict else node):
+            if child.__class__ is dict or child.__class__ is list:
+                push(child)
+    return order
+
+def subtree_digests(order: list, ignored_keys=frozenset()) -> list:
+    """
+    Merkle digests of containers returned by containers(). Digest of dictionary covers its
+    (sorted) keys and digests or values of its children, so two subtrees with equal digests are equal
+    regardless of key order. Keys in ignored_keys don't affect digests at any depth.
+    """
+    hashes = {}
+    digests = [None] * len(order)
+    blake2b = hashlib.blake2b
+    #children come after their parent in pre-order, so going backwards every child is hashed before parent
+    for i in range(len(order) - 1, -1, -1):
+        node = order[i]
+        if node.__class__ is dict:
+            items = [(key, hashes[id(child)] if child.__class__ is dict or child.__class__ is list else child)
+                     for key, child in sorted(node.items()) if key not in ignored_keys]
+            #repr keeps strings, numbers, booleans and nested digests (bytes) apart
+            digest = blake2b(b"d" + repr(items).encode(), digest_size=DIGEST_SIZE).digest()
+        else:
+            items = [hashes[id(child)] if child.__class__ is dict or child.__class__ is list else child for child in node]
+            digest = blake2b(b"l" + repr(items).encode(), digest_size=DIGEST_SIZE).digest()
+        hashes[id(node)] = digest
+        digests[i] = digest
+    return digests
+
+def descendant_counts(order: list) -> list:
+    """
+    Number of dictionaries and lists nested (at any depth) in every container returned by containers().
+    Descendants of container are the ones right after it in pre-order.
+    """
+    sizes = {}
+    counts = [0] * len(order)
+    for i in range(len(order) - 1, -1, -1):
+        node = order[i]
+        count = 0
+        for child in (node.values() if node.__class__ is dict else node):
+            if child.__class__ is dict or child.__class__ is list:
+                count += 1 + sizes[id(child)]
+        sizes[id(node)] = counts[i] = count
+    return counts
+
+def subtree_hashes(value, ignored_keys=frozenset()) -> dict:
+    """
+    Returns {id(container): digest} for every dictionary and list of json value.
+    Ids are only valid while value is alive.
+    """
+    order = containers(value)
+    return dict(zip(map(id, order), subtree_digests(order, ignored_keys)))
+
+def cache_path(path: str, ignored_keys=frozenset()) -> str:
+    stat = os.stat(path)
+    key = repr((FORMAT_VERSION, os.path.abspath(path), stat.st_size, stat.st_mtime_ns, sorted(ignored_keys)))
+    directory = os.path.join(local_state.STATE_DIR, HASH_CACHE_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ".bin")
+
+class CachedDigests(dict):
+    """
+    {id(container): digest} of document whose digests were read from cache. Only root is there
+    at first, containers are added when their parent is expanded, so looking digests up along
+    the compared path never enumerates the whole document. Index of a child in pre-order follows
+    from the index of its parent and descendant counts of its siblings.
+    """
+    def __init__(self, value, data: bytes, count: int):
+        super().__init__()
+        self.data = data
+        self.counts = memoryview(data)[count * DIGEST_SIZE:].cast(COUNT_FORMAT)
+        #containers whose digest is known but children are not yet added: id -> index in pre-order
+        self.positions = {}
+        if count and (value.__class__ is dict or value.__class__ is list):
+            self[id(value)] = data[:DIGEST_SIZE]
+            self.positions[id(value)] = 0
+
+    def expand(self, value) -> None:
+        """
+        Adds digests of dictionaries and lists directly in value, which must be in this mapping.
+        """
+        index = self.positions.pop(id(value), None)
+        if index is None:
+            return
+        data = self.data
+        counts = self.counts
+        positions = self.positions
+        index += 1
+        #containers() pushes children on a stack, so the last child comes first in pre-order
+        for child in reversed(value.values() if value.__class__ is dict else value):
+            if child.__class__ is dict or child.__class__ is list:
+                start = index * DIGEST_SIZE
+                self[id(child)] = data[start:start + DIGEST_SIZE]
+                positions[id(child)] = index
+                index += 1 + counts[index]
+
+def file_hashes(path: str, value, ignored_keys=frozenset()) -> CachedDigests:
+    """
+    Same as subtree_hashes for value loaded from path, but digests (and descendant counts) are
+    cached on disk, so a reference document compared with many others is only hashed once.
+    Digests are added lazily, see CachedDigests. Cache is invalidated when file changes
+    (size or modification time).
+    """
+    cached = cache_path(path, ignored_keys)
+    try:
+        with open(cached, 'rb') as f:
+            data = f.read()
+    except OSError:
+        data = None
+    count = len(data) // (DIGEST_SIZE + COUNT_SIZE) if data else 0
+    if (not count or len(data) != count * (DIGEST_SIZE + COUNT_SIZE)
+            or memoryview(data)[count * DIGEST_SIZE:].cast(COUNT_FORMAT)[0] != count - 1):
+        order = containers(value)
+        count = len(order)
+        data = b"".join(subtree_digests(order, ignored_keys)) + array.array(COUNT_FORMAT, descendant_counts(order)).tobytes()
+        temp_path = f"{cached}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, cached)
+    return CachedDigests(value, data, count)
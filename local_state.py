@@ -0,0 +1,38 @@
+import hashlib
+import json
+import os
+
+#local state (caches, digests, indexes) is kept next to the scripts, not in the database
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
+
+def state_path(file_name: str) -> str:
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, file_name)
+
+def load_state(file_name: str, default=None):
+    """
+    Returns content of json state file, or default if the file doesn't exist or is corrupted.
+    """
+    try:
+        with open(state_path(file_name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_state(file_name: str, data) -> None:
+    """
+    Writes state to a temporary file first and swaps it in, so a crash mid-write
+    never leaves a half written state file behind.
+    """
+    path = state_path(file_name)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+def file_digest(path: str, chunk_size: int = 1 << 16) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
@@ -1,6 +1,5 @@
 import json
 import sys
-import io
 import os
 import eywa
 import asyncio
@@ -9,25 +8,111 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
-from enum import Enum
 import time
 import datetime
-import re
+import argparse
+import functools
+import hashlib
+from dhmz_html import fetch_station_page, parse_observed_hour
+from dhmz_rows import Type, MEASUREMENT_COLUMNS, STATION_TOPIC, TIME_TOPIC, parse_rows
+from dhmz_backfill import backfill
+from measurement_buffer import MeasurementBuffer, flush, flush_forever
+from measurement_store import MeasurementStore
+from station_cache import StationCache
+from transit_model import load_model
+from payload_validator import compile_validator
+from driver_pool import DriverPool, chrome_driver_path
+from local_state import load_state, save_state, file_digest, state_path
+from instrumentation import Metrics
 
 if os.name == 'nt':
     os.system('chcp 65001') #set utf-8 in windows terminal
 
 
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+sys.stdout.reconfigure(encoding='utf-8')
 
 driver_wait_time = 5
-
-class Type(Enum):
-    INT = 0
-    FLOAT = 1
-    STRING = 2
-
+#daemon mode: seconds between scrapes, number of warm browsers and uses before browser is restarted
+scrape_interval = 300
+driver_pool_size = 1
+driver_max_uses = 50
+#bulk purge: deletes packed into one mutation document and number of documents in flight
+delete_batch_size = 100
+delete_concurrency = 4
+#number of rows fetched per search request when paging through results
+fetch_page_size = 500
+#seconds for which a successful deployment check of unchanged dataset file is trusted
+deployment_cache_ttl = 24 * 60 * 60
+
+DATASET_EUUID = "da7acea5-fc8a-4682-98cb-16d936e0c9ee"
+DATASET_FILE = "Neyho_DHMZ_Test_1_2_1.json"
+DEPLOYMENT_STATE_FILE = "deployment.json"
+#send only measurements that changed since previous scrape
+incremental_import = True
+MEASUREMENT_DIGEST_FILE = "measurement_digests.json"
+#measurements are written to local buffer first and sent to eywa by flusher
+buffered_import = True
+#keep columnar copy of measurements for local aggregation queries (measurement_store.py)
+store_locally = True
+#reference stations by cached euuid instead of by name
+reference_stations_by_euuid = True
+#read whole station table with one injected script instead of one script per cell
+bulk_extraction = True
+#stage timings and counters, summary of every run is written to METRICS_FILE
+METRICS_FILE = "metrics_last_run.json"
+metrics = Metrics()
+#totals since process start, written in Prometheus text format if prometheus_file is set
+process_metrics = Metrics()
+prometheus_file = None
+
+STATION_TABLE_XPATH = '//table[@class="fd-c-table1 table--aktualni-podaci sortable"]'
+
+CELL_TEXT_SCRIPT = """
+    let clone = arguments[0].cloneNode(true);
+    const tagsToRemove = ['SUP'];
+    tagsToRemove.forEach(tag => {
+        clone.querySelectorAll(tag).forEach(e => e.remove());
+    });
+    return clone.textContent.trim();
+"""
+
+TABLE_TEXT_SCRIPT = """
+    const table = document.evaluate(arguments[0], document, null,
+                                    XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (!table || !table.tBodies.length) {
+        return null;
+    }
+    return Array.from(table.tBodies[0].rows).map(row =>
+        Array.from(row.querySelectorAll(':scope > td')).map(cell => {
+            let clone = cell.cloneNode(true);
+            clone.querySelectorAll('SUP').forEach(e => e.remove());
+            return clone.textContent.trim();
+        })
+    ).filter(cells => cells.length);
+"""
+
+PAGE_TEXT_SCRIPT = "return document.body ? document.body.innerText : '';"
+
+class WebDriverStats:
+    """
+    Counts WebDriver round-trips (every call goes over HTTP to chromedriver) and time spent in them.
+    """
+    def __init__(self):
+        self.round_trips = 0
+        self.seconds = 0.0
+
+    def call(self, function, *args):
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.round_trips += 1
+            self.seconds += time.perf_counter() - start
+
+    def __str__(self):
+        return f"{self.round_trips} WebDriver round-trips in {self.seconds:.3f} s"
+
+@metrics.timed("driver_setup")
 def setup_driver(headless = False):
     chrome_options = Options()
 
@@ -47,36 +132,13 @@ def setup_driver(headless = False):
     if not headless:
         chrome_options.add_argument('--start-maximized')
 
-    # Auto-install ChromeDriver
+    # Auto-install ChromeDriver (resolved once per process)
     # eywa.info("Setting up ChromeDriver...")
-    service = Service(ChromeDriverManager().install())
+    service = Service(chrome_driver_path())
     driver = webdriver.Chrome(service=service, options=chrome_options)
 
     return driver
 
-def format_sending_data(cells_text_array):
-    data = {}
-    topics = ["wind_direction", "wind_velocity", "air_temperature",
-              "relative_moisture", "air_pressure", "air_tendency",
-              "weather_state", "time"]
-    types = [Type.STRING, Type.STRING, Type.FLOAT, Type.FLOAT, Type.INT, Type.FLOAT, Type.FLOAT, Type.STRING]
-
-    data["station"] = {"name": cells_text_array[0]}
-    for i in range(1, len(cells_text_array)):
-        #clean input
-        cleaned = re.sub(r'[^a-zA-Z0-9.čžšČŽŠ\-\s]','',cells_text_array[i]).strip()
-        if (not cleaned or cleaned == '-'):
-            continue
-        elif (types[i] == Type.FLOAT):
-            # print(f"{cleaned} will be float")
-            cleaned = float(cleaned.replace('\u2212', '-'))
-        elif (types[i] == Type.INT):
-            cleaned = int(cleaned)
-        data[topics[i - 1]] = cleaned
-    data[topics[-1]] = datetime.datetime.fromtimestamp(time.time(), datetime.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
-    # print(f"DATA: {data}")
-    return data
-
 async def import_measures(data):
     return await eywa.graphql("""
     mutation($measurements:[MeasurementInput])
@@ -89,6 +151,43 @@ async def import_measures(data):
     
     """, {"measurements": data})
 
+def measurement_digest(data):
+    values = {topic: value for topic, value in data.items() if topic not in ("station", "time")}
+    return hashlib.sha1(json.dumps(values, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def filter_changed_measurements(data_array, observed_hour=None):
+    """
+    Drops measurements whose values and observation hour are the same as the ones sent for that
+    station in previous scrape. When observation hour is not known nothing is dropped, otherwise
+    a newly published hour with the same readings would never be stored.
+
+    Returns:
+      Tuple of (changed measurements, digest state to save with save_measurement_digests
+      once the changed measurements are imported, stats for this scrape).
+    """
+    state = load_state(MEASUREMENT_DIGEST_FILE, {})
+    stations = dict(state.get("stations", {}))
+    totals = state.get("totals", {"sent": 0, "skipped": 0})
+    changed = []
+    for data in data_array:
+        name = data.get("station", {}).get("name")
+        digest = measurement_digest(data)
+        previous = stations.get(name)
+        if (observed_hour is not None and previous and previous.get("digest") == digest
+                and previous.get("hour") == observed_hour):
+            continue
+        stations[name] = {"digest": digest, "hour": observed_hour}
+        changed.append(data)
+
+    stats = {"sent": len(changed), "skipped": len(data_array) - len(changed)}
+    new_state = {"stations": stations,
+                 "totals": {"sent": totals.get("sent", 0) + stats["sent"],
+                            "skipped": totals.get("skipped", 0) + stats["skipped"]}}
+    return changed, new_state, stats
+
+def save_measurement_digests(state):
+    save_state(MEASUREMENT_DIGEST_FILE, state)
+
 async def fetch_all_measurements():
     return await eywa.graphql("""
     {
@@ -100,15 +199,9 @@ async def fetch_all_measurements():
     """)
 
 async def delete_all_measurements(measurements_list):
-    for element in measurements_list:
-        euuid = element.get("euuid", {})
-        await eywa.graphql("""
-        mutation($euuid:UUID)
-        {
-            deleteMeasurement(euuid:$euuid)
-        }
-        """, {"euuid": euuid})
-    print("ALL VALUES DELETED")
+    result = await delete_entities("deleteMeasurement", [element.get("euuid") for element in measurements_list])
+    print("ALL VALUES DELETED" if not result["errors"] else f"FAILED TO DELETE {result['failed']} VALUES")
+    return result
 
 async def fetch_all_stations():
     return await eywa.graphql("""
@@ -121,20 +214,154 @@ async def fetch_all_stations():
     """)
 
 async def delete_all_stations(stations_list):
-    for element in stations_list:
-        euuid = element.get("euuid", {})
-        await eywa.graphql("""
-        mutation($euuid: UUID)
-        {
-            deleteStation(euuid:$euuid)
-        }
-        """, {"euuid": euuid})
+    return await delete_entities("deleteStation", [element.get("euuid") for element in stations_list])
+
+@functools.lru_cache(maxsize=None)
+def build_delete_document(mutation_name, count):
+    """
+    Mutation document that deletes count entities at once, every delete is aliased (d0, d1, ...)
+    and takes its euuid from variable with the same index (e0, e1, ...).
+    """
+    variables = ", ".join(f"$e{i}: UUID" for i in range(count))
+    deletes = "\n".join(f"        d{i}: {mutation_name}(euuid: $e{i})" for i in range(count))
+    return f"""
+    mutation({variables})
+    {{
+{deletes}
+    }}
+    """
+
+async def delete_entities(mutation_name, euuids, batch_size=None, concurrency=None, graphql=None, progress=print):
+    """
+    Deletes entities using mutation_name (e.g. deleteMeasurement) in batches of batch_size deletes
+    per request, with at most concurrency requests in flight. euuids can be a list or an async
+    iterable (e.g. from iter_entities), batches are sent while later euuids are still being fetched.
+
+    Returns:
+      Dictionary with number of round-trips, deleted and failed euuids and per-batch errors.
+    """
+    batch_size = batch_size or delete_batch_size
+    graphql = graphql or eywa.graphql
+    semaphore = asyncio.Semaphore(concurrency or delete_concurrency)
+    total = len(euuids) if isinstance(euuids, (list, tuple)) else None
+    result = {"total": 0, "round_trips": 0, "deleted": 0, "failed": 0, "errors": []}
+
+    async def delete_batch(batch_number, batch):
+        try:
+            variables = {f"e{i}": euuid for i, euuid in enumerate(batch)}
+            result["round_trips"] += 1
+            try:
+                response = await graphql(build_delete_document(mutation_name, len(batch)), variables)
+                errors = (response or {}).get("errors")
+            except Exception as e:
+                errors = str(e)
+        finally:
+            semaphore.release()
+        if errors:
+            result["failed"] += len(batch)
+            result["errors"].append({"batch": batch_number, "euuids": batch, "error": errors})
+        else:
+            result["deleted"] += len(batch)
+        if progress:
+            progress(f"{mutation_name}: {result['deleted'] + result['failed']}/{total or result['total']} processed, "
+                     f"{result['failed']} failed")
+
+    tasks = []
+    batch = []
+    async for euuid in iterate(euuids):
+        if not euuid:
+            continue
+        result["total"] += 1
+        batch.append(euuid)
+        if len(batch) == batch_size:
+            #waiting here keeps at most concurrency batches in memory when euuids are streamed
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(delete_batch(len(tasks), batch)))
+            batch = []
+    if batch:
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(delete_batch(len(tasks), batch)))
+    await asyncio.gather(*tasks)
+    return result
+
+async def iterate(items):
+    """
+    Iterates over regular or async iterable.
+    """
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+@functools.lru_cache(maxsize=None)
+def build_search_document(search_name, fields, after):
+    """
+    Search query for one page ordered by euuid. Pages after the first one continue
+    from the last euuid of the previous page (keyset pagination), so rows deleted
+    in the meantime don't shift the pages like _offset would.
+    """
+    where = ", _where: {euuid: {_gt: $after}}" if after else ""
+    return f"""
+    query($limit: Int{", $after: UUID" if after else ""})
+    {{
+        {search_name}(_limit: $limit, _order_by: {{euuid: asc}}{where})
+        {{
+            {fields}
+        }}
+    }}
+    """
+
+async def iter_entities(search_name, fields="euuid", page_size=None, graphql=None):
+    """
+    Async generator that yields rows of search_name (e.g. searchMeasurement) page by page.
+    Request for the next page is sent before rows of the current page are yielded,
+    so the caller works on one page while the next one is in flight.
+    """
+    page_size = page_size or fetch_page_size
+    graphql = graphql or eywa.graphql
+    if "euuid" not in fields.split():
+        fields = f"euuid {fields}"
+
+    async def fetch_page(after):
+        variables = {"limit": page_size}
+        if after:
+            variables["after"] = after
+        response = await graphql(build_search_document(search_name, fields, after is not None), variables)
+        return (response or {}).get("data", {}).get(search_name) or []
+
+    page = await fetch_page(None)
+    while page:
+        next_page = asyncio.create_task(fetch_page(page[-1].get("euuid"))) if len(page) == page_size else None
+        try:
+            for row in page:
+                yield row
+        except BaseException:
+            if next_page:
+                next_page.cancel()
+            raise
+        page = await next_page if next_page else []
+
+def iter_measurements(fields="euuid", page_size=None):
+    return iter_entities("searchMeasurement", fields, page_size)
+
+def iter_stations(fields="euuid", page_size=None):
+    return iter_entities("searchStation", fields, page_size)
+
+async def purge_measurements():
+    return await delete_entities("deleteMeasurement", (row.get("euuid") async for row in iter_measurements()))
+
+async def purge_stations():
+    result = await delete_entities("deleteStation", (row.get("euuid") async for row in iter_stations()))
+    StationCache(eywa.graphql).clear()
+    return result
 
 async def check_if_model_deployed():
     result = await eywa.graphql("""
-    query
+    query($euuid: UUID)
     {
-      searchDatasetVersion(_where:{euuid: {_eq: "da7acea5-fc8a-4682-98cb-16d936e0c9ee"}})
+      searchDatasetVersion(_where:{euuid: {_eq: $euuid}})
       {
         euuid
         name
@@ -145,19 +372,18 @@ async def check_if_model_deployed():
         deployed
       }
     }
-    """)
+    """, {"euuid": DATASET_EUUID})
 
-    temp = result.get("data", {}).get("searchDatasetVersion", {})
+    temp = ((result or {}).get("data") or {}).get("searchDatasetVersion") or []
     if not temp:
         return False
-    elif temp[0].get("deployed", {}) == True:
-        print(temp[0].get("deployed", {}) == True)
-        return True
-    print(temp[0].get("deployed", {}) == True)
+    deployed = temp[0].get("deployed") == True
+    print(deployed)
+    return deployed
 
 async def deploy_model():
     dataset = None
-    with open("Neyho_DHMZ_Test_1_2_1.json") as file:
+    with open(DATASET_FILE) as file:
         dataset = file.read()
     # print(dataset)
     return await eywa.graphql("""
@@ -170,59 +396,304 @@ async def deploy_model():
     }
     """, {"dataset": dataset})
 
-async def main():
-    eywa.open_pipe()
+async def deploy_and_verify():
+    """
+    Deploys the dataset model and checks that eywa reports it as deployed.
+    """
+    result = await deploy_model()
+    errors = (result or {}).get("errors")
+    if errors:
+        print(f"MODEL DEPLOYMENT FAILED: {errors}")
+        return False
+    if not await check_if_model_deployed():
+        print("MODEL NOT DEPLOYED AFTER IMPORT")
+        return False
+    return True
+
+async def ensure_model_deployed():
+    """
+    Deploys the dataset model if needed. Result is cached per dataset euuid together with hash of
+    the dataset file, so while the file is unchanged and cache is younger than deployment_cache_ttl
+    no request is sent. Changed file is always re-imported. Only verified deployment is cached.
+
+    Returns:
+      True if model is deployed.
+    """
+    dataset_hash = file_digest(DATASET_FILE)
+    cache = load_state(DEPLOYMENT_STATE_FILE, {})
+    cached = cache.get(DATASET_EUUID)
+    if cached and cached.get("hash") == dataset_hash and time.time() - cached.get("checked_at", 0) < deployment_cache_ttl:
+        print("Model deployment cached")
+        return True
 
-    link = "https://meteo.hr/naslovnica_aktpod.php?tab=aktpod"
-    data_array = []
+    if cached and cached.get("hash") != dataset_hash:
+        print("Dataset file changed, deploying model")
+        deployed = await deploy_and_verify()
+    elif not await check_if_model_deployed():
+        print("Deploying model")
+        deployed = await deploy_and_verify()
+    else:
+        print("Model already deployed")
+        deployed = True
+    if deployed:
+        cache[DATASET_EUUID] = {"hash": dataset_hash, "checked_at": time.time()}
+        save_state(DEPLOYMENT_STATE_FILE, cache)
+    return deployed
+
+MODEL_TYPES = {Type.INT: "int", Type.FLOAT: "float", Type.STRING: "string"}
+
+def check_measurement_schema():
+    """
+    Compares topics and types that parse_rows produces with Measurement entity in dataset file.
+    """
+    model = load_model(DATASET_FILE)
+    fields = {column.name: MODEL_TYPES[column.type] for column in MEASUREMENT_COLUMNS}
+    fields[TIME_TOPIC] = "timestamp"
+    fields[STATION_TOPIC] = None
+    problems = model.check_fields("Measurement", fields)
+    for field, problem in problems.items():
+        print(f"SCHEMA MISMATCH {field}: {problem}")
+    return not problems
+
+@functools.cache
+def measurement_validator():
+    return compile_validator(load_model(DATASET_FILE), "Measurement")
+
+def validate_measurements(data_array):
+    """
+    Drops measurements that don't match Measurement in dataset model, so one bad row
+    doesn't get the whole stackMeasurementList rejected.
+    """
+    valid, rejected = measurement_validator()(data_array)
+    for rejection in rejected:
+        print(f"REJECTED {rejection['row'].get('station')}: {'; '.join(rejection['reasons'])}")
+    return valid
+
+def scrape_station_rows(link, pool=None):
+    """
+    Loads link in browser and returns tuple (text of every station table cell (without <sup> content)
+    or None if page didn't load, observation hour or None). Browser is taken from pool if one is passed,
+    otherwise new browser is started and quit afterwards.
+    """
+    if pool is not None:
+        with pool.session() as driver:
+            return read_station_table(driver, link)
 
     driver = setup_driver()
-
-    driver.get(link)
-    wait = WebDriverWait(driver, driver_wait_time)
-
-    #wait until whole page is loaded
     try:
-        wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-    except:
-        print("PAGE NOT LOADED SUCCESSFULLY")
-        return
+        return read_station_table(driver, link)
+    finally:
+        driver.quit()
+
+def read_station_table(driver, link):
+    with metrics.span("page_load"):
+        driver.get(link)
+        wait = WebDriverWait(driver, driver_wait_time)
+
+        #wait until whole page is loaded
+        try:
+            wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
+        except:
+            print("PAGE NOT LOADED SUCCESSFULLY")
+            return None, None
+
+    stats = WebDriverStats()
+    with metrics.span("table_traversal"):
+        if bulk_extraction:
+            rows_text = stats.call(driver.execute_script, TABLE_TEXT_SCRIPT, STATION_TABLE_XPATH)
+        else:
+            rows_text = extract_rows_per_cell(driver, stats)
+        page_text = stats.call(driver.execute_script, PAGE_TEXT_SCRIPT)
+    metrics.count("webdriver_round_trips", stats.round_trips)
+    print(f"Station table read with {stats}")
+    return rows_text, parse_observed_hour(page_text or "")
+
+def extract_rows_per_cell(driver, stats):
+    table = stats.call(driver.find_element, By.XPATH, STATION_TABLE_XPATH)
+    table_body = stats.call(table.find_element, By.XPATH, "./tbody")
+    rows = stats.call(table_body.find_elements, By.TAG_NAME, "tr")
+
+    rows_text = []
+    for row in rows:
+        cells = stats.call(row.find_elements, By.TAG_NAME, "td")
+        rows_text.append([stats.call(driver.execute_script, CELL_TEXT_SCRIPT, cell) for cell in cells])
+    return rows_text
+
+async def scrape_and_import(link, pool=None, buffer=None):
+    """
+    Scrapes station table and imports measurements. If buffer is passed, measurements are only
+    appended to it and sending is left to the flusher, so scrape doesn't wait for eywa.
+    """
+    #static page doesn't need a browser, selenium is used only if table is missing from plain HTML,
+    #both block, so they run in a thread and the event loop (flusher) keeps going meanwhile
+    with metrics.span("http_fetch"):
+        rows_text, observed_hour = await asyncio.to_thread(fetch_station_page, link)
+    if rows_text is None:
+        print("Station table not found over HTTP, falling back to selenium")
+        metrics.count("selenium_fallbacks")
+        rows_text, observed_hour = await asyncio.to_thread(scrape_station_rows, link, pool)
+    if rows_text is None:
+        metrics.count("failed_scrapes")
+        return False
 
-    if await check_if_model_deployed() == False:
-        print("Deploying model")
-        await deploy_model()
-    else:
-        print("Model already deployed")
+    with metrics.span("parse"):
+        parsed = parse_rows(rows_text)
+        data_array = validate_measurements(parsed)
+    metrics.count("rows_scraped", len(parsed))
+    metrics.count("rows_rejected", len(parsed) - len(data_array))
+
+    digest_state = None
+    if incremental_import:
+        if observed_hour is None:
+            print("OBSERVATION HOUR NOT FOUND ON PAGE, SENDING ALL ROWS")
+        data_array, digest_state, stats = filter_changed_measurements(
+            data_array, observed_hour.isoformat() if observed_hour else None)
+        metrics.count("rows_skipped", stats["skipped"])
+        print(f"{stats['sent']} station rows changed, {stats['skipped']} unchanged rows skipped")
+
+    if store_locally:
+        with metrics.span("local_store"):
+            MeasurementStore().append(data_array)
+
+    if reference_stations_by_euuid and data_array:
+        try:
+            with metrics.span("station_lookup"):
+                data_array = await StationCache(eywa.graphql).reference(data_array)
+        except Exception as e:
+            #names are still valid station references, only slower to resolve on server
+            print(f"FAILED TO RESOLVE STATIONS: {e}")
+
+    if buffer is not None:
+        with metrics.span("buffer_append"):
+            buffer.append(data_array)
+        if digest_state is not None:
+            save_measurement_digests(digest_state)
+        metrics.count("rows_buffered", len(data_array))
+        print(f"BUFFERED {len(data_array)} MEASUREMENTS")
+        #observations are already on disk, failing deployment check only delays sending them
+        try:
+            with metrics.span("deployment_check"):
+                await ensure_model_deployed()
+        except Exception as e:
+            print(f"DEPLOYMENT CHECK FAILED: {e}")
+        return True
 
-    table = driver.find_element(By.XPATH, '//table[@class="fd-c-table1 table--aktualni-podaci sortable"]')
-    table_body = table.find_element(By.XPATH, "./tbody")
-    rows = table_body.find_elements(By.TAG_NAME, "tr")
+    with metrics.span("deployment_check"):
+        await ensure_model_deployed()
+    if data_array:
+        with metrics.span("import_measures"):
+            response = await import_measures(data_array)
+        errors = (response or {}).get("errors")
+        if errors:
+            metrics.count("failed_imports")
+            print(f"FAILED TO IMPORT MEASUREMENTS: {errors}")
+            return False
+        metrics.count("rows_sent", len(data_array))
+        print("IMPORTED MEASUREMENTS TO DB")
+    #digests are saved only after successful import, so rows of a failed import are sent again next time
+    if digest_state is not None:
+        save_measurement_digests(digest_state)
+    return True
+
+def export_metrics():
+    """
+    Writes summary of the finished run and starts a new one.
+    """
+    summary = metrics.summary()
+    metrics.write_json(state_path(METRICS_FILE))
+    process_metrics.merge(metrics)
+    if prometheus_file:
+        process_metrics.write_prometheus(prometheus_file)
+    stages = ", ".join(f"{stage} {timing['sum']:.3f} s" for stage, timing in summary["stages"].items())
+    print(f"Run took {summary['seconds']:.3f} s: {stages}")
+    metrics.reset()
 
-    for row in rows:
-        cells = row.find_elements(By.TAG_NAME, "td")
-        cells_text = [driver.execute_script("""
-                    let clone = arguments[0].cloneNode(true);
-                    const tagsToRemove = ['SUP'];
-                    tagsToRemove.forEach(tag => {
-                        clone.querySelectorAll(tag).forEach(e => e.remove());
-                    });
-                    return clone.textContent.trim();
-                """, cell) for cell in cells]
-        data_array.append(format_sending_data(cells_text))
-    await import_measures(data_array)
-    print("IMPORTED MEASUREMENTS TO DB")
+async def main():
+    eywa.open_pipe()
+
+    link = "https://meteo.hr/naslovnica_aktpod.php?tab=aktpod"
+    buffer = MeasurementBuffer() if buffered_import else None
+    metrics.reset()
+    try:
+        check_measurement_schema()
+        with metrics.span("scrape"):
+            await scrape_and_import(link, buffer=buffer)
+        if buffer is not None:
+            with metrics.span("buffer_flush"):
+                stats = await flush(buffer, import_measures)
+            metrics.count("rows_sent", stats["sent"])
+            print(f"IMPORTED {stats['sent']} MEASUREMENTS TO DB, {stats['pending']} STILL BUFFERED")
+    finally:
+        if buffer is not None:
+            buffer.close()
+        export_metrics()
+        eywa.exit()
 
     # #DELETING ALL STATIONS
-    # all_station_euuids = await fetch_all_stations()
-    # await delete_all_stations(all_station_euuids.get("data", {}).get("searchStation", {}))
+    # await purge_stations()
     #
     # #DELETING ALL MEASUREMENTS
-    # all_measurement_euuids = await fetch_all_measurements()
-    # await delete_all_measurements(all_measurement_euuids.get("data", {}).get("searchMeasurement", {}))
-
-    driver.quit()
-    eywa.exit()
+    # await purge_measurements()
     return
 
+async def run_daemon(interval=scrape_interval, pool_size=driver_pool_size, max_uses=driver_max_uses):
+    """
+    Scrapes every interval seconds, browsers (when needed) are kept warm in a pool between scrapes
+    and buffered measurements are sent in background.
+    """
+    eywa.open_pipe()
+
+    link = "https://meteo.hr/naslovnica_aktpod.php?tab=aktpod"
+    pool = DriverPool(lambda: setup_driver(headless=True), size=pool_size, max_uses=max_uses)
+    buffer = MeasurementBuffer() if buffered_import else None
+    flusher = asyncio.create_task(flush_forever(buffer, import_measures, interval)) if buffer is not None else None
+    try:
+        check_measurement_schema()
+        #browser is started before the first scrape, in a thread so the flusher isn't held up
+        try:
+            with metrics.span("pool_warm"):
+                await asyncio.to_thread(pool.warm)
+        except Exception as e:
+            print(f"FAILED TO WARM BROWSER POOL: {e}")
+        while True:
+            started = time.monotonic()
+            try:
+                with metrics.span("scrape"):
+                    await scrape_and_import(link, pool, buffer)
+            except Exception as e:
+                metrics.count("failed_scrapes")
+                print(f"SCRAPE FAILED: {e}")
+            export_metrics()
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        if flusher is not None:
+            flusher.cancel()
+            buffer.close()
+        pool.close()
+        eywa.exit()
+
+async def run_backfill(start, end):
+    eywa.open_pipe()
+    try:
+        await ensure_model_deployed()
+        await backfill(start, end, import_measures, validate=validate_measurements)
+    finally:
+        eywa.exit()
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrapes DHMZ station measurements and imports them to eywa.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and scrape periodically")
+    parser.add_argument("--interval", type=float, default=scrape_interval, help="seconds between scrapes in daemon mode")
+    parser.add_argument("--prometheus-file", help="write metrics in Prometheus text format to this file after every run")
+    parser.add_argument("--backfill-from", type=datetime.datetime.fromisoformat,
+                        help="import historical hourly data starting at this date/time (UTC)")
+    parser.add_argument("--backfill-to", type=datetime.datetime.fromisoformat,
+                        help="last date/time (UTC) to backfill, defaults to now")
+    args = parser.parse_args()
+    prometheus_file = args.prometheus_file
+    if args.backfill_from:
+        asyncio.run(run_backfill(args.backfill_from, args.backfill_to or datetime.datetime.now(datetime.UTC)))
+    elif args.daemon:
+        asyncio.run(run_daemon(args.interval))
+    else:
+        asyncio.run(main())
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+
+from local_state import state_path
+
+BUFFER_FILE = "measurement_buffer.sqlite3"
+
+flush_batch_size = 500
+flush_retries = 5
+#seconds, doubled after every failed attempt up to flush_max_backoff
+flush_backoff = 1.0
+flush_max_backoff = 60.0
+
+class MeasurementBuffer:
+    """
+    Append-only on-disk buffer of measurements waiting to be sent to eywa.
+
+    Every measurement gets its own euuid when it's appended, so sending the same rows again
+    after a failure (or crash between send and remove) updates them instead of creating duplicates.
+    Measurements that eywa keeps rejecting are moved to dead_letters table together with the error.
+    """
+    def __init__(self, path=None):
+        self.path = path or state_path(BUFFER_FILE)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pending (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                euuid TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY,
+                euuid TEXT UNIQUE NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                error TEXT,
+                rejected_at REAL NOT NULL
+            )""")
+        self.connection.commit()
+        self.appended = asyncio.Event()
+
+    def append(self, measurements):
+        rows = []
+        now = time.time()
+        for data in measurements:
+            if not data.get("euuid"):
+                data = {**data, "euuid": str(uuid.uuid4())}
+            rows.append((data["euuid"], json.dumps(data, ensure_ascii=False), now))
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO pending (euuid, payload, created_at) VALUES (?, ?, ?)", rows)
+        self.appended.set()
+        return len(rows)
+
+    def peek(self, limit):
+        """
+        Returns oldest (ids, measurements) without removing them.
+        """
+        rows = self.connection.execute(
+            "SELECT id, payload FROM pending ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+
+    def remove(self, ids):
+        with self.connection:
+            self.connection.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+
+    def dead_letter(self, ids, error):
+        """
+        Moves measurements from pending to dead_letters.
+        """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("""
+                INSERT OR REPLACE INTO dead_letters (id, euuid, payload, created_at, error, rejected_at)
+                SELECT id, euuid, payload, created_at, ?, ? FROM pending WHERE id = ?
+                """, [(str(error), now, i) for i in ids])
+            self.connection.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+
+    def dead_letters(self):
+        """
+        Returns list of (measurement, error) that were moved to dead letters.
+        """
+        return [(json.loads(payload), error) for payload, error in
+                self.connection.execute("SELECT payload, error FROM dead_letters ORDER BY id")]
+
+    def requeue_dead_letters(self):
+        """
+        Moves dead letters back to pending (e.g. after the model was fixed), returns their number.
+        """
+        with self.connection:
+            count = self.connection.execute("""
+                INSERT OR REPLACE INTO pending (euuid, payload, created_at)
+                SELECT euuid, payload, created_at FROM dead_letters ORDER BY id
+                """).rowcount
+            self.connection.execute("DELETE FROM dead_letters")
+        if count:
+            self.appended.set()
+        return count
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+async def send_batch(send, batch, retries, delay, stats, retry_rejected=True):
+    """
+    Sends batch, failed attempt is retried with exponential backoff. Rejected batch (response
+    has errors) is retried only if retry_rejected is set, eywa could be failing as a whole.
+
+    Returns:
+      Tuple ("sent", None), ("rejected", errors) or ("failed", exception).
+    """
+    attempt = 0
+    while True:
+        try:
+            response = await send(batch)
+        except Exception as e:
+            outcome, error = "failed", e
+        else:
+            errors = (response or {}).get("errors") if isinstance(response, dict) else None
+            if not errors:
+                return "sent", None
+            outcome, error = "rejected", errors
+            if not retry_rejected:
+                return outcome, error
+        stats["failed_attempts"] += 1
+        attempt += 1
+        if attempt > retries:
+            return outcome, error
+        wait = min(delay * 2 ** (attempt - 1), flush_max_backoff)
+        print(f"Failed to send {len(batch)} buffered measurements ({error}), retrying in {wait:.1f} s")
+        await asyncio.sleep(wait)
+
+async def isolate_rejected(buffer, send, ids, batch, errors, retries, delay, stats):
+    """
+    Splits rejected batch in halves until the rejected measurements are found: accepted parts are
+    removed from the buffer, rejected single measurements are moved to dead letters.
+
+    Returns:
+      False if sending failed (send raised) and flushing should stop.
+    """
+    rejected = [(ids, batch, errors)]
+    while rejected:
+        part_ids, part, errors = rejected.pop()
+        if len(part) == 1:
+            buffer.dead_letter(part_ids, errors)
+            stats["dead_letters"] += 1
+            print(f"Measurement {part[0].get('euuid')} rejected, moved to dead letters: {errors}")
+            continue
+        middle = len(part) // 2
+        halves = [(part_ids[:middle], part[:middle]), (part_ids[middle:], part[middle:])]
+        for half_ids, half in halves:
+            outcome, error = await send_batch(send, half, retries, delay, stats, retry_rejected=False)
+            if outcome == "failed":
+                print(f"Giving up flushing measurement buffer: {error}")
+                return False
+            if outcome == "sent":
+                buffer.remove(half_ids)
+                stats["sent"] += len(half)
+                stats["batches"] += 1
+            else:
+                rejected.append((half_ids, half, error))
+    return True
+
+async def flush(buffer, send, batch_size=None, retries=None, backoff=None):
+    """
+    Drains buffer through send (e.g. main.import_measures) in batches, oldest first.
+    Failed batch is retried with exponential backoff; after retries failed attempts flushing
+    stops and the rest stays in the buffer for the next flush. Batch that eywa still rejects
+    after retries is split until the rejected measurements are found, they are moved to dead
+    letters so one bad row doesn't block everything behind it.
+
+    Returns:
+      Dictionary with number of sent measurements, batches, failed attempts, dead letters and
+      measurements still pending.
+    """
+    batch_size = batch_size or flush_batch_size
+    retries = flush_retries if retries is None else retries
+    delay = flush_backoff if backoff is None else backoff
+    stats = {"sent": 0, "batches": 0, "failed_attempts": 0, "dead_letters": 0, "pending": 0}
+    while True:
+        ids, batch = buffer.peek(batch_size)
+        if not batch:
+            break
+        outcome, error = await send_batch(send, batch, retries, delay, stats)
+        if outcome == "failed":
+            print(f"Giving up flushing measurement buffer after {retries + 1} attempts: {error}")
+            break
+        if outcome == "rejected":
+            if not await isolate_rejected(buffer, send, ids, batch, error, retries, delay, stats):
+                break
+            continue
+        buffer.remove(ids)
+        stats["sent"] += len(batch)
+        stats["batches"] += 1
+    stats["pending"] = len(buffer)
+    return stats
+
+async def flush_forever(buffer, send, interval=30.0, **flush_options):
+    """
+    Background flusher, drains the buffer whenever something is appended (or every interval seconds).
+    """
+    while True:
+        buffer.appended.clear()
+        stats = await flush(buffer, send, **flush_options)
+        if stats["sent"] or stats["pending"] or stats["dead_letters"]:
+            print(f"Flushed {stats['sent']} buffered measurements, {stats['pending']} pending, "
+                  f"{stats['dead_letters']} moved to dead letters")
+        try:
+            await asyncio.wait_for(buffer.appended.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,222 @@
+import datetime
+import json
+import os
+import uuid
+
+import numpy as np
+
+from dhmz_rows import MEASUREMENT_COLUMNS, STATION_TOPIC, TIME_TOPIC, Type
+from local_state import state_path
+
+STORE_DIR = "measurements"
+DICTIONARY_FILE = "dictionaries.json"
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+#numeric topics are stored as float64 (NaN where value is missing),
+#string topics and station names as int32 codes into dictionaries (-1 where missing)
+NUMERIC_TOPICS = tuple(c.name for c in MEASUREMENT_COLUMNS if c.type != Type.STRING)
+STRING_TOPICS = (STATION_TOPIC,) + tuple(c.name for c in MEASUREMENT_COLUMNS if c.type == Type.STRING)
+
+def parse_time(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        moment = value if value.tzinfo else value.replace(tzinfo=datetime.UTC)
+        return int(moment.timestamp())
+    return int(datetime.datetime.strptime(value, TIME_FORMAT).replace(tzinfo=datetime.UTC).timestamp())
+
+def day_of(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.UTC).strftime('%Y-%m-%d')
+
+class MeasurementStore:
+    """
+    Local columnar copy of Measurement rows, partitioned by day.
+
+    Every append writes one chunk file per day (<root>/<day>/<chunk>.npz), compact() merges
+    chunks of a day into a single file. Append compacts days before the newest one on its own,
+    so only the current day is kept in many chunks. Queries load only the days in the requested range
+    and aggregate with numpy, without going through eywa.
+    """
+    def __init__(self, root=None):
+        self.root = root or os.path.join(os.path.dirname(state_path(DICTIONARY_FILE)), STORE_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self._dictionary_path = os.path.join(self.root, DICTIONARY_FILE)
+        try:
+            with open(self._dictionary_path, 'r', encoding='utf-8') as f:
+                self.dictionaries = json.load(f)
+        except (OSError, ValueError):
+            self.dictionaries = {}
+        self._codes = {topic: {value: code for code, value in enumerate(values)}
+                       for topic, values in self.dictionaries.items()}
+
+    def _encode(self, topic, value):
+        if value is None:
+            return -1
+        codes = self._codes.setdefault(topic, {})
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.dictionaries.setdefault(topic, []).append(value)
+        return code
+
+    def _save_dictionaries(self):
+        temp_path = f"{self._dictionary_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.dictionaries, f, ensure_ascii=False)
+        os.replace(temp_path, self._dictionary_path)
+
+    def append(self, measurements):
+        """
+        Stores MeasurementInput dicts (as produced by dhmz_rows.parse_rows).
+        """
+        if not measurements:
+            return 0
+        stored_days = self.days()
+        times = np.fromiter((parse_time(m[TIME_TOPIC]) for m in measurements), dtype=np.int64, count=len(measurements))
+        columns = {TIME_TOPIC: times}
+        columns[STATION_TOPIC] = np.fromiter(
+            (self._encode(STATION_TOPIC, m.get(STATION_TOPIC, {}).get("name")) for m in measurements),
+            dtype=np.int32, count=len(measurements))
+        for topic in STRING_TOPICS[1:]:
+            columns[topic] = np.fromiter((self._encode(topic, m.get(topic)) for m in measurements),
+                                         dtype=np.int32, count=len(measurements))
+        for topic in NUMERIC_TOPICS:
+            columns[topic] = np.array([m.get(topic, np.nan) for m in measurements], dtype=np.float64)
+        self._save_dictionaries()
+
+        days = (times // 86400) * 86400
+        written = []
+        for day_start in np.unique(days):
+            mask = days == day_start
+            written.append(day_of(int(day_start)))
+            directory = os.path.join(self.root, written[-1])
+            os.makedirs(directory, exist_ok=True)
+            np.savez(os.path.join(directory, f"chunk-{uuid.uuid4().hex}.npz"),
+                     **{topic: values[mask] for topic, values in columns.items()})
+        #days before the newest one are closed: previous newest day when a new day starts
+        #and days that got late measurements, other days are already compacted
+        touched = written + stored_days[-1:]
+        newest = max(touched)
+        for day in sorted(set(touched)):
+            if day < newest:
+                self.compact(day)
+        return len(measurements)
+
+    def days(self, start=None, end=None):
+        first = day_of(parse_time(start)) if start is not None else None
+        last = day_of(parse_time(end)) if end is not None else None
+        return [day for day in sorted(os.listdir(self.root))
+                if os.path.isdir(os.path.join(self.root, day))
+                and (first is None or day >= first) and (last is None or day <= last)]
+
+    def compact(self, day=None):
+        """
+        Merges chunk files of day (or of every day) into one file so queries open fewer files.
+        """
+        for current in ([day] if day else self.days()):
+            directory = os.path.join(self.root, current)
+            chunks = sorted(f for f in os.listdir(directory) if f.endswith(".npz"))
+            if len(chunks) < 2:
+                continue
+            merged = self._load_files([os.path.join(directory, f) for f in chunks])
+            temp_path = os.path.join(directory, "compacting.tmp.npz")
+            np.savez(temp_path, **merged)
+            os.replace(temp_path, os.path.join(directory, f"chunk-{uuid.uuid4().hex}.npz"))
+            for f in chunks:
+                os.remove(os.path.join(directory, f))
+
+    @staticmethod
+    def _load_files(paths, topics=None):
+        parts = {}
+        for path in paths:
+            with np.load(path) as chunk:
+                for topic in (topics or chunk.files):
+                    parts.setdefault(topic, []).append(chunk[topic])
+        return {topic: np.concatenate(values) for topic, values in parts.items()}
+
+    def load(self, start=None, end=None, topics=None):
+        """
+        Returns dict of column arrays for measurements with time in [start, end].
+        """
+        wanted = None if topics is None else list(dict.fromkeys([TIME_TOPIC, STATION_TOPIC, *topics]))
+        paths = [os.path.join(self.root, day, f)
+                 for day in self.days(start, end)
+                 for f in sorted(os.listdir(os.path.join(self.root, day))) if f.endswith(".npz")]
+        if not paths:
+            return {topic: np.empty(0) for topic in (wanted or (TIME_TOPIC, STATION_TOPIC))}
+        columns = self._load_files(paths, wanted)
+        mask = np.ones(len(columns[TIME_TOPIC]), dtype=bool)
+        if start is not None:
+            mask &= columns[TIME_TOPIC] >= parse_time(start)
+        if end is not None:
+            mask &= columns[TIME_TOPIC] <= parse_time(end)
+        return {topic: values[mask] for topic, values in columns.items()}
+
+    def station_name(self, code):
+        return self.dictionaries.get(STATION_TOPIC, [])[code]
+
+    def station_min_max(self, topic, start=None, end=None):
+        """
+        Returns {station name: (min, max)} of numeric topic, missing values are ignored.
+        """
+        columns = self.load(start, end, [topic])
+        values = columns[topic]
+        valid = ~np.isnan(values)
+        stations, values = columns[STATION_TOPIC][valid], values[valid]
+        if not len(values):
+            return {}
+        order = np.argsort(stations, kind="stable")
+        stations, values = stations[order], values[order]
+        codes, starts = np.unique(stations, return_index=True)
+        minimums = np.minimum.reduceat(values, starts)
+        maximums = np.maximum.reduceat(values, starts)
+        return {self.station_name(code): (float(low), float(high))
+                for code, low, high in zip(codes, minimums, maximums)}
+
+    def resample(self, topic, period=86400, start=None, end=None):
+        """
+        Mean of numeric topic per station and period (seconds, aligned to UTC midnight for days).
+
+        Returns:
+          {station name: (period start timestamps, means)}
+        """
+        columns = self.load(start, end, [topic])
+        values = columns[topic]
+        valid = ~np.isnan(values)
+        stations = columns[STATION_TOPIC][valid].astype(np.int64)
+        buckets = (columns[TIME_TOPIC][valid] // period) * period
+        values = values[valid]
+        if not len(values):
+            return {}
+        #one integer key per (station, period) pair groups both at once
+        first = buckets.min() // period
+        span = buckets.max() // period - first + 1
+        keys, inverse = np.unique(stations * span + (buckets // period - first), return_inverse=True)
+        means = np.bincount(inverse, weights=values) / np.bincount(inverse)
+        key_stations, key_buckets = keys // span, (keys % span + first) * period
+        result = {}
+        for code in np.unique(key_stations):
+            selected = key_stations == code
+            result[self.station_name(code)] = (key_buckets[selected], means[selected])
+        return result
+
+    def rolling_mean(self, topic, station, window, start=None, end=None):
+        """
+        Rolling mean over last window measurements of one station, e.g. pressure tendency trend.
+
+        Returns:
+          (timestamps, means), first window - 1 means are NaN.
+        """
+        code = self._codes.get(STATION_TOPIC, {}).get(station)
+        if code is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        columns = self.load(start, end, [topic])
+        selected = (columns[STATION_TOPIC] == code) & ~np.isnan(columns[topic])
+        times, values = columns[TIME_TOPIC][selected], columns[topic][selected]
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+        means = np.full(len(values), np.nan)
+        if len(values) >= window:
+            sums = np.cumsum(np.concatenate(([0.0], values)))
+            means[window - 1:] = (sums[window:] - sums[:-window]) / window
+        return times, means
@@ -0,0 +1,83 @@
+import datetime
+import math
+import re
+
+#timestamps are sent as ISO 8601 strings (see dhmz_rows.scrape_timestamp)
+TIMESTAMP_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?(Z|[+-]\d{2}:?\d{2})?$')
+UUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+def is_string(value):
+    return value.__class__ is str
+
+def is_int(value):
+    return value.__class__ is int
+
+def is_float(value):
+    return (value.__class__ is float and math.isfinite(value)) or value.__class__ is int
+
+def is_boolean(value):
+    return value.__class__ is bool
+
+def is_timestamp(value):
+    return isinstance(value, datetime.datetime) or (value.__class__ is str and TIMESTAMP_PATTERN.match(value) is not None)
+
+def is_uuid(value):
+    return value.__class__ is str and UUID_PATTERN.match(value) is not None
+
+def is_anything(value):
+    return True
+
+#model attribute type -> check, types not listed here (json, enum, encrypted...) aren't checked
+TYPE_CHECKS = {
+    "string": is_string,
+    "int": is_int,
+    "float": is_float,
+    "boolean": is_boolean,
+    "timestamp": is_timestamp,
+    "uuid": is_uuid,
+}
+
+def is_reference(value):
+    return isinstance(value, dict) and bool(value)
+
+def is_reference_list(value):
+    return isinstance(value, list) and all(is_reference(v) for v in value)
+
+def compile_validator(model, entity_name):
+    """
+    Builds validator for rows of entity_name from transit_model.ModelIndex.
+
+    Returns:
+      Function that takes list of rows and returns (valid rows, rejected) where rejected
+      is list of {"row": row, "reasons": [...]}.
+    """
+    entity = model.entity(entity_name)
+    checks = {"euuid": (is_uuid, "uuid")}
+    for field, attribute in model.fields(entity_name).items():
+        checks[field] = (TYPE_CHECKS.get(attribute.type, is_anything), attribute.type)
+    for field, (relation, target, many) in model.relation_fields.get(entity.euuid, {}).items():
+        checks[field] = (is_reference_list, "list of references") if many else (is_reference, "reference")
+    mandatory = tuple(field for field, attribute in model.fields(entity_name).items()
+                      if attribute.constraint == "mandatory")
+
+    def validate(rows):
+        valid = []
+        rejected = []
+        for row in rows:
+            reasons = None
+            for field, value in row.items():
+                check = checks.get(field)
+                if check is None:
+                    reasons = (reasons or []) + [f"{field} is not a field of {entity.name}"]
+                elif value is not None and not check[0](value):
+                    reasons = (reasons or []) + [f"{field}={value!r} is not {check[1]}"]
+            for field in mandatory:
+                if row.get(field) is None:
+                    reasons = (reasons or []) + [f"{field} is mandatory"]
+            if reasons:
+                rejected.append({"row": row, "reasons": reasons})
+            else:
+                valid.append(row)
+        return valid, rejected
+
+    return validate
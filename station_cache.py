@@ -0,0 +1,75 @@
+from local_state import load_state, save_state
+
+STATION_CACHE_FILE = "stations.json"
+
+class StationCache:
+    """
+    Local mapping of station name to Station euuid, so measurements can reference stations
+    by euuid instead of sending nested {"name": ...} that has to be resolved on every import.
+
+    Args:
+      graphql: Coroutine function used for requests (eywa.graphql).
+    """
+    def __init__(self, graphql):
+        self.graphql = graphql
+        self.stations = load_state(STATION_CACHE_FILE, {})
+
+    async def refresh(self):
+        response = await self.graphql("""
+        {
+            searchStation
+            {
+                euuid
+                name
+            }
+        }
+        """)
+        found = (response or {}).get("data", {}).get("searchStation") or []
+        self.stations = {station.get("name"): station.get("euuid") for station in found if station.get("name")}
+        save_state(STATION_CACHE_FILE, self.stations)
+
+    async def create(self, names):
+        response = await self.graphql("""
+        mutation($stations: [StationInput])
+        {
+            stackStationList(data: $stations)
+            {
+                euuid
+                name
+            }
+        }
+        """, {"stations": [{"name": name} for name in names]})
+        created = (response or {}).get("data", {}).get("stackStationList") or []
+        for station in created:
+            self.stations[station.get("name")] = station.get("euuid")
+        save_state(STATION_CACHE_FILE, self.stations)
+
+    async def resolve(self, names):
+        """
+        Returns {name: euuid} for names. Unknown names are looked up in eywa first,
+        stations that don't exist there yet are created.
+        """
+        missing = {name for name in names if name not in self.stations}
+        if missing:
+            await self.refresh()
+            missing = {name for name in missing if name not in self.stations}
+        if missing:
+            await self.create(sorted(missing))
+        return {name: self.stations.get(name) for name in names}
+
+    async def reference(self, measurements):
+        """
+        Returns measurements with station referenced by euuid, measurement whose station
+        couldn't be resolved keeps station name.
+        """
+        names = {data.get("station", {}).get("name") for data in measurements} - {None}
+        euuids = await self.resolve(names)
+        result = []
+        for data in measurements:
+            euuid = euuids.get(data.get("station", {}).get("name"))
+            result.append({**data, "station": {"euuid": euuid}} if euuid else data)
+        return result
+
+    def clear(self):
+        self.stations = {}
+        save_state(STATION_CACHE_FILE, self.stations)
@@ -0,0 +1,55 @@
+import os
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+#modules live in the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import local_state
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    """
+    Keeps local state of the test in a temporary directory and runs it from the repository root.
+    """
+    monkeypatch.setattr(local_state, "STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.chdir(ROOT)
+    return tmp_path / "state"
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+@pytest.fixture
+def page_server():
+    """
+    Local HTTP server that serves pages put into server.pages ({path: html}), other paths are 404.
+    """
+    pages = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            html = pages.get(self.path)
+            data = (html if html is not None else "Not Found").encode("utf-8")
+            self.send_response(200 if html is not None else 404)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield types.SimpleNamespace(url=f"http://127.0.0.1:{server.server_address[1]}", pages=pages)
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,99 @@
+import asyncio
+import datetime
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from conftest import ROOT
+from dhmz_backfill import backfill, backfill_hours
+from payload_validator import compile_validator
+from transit_model import load_model
+
+URL_TEMPLATE = "http://127.0.0.1:{port}/aktpod?datum={{time:%d.%m.%Y}}&sat={{time:%H}}"
+
+def station_page(heading, rows, table=True):
+    body = "".join("<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>" for row in rows)
+    table_html = f'<table class="fd-c-table1 table--aktualni-podaci sortable"><tbody>{body}</tbody></table>' if table else ""
+    return f"<html><body><h2>Vremenski podaci za {heading}</h2>{table_html}</body></html>"
+
+#pages by (datum, sat) query of the history URL, local time of 18.10.2026. 10-13 h UTC is 12-15 h
+PAGES = {
+    ("18.10.2026", "12"): (200, station_page("18.10.2026. u 12 h", [["Zagreb-Grič", "SW", "2.1", "14.5", "70", "1015.2"],
+                                                                   ["Split-Marjan", "-", "-", "&minus;1.5", "55", "-"]])),
+    ("18.10.2026", "13"): (200, station_page("18.10.2026. u 14 h", [["Zagreb-Grič", "SW", "2.1", "14.5", "70", "1015.2"]])),
+    ("18.10.2026", "14"): (500, "Internal Server Error"),
+    ("18.10.2026", "15"): (200, station_page("18.10.2026. u 15 h", [], table=False)),
+    ("18.10.2026", "16"): (200, station_page("18.10.2026. u 16 h", [["Zagreb-Grič", "SW", "2.1", "14.5", "70.5", "1015.2"],
+                                                                   ["Split-Marjan", "-", "-", "21.3", "55", "1012.0"]])),
+}
+
+class HistoryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        status, html = PAGES.get((query["datum"][0], query["sat"][0]), (404, "Not Found"))
+        data = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def history_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HistoryHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield URL_TEMPLATE.format(port=server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+def test_backfill_imports_only_pages_of_requested_hour(history_server):
+    imported = []
+    async def import_function(batch):
+        imported.extend(batch)
+    start = datetime.datetime(2026, 10, 18, 10, tzinfo=datetime.UTC)
+    end = datetime.datetime(2026, 10, 18, 13, tzinfo=datetime.UTC)
+    stats = asyncio.run(backfill(start, end, import_function, url_template=history_server, concurrency=2, rate=0))
+    assert stats["pages"] == 1
+    assert [url[-17:] for url in stats["mismatched_pages"]] == ["18.10.2026&sat=13"]
+    assert sorted(url[-17:] for url in stats["failed_pages"]) == ["18.10.2026&sat=14", "18.10.2026&sat=15"]
+    assert [data["station"]["name"] for data in imported] == ["Zagreb-Grič", "Split-Marjan"]
+    assert {data["time"] for data in imported} == {"2026-10-18T10:00:00Z"}
+    assert stats["measurements"] == 2
+
+def test_backfill_hours_skips_repeated_local_hour():
+    start = datetime.datetime(2026, 10, 24, 23, tzinfo=datetime.UTC)
+    end = datetime.datetime(2026, 10, 25, 2, tzinfo=datetime.UTC)
+    assert [hour.hour for hour in backfill_hours(start, end)] == [23, 0, 2]
+
+def test_backfill_drops_rows_that_fail_validation(history_server):
+    validator = compile_validator(load_model(os.path.join(ROOT, "Neyho_DHMZ_Test_1_2_1.json")), "Measurement")
+    def validate(measurements):
+        return validator(measurements)[0]
+    imported = []
+    #eywa rejects whole stackMeasurementList if any row doesn't match the model
+    async def import_function(batch):
+        if validator(batch)[1]:
+            return {"errors": [{"message": "invalid MeasurementInput"}]}
+        imported.extend(batch)
+        return {"data": {"stackMeasurementList": batch}}
+    hour = datetime.datetime(2026, 10, 18, 14, tzinfo=datetime.UTC)
+    stats = asyncio.run(backfill(hour, hour, import_function, url_template=history_server, rate=0, validate=validate))
+    assert [data["station"]["name"] for data in imported] == ["Split-Marjan"]
+    assert stats["rejected"] == 1
+    assert stats["measurements"] == 1
+    assert stats["failed_batches"] == 0
+
+def test_backfill_counts_rejected_batch_as_failed(history_server):
+    async def import_function(batch):
+        return {"errors": [{"message": "invalid MeasurementInput"}]}
+    hour = datetime.datetime(2026, 10, 18, 14, tzinfo=datetime.UTC)
+    stats = asyncio.run(backfill(hour, hour, import_function, url_template=history_server, rate=0))
+    assert stats["measurements"] == 0
+    assert stats["failed_batches"] == 1
@@ -0,0 +1,35 @@
+import datetime
+
+from conftest import read_fixture
+from dhmz_html import fetch_station_page, parse_station_page, parse_station_rows
+from dhmz_rows import parse_rows
+
+STATION_ROWS = [
+    ["Zagreb-Grič", "SW", "2.1", "14.5", "70", "1015.2", "−0.8", "pretežno oblačno"],
+    ["Zavižan", "N", "8.4", "−1.5", "95", "-", "+1.2", "snijeg"],
+    ["Split-Marjan", "-", "-", "21.3", "55", "1012.0", "0.0", "vedro"],
+]
+
+def test_parse_station_page():
+    rows, observed_hour = parse_station_page(read_fixture("dhmz_station_table.html"))
+    #<sup> text is dropped, rows of the nested table are not station rows
+    assert rows == STATION_ROWS
+    assert observed_hour == datetime.datetime(2026, 10, 18, 16)
+
+def test_parse_station_rows_without_table():
+    assert parse_station_rows("<html><body><div id='app'></div></body></html>") is None
+    assert parse_station_rows('<table class="table--aktualni-podaci"><tbody></tbody></table>') == []
+
+def test_parsed_rows_convert_minus_sign():
+    zagreb, zavizan, split = parse_rows(parse_station_rows(read_fixture("dhmz_station_table.html")), "2026-10-18T14:00:00Z")
+    assert zagreb["air_tendency"] == -0.8
+    assert zavizan["air_temperature"] == -1.5
+    assert zavizan["relative_moisture"] == 95
+    assert "air_pressure" not in zavizan
+    assert "wind_velocity" not in split
+    assert split["station"] == {"name": "Split-Marjan"}
+
+def test_fetch_station_page(page_server):
+    page_server.pages["/aktpod"] = read_fixture("dhmz_station_table.html")
+    assert fetch_station_page(page_server.url + "/aktpod") == (STATION_ROWS, datetime.datetime(2026, 10, 18, 16))
+    assert fetch_station_page(page_server.url + "/missing") == (None, None)
@@ -0,0 +1,49 @@
+import threading
+
+from driver_pool import DriverPool
+
+class FakeDriver:
+    def __init__(self):
+        self.quit_called = False
+
+    def execute_script(self, script):
+        return 1
+
+    def quit(self):
+        self.quit_called = True
+
+def test_warm_counts_sessions_in_use():
+    pool = DriverPool(FakeDriver, size=3)
+    with pool.session():
+        pool.warm()
+        assert pool.created == 3
+        pool.warm()
+        assert pool.created == 3
+    with pool.session(), pool.session(), pool.session():
+        assert pool.created == 3
+    pool.close()
+    assert pool.recycled == 3
+
+def test_warm_starts_browsers_outside_lock():
+    starting = threading.Event()
+    started = threading.Event()
+    def factory():
+        assert not pool._lock.locked()
+        if not starting.is_set():
+            starting.set()
+            assert started.wait(5)
+        return FakeDriver()
+    pool = DriverPool(factory, size=2)
+    warming = threading.Thread(target=pool.warm)
+    warming.start()
+    assert starting.wait(5)
+    #scrape isn't blocked by the browser warm() is starting and takes the other slot
+    with pool.session() as driver:
+        assert driver.execute_script("return 1") == 1
+        started.set()
+        warming.join(5)
+        assert not warming.is_alive()
+    assert pool.created == 2
+    pool.warm()
+    assert pool.created == 2
+    pool.close()
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip("eywa")
+from invoice_ingest import IngestLedger, InvoiceIndex, ingest, invoice_key, normalise, send_batch
+
+def stats():
+    return {"requests": 0, "failed_attempts": 0}
+
+def invoices(count):
+    return [{"invoice_number": str(i)} for i in range(count)]
+
+def test_list_mode_marks_invoices_missing_from_response_as_failed():
+    async def graphql(query, variables):
+        return {"data": {"stackInvoiceDetailsList": [{"euuid": "a"}, None]}}
+    results = asyncio.run(send_batch(graphql, invoices(3), "list", 0, 0, stats()))
+    assert results == [("a", None), (None, "no result"), (None, "no result")]
+
+def test_list_mode_retries_response_without_data():
+    responses = [{"data": None}, {"data": {"stackInvoiceDetailsList": [{"euuid": "a"}, {"euuid": "b"}]}}]
+    async def graphql(query, variables):
+        return responses.pop(0)
+    counters = stats()
+    results = asyncio.run(send_batch(graphql, invoices(2), "list", 1, 0, counters))
+    assert results == [("a", None), ("b", None)]
+    assert counters == {"requests": 2, "failed_attempts": 1}
+
+def test_list_mode_without_data_fails_every_invoice():
+    async def graphql(query, variables):
+        return {"data": None}
+    results = asyncio.run(send_batch(graphql, invoices(2), "list", 0, 0, stats()))
+    assert results == [(None, "no data in response")] * 2
+
+def ocr_document(number, total=125.0, extraction_timestamp="2024-05-01T10:00:00", source_file=None):
+    return {
+        "document_type": "invoice",
+        "extraction_timestamp": extraction_timestamp,
+        "source_format": "pdf",
+        "source_file": source_file or f"invoice_{number}.pdf",
+        "invoice_details": {"invoice_number": number, "invoice_date": "2024-04-30", "currency": "EUR"},
+        "vendor": {"name": "Vendor", "tax_id": "HR00000000001"},
+        "customer": {"name": "Customer"},
+        "line_items": [{"line_number": 1, "description": "Item", "quantity": 1, "unit_price": total}],
+        "totals": {"subtotal": total, "total": total, "tax_breakdown": []},
+        "metadata": {"confidence_score": 0.97, "extracted_text_sample": "INVOICE",
+                     "processing_notes": ["ocr"], "warnings": []},
+    }
+
+class InvoiceStore:
+    """
+    Stub of stackInvoiceDetailsList that stores invoices by euuid (new one for invoices without it)
+    and fails invoice numbers in failing after delay seconds.
+    """
+    def __init__(self, failing=(), delay=0.0):
+        self.failing = set(failing)
+        self.delay = delay
+        self.invoices = {}
+
+    async def __call__(self, query, variables=None):
+        batch = variables["data"]
+        if self.failing & {invoice["invoice_number"] for invoice in batch}:
+            await asyncio.sleep(self.delay)
+            return {"errors": [{"message": "stub failure"}]}
+        result = []
+        for invoice in batch:
+            euuid = invoice.get("euuid") or str(uuid.uuid4())
+            self.invoices[euuid] = invoice
+            result.append({"euuid": euuid})
+        return {"data": {"stackInvoiceDetailsList": result}}
+
+def write(directory, name, document):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f)
+    return path
+
+@pytest.fixture
+def run_ingest(tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    ledger = IngestLedger(str(tmp_path / "ledger.sqlite"))
+    index = InvoiceIndex(str(tmp_path / "index.sqlite"))
+    def run(graphql, **options):
+        options = {"batch_size": 1, "concurrency": 2, "retries": 0, "backoff": 0, "workers": 1, **options}
+        return asyncio.run(ingest(str(input_dir), graphql, ledger=ledger, index=index, **options))
+    def statuses():
+        return {os.path.basename(path): (status, euuid) for path, status, euuid in
+                ledger.connection.execute("SELECT path, status, euuid FROM files")}
+    run.input_dir = str(input_dir)
+    run.statuses = statuses
+    yield run
+    ledger.close()
+    index.close()
+
+def test_invoice_key_ignores_formatting():
+    invoice = {"invoice_number": " INV-1 ", "document": {"vendor": {"name": "Vendor  d.o.o.", "tax_id": None}},
+               "totals": {"total": 100.0}, "line_items": [{"description": "Item\n one"}]}
+    same = {"invoice_number": "INV-1", "document": {"vendor": {"name": "vendor d.o.o."}},
+            "totals": {"total": 100}, "line_items": [{"description": "Item one"}]}
+    assert normalise(invoice["totals"]) == {"total": 100}
+    assert invoice_key(invoice)[0] == invoice_key(same)[0] == ("INV-1", "vendor d.o.o.")
+    assert invoice_key({**same, "totals": {"total": 101}})[1] != invoice_key(same)[1]
+    assert invoice_key({"invoice_number": "  "}) is None
+    #tax id identifies vendor when there is one
+    assert invoice_key({"invoice_number": "1", "document": {"vendor": {"name": "A", "tax_id": "HR1"}}})[0] == ("1", "hr1")
+
+def test_invoice_key_ignores_dedup_ignored_fields():
+    invoice = {"invoice_number": "INV-1", "document": {"extraction_timestamp": "2024-05-01", "source_file": "a.pdf"}}
+    rerun = {"invoice_number": "INV-1", "document": {"extraction_timestamp": "2024-06-01", "source_file": "b.pdf"}}
+    assert invoice_key(invoice) == invoice_key(rerun)
+    assert invoice["document"]["source_file"] == "a.pdf"
+
+def test_duplicates_in_one_run_are_sent_once(run_ingest):
+    write(run_ingest.input_dir, "a.json", ocr_document("INV-1"))
+    write(run_ingest.input_dir, "b.json", ocr_document("INV-1", source_file="copy.pdf"))
+    write(run_ingest.input_dir, "c.json", ocr_document("INV-2"))
+    store = InvoiceStore()
+    stats = run_ingest(store)
+    assert len(store.invoices) == 2
+    assert (stats["sent"], stats["unchanged"]) == (2, 1)
+    statuses = run_ingest.statuses()
+    assert statuses["a.json"] == statuses["b.json"]
+    assert statuses["a.json"][0] == "sent" and statuses["a.json"][1] in store.invoices
+
+def test_rerun_sends_only_changed_invoices_as_updates(run_ingest):
+    write(run_ingest.input_dir, "a.json", ocr_document("INV-1"))
+    write(run_ingest.input_dir, "b.json", ocr_document("INV-2"))
+    store = InvoiceStore()
+    run_ingest(store)
+    euuids = {invoice["invoice_number"]: euuid for euuid, invoice in store.invoices.items()}
+    #OCR ran again: INV-1 only got new extraction timestamp, INV-2 has another total
+    write(run_ingest.input_dir, "a.json", ocr_document("INV-1", extraction_timestamp="2024-06-01T10:00:00"))
+    write(run_ingest.input_dir, "b.json", ocr_document("INV-2", total=130.0, extraction_timestamp="2024-06-01T10:00:00"))
+    stats = run_ingest(store)
+    assert (stats["sent"], stats["changed"], stats["unchanged"]) == (1, 1, 1)
+    assert len(store.invoices) == 2
+    assert store.invoices[euuids["INV-2"]]["totals"]["total"] == 130.0
+    assert run_ingest.statuses()["b.json"] == ("sent", euuids["INV-2"])
+
+def test_duplicate_fails_with_the_invoice_it_waited_for(run_ingest):
+    write(run_ingest.input_dir, "a.json", ocr_document("INV-1"))
+    write(run_ingest.input_dir, "b.json", ocr_document("INV-1", source_file="copy.pdf"))
+    #b.json is transformed while a.json is still being sent
+    stats = run_ingest(InvoiceStore(failing={"INV-1"}, delay=0.5))
+    assert (stats["failed"], stats["unchanged"]) == (2, 0)
+    assert run_ingest.statuses() == {"a.json": ("failed", None), "b.json": ("failed", None)}
+    store = InvoiceStore()
+    stats = run_ingest(store)
+    assert len(store.invoices) == 1
+    assert (stats["sent"], stats["unchanged"]) == (1, 1)
+    assert {status for status, euuid in run_ingest.statuses().values()} == {"sent"}
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from json_diff_rules import ANY_DEPTH, ANY_INDEX, ANY_KEY, RuleSet, parse_pattern, values_equal
+
+def matches(segments, path):
+    """
+    Naive (backtracking) matching of pattern segments against path, reference for RuleSet.
+    """
+    if not segments:
+        return not path
+    segment = segments[0]
+    if segment == ANY_DEPTH:
+        return any(matches(segments[1:], path[i:]) for i in range(len(path) + 1))
+    if not path:
+        return False
+    key = path[0]
+    if segment == ANY_KEY:
+        found = isinstance(key, str)
+    elif segment == ANY_INDEX:
+        found = isinstance(key, int)
+    else:
+        found = key == segment
+    return found and matches(segments[1:], path[1:])
+
+def random_pattern(generator):
+    segments = []
+    for _ in range(generator.randrange(1, 5)):
+        choice = generator.randrange(6)
+        if choice == 0:
+            segments.append(ANY_DEPTH)
+        elif choice == 1:
+            segments.append(ANY_KEY)
+        elif choice == 2:
+            segments.append(ANY_INDEX)
+        elif choice == 3:
+            segments.append(generator.randrange(2))
+        else:
+            segments.append(generator.choice("ab"))
+    return segments
+
+def random_path(generator):
+    return tuple(generator.choice(["a", "b", "c", 0, 1, 2]) for _ in range(generator.randrange(6)))
+
+def test_parse_pattern():
+    assert parse_pattern("**.line_items[*].line_number") == [ANY_DEPTH, "line_items", ANY_INDEX, "line_number"]
+    assert parse_pattern("totals.tax_breakdown[2].*") == ["totals", "tax_breakdown", 1, ANY_KEY]
+
+def test_rule_set_matches_like_naive_matching():
+    generator = random.Random(1)
+    for _ in range(200):
+        patterns = [random_pattern(generator) for _ in range(generator.randrange(1, 5))]
+        rules = RuleSet()
+        for n, segments in enumerate(patterns):
+            #same rule name in several patterns checks that the pattern added later wins
+            rules.add_rules(segments, **{f"rule{n}": True, "last": n})
+        for _ in range(30):
+            path = random_path(generator)
+            expected = {}
+            for n, segments in enumerate(patterns):
+                if matches(segments, path):
+                    expected.update({f"rule{n}": True, "last": n})
+            state = rules.start()
+            for key in path:
+                state = rules.step(state, key)
+            assert RuleSet.rules(state) == expected, (patterns, path)
+
+def test_ignored_keys_and_list_keys():
+    rules = RuleSet()
+    rules.add_ignore("**.extraction_timestamp")
+    rules.add_ignore("metadata.warnings")
+    rules.add_list_key("**.line_items[*].line_number")
+    assert rules.ignored_keys() == frozenset({"extraction_timestamp"})
+    state = rules.step(rules.step(rules.start(), "document"), "line_items")
+    assert state.rules == {"list_key": "line_number"}
+    assert rules.step(rules.step(rules.start(), "metadata"), "warnings").ignore
+    with pytest.raises(ValueError):
+        rules.add_list_key("**.line_items")
+
+def test_values_equal():
+    assert values_equal({"tolerance": (0.01, 0)}, 1.0, 1.005)
+    assert not values_equal({"tolerance": (0.01, 0)}, 1.0, 1.02)
+    assert values_equal({"tolerance": (0, 0.1)}, 100, 109)
+    assert not values_equal({"tolerance": (0.01, 0)}, "1.0", 1.0)
+    assert values_equal({"ignore_case": True, "ignore_whitespace": True}, " Zagreb  Grič", "zagreb grič ")
+    assert not values_equal({"ignore_case": True}, "Zagreb  Grič", "zagreb grič")
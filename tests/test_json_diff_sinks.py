@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import json_diff_sinks
+from json_diff_sinks import JsonLinesSink, MsgpackSink, SummarySink, emit
+from json_difference_comparison import ADD_MACRO, DIFF_MACRO, MISS_MACRO, MOVE_MACRO, ReportSink
+
+DIFFERENCES = [
+    (MISS_MACRO, ["items", 1], {"n": 2}, None),
+    (ADD_MACRO, ["items", 4], None, {"n": 6}),
+    (MOVE_MACRO, ["items", 4], 4, 0),
+    (DIFF_MACRO, ["items", 2, "price"], 3, 30),
+    (DIFF_MACRO, ["vendor", "name"], "Grič", "Grič d.o.o."),
+]
+
+COUNTS = {MISS_MACRO: 1, ADD_MACRO: 1, MOVE_MACRO: 1, DIFF_MACRO: 2}
+
+def test_summary_sink_counts_by_kind():
+    assert emit(iter(DIFFERENCES), SummarySink()) == COUNTS
+
+def test_report_sink_formats_paths():
+    sink = ReportSink()
+    emit(DIFFERENCES, sink)
+    assert sink.diffs == {
+        ADD_MACRO: ["items[5]"],
+        MISS_MACRO: ["items[2]"],
+        DIFF_MACRO: [{"items[3].price": {"original": 3, "new": 30}},
+                     {"vendor.name": {"original": "Grič", "new": "Grič d.o.o."}}],
+        MOVE_MACRO: [{"items[5]": {"original": 5, "new": 1}}],
+    }
+
+def test_json_lines_sink_writes_every_difference(monkeypatch, tmp_path):
+    monkeypatch.setattr(json_diff_sinks, "FLUSH_EVERY", 2)
+    path = tmp_path / "difference" / "difference.jsonl"
+    with JsonLinesSink(str(path)) as sink:
+        assert emit(DIFFERENCES, sink) == COUNTS
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == \
+        [{"kind": kind, "path": path, "original": original, "new": new} for kind, path, original, new in DIFFERENCES]
+
+def test_msgpack_sink_writes_every_difference(monkeypatch, tmp_path):
+    msgpack = pytest.importorskip("msgpack")
+    monkeypatch.setattr(json_diff_sinks, "FLUSH_EVERY", 2)
+    path = tmp_path / "difference.msgpack"
+    with MsgpackSink(str(path)) as sink:
+        assert emit(DIFFERENCES, sink) == COUNTS
+    with open(path, "rb") as f:
+        assert [tuple(item) for item in msgpack.Unpacker(f)] == DIFFERENCES
@@ -0,0 +1,240 @@
+import copy
+import json
+import random
+
+import pytest
+
+import json_difference_comparison as diff
+from json_diff_rules import RuleSet
+from json_merkle import subtree_hashes
+
+def lcs_length(a, b):
+    """
+    Length of longest common subsequence by plain O(n * m) dynamic programming.
+    """
+    row = [0] * (len(b) + 1)
+    for x in a:
+        previous = 0
+        for j, y in enumerate(b):
+            current = row[j + 1]
+            row[j + 1] = previous + 1 if x == y else max(row[j + 1], row[j])
+            previous = current
+    return row[-1]
+
+def increasing_length(values):
+    """
+    Length of longest increasing subsequence by O(n^2) dynamic programming.
+    """
+    lengths = []
+    for i, value in enumerate(values):
+        lengths.append(1 + max((lengths[j] for j in range(i) if values[j] < value), default=0))
+    return max(lengths, default=0)
+
+def random_list(generator, alphabet):
+    return [generator.randrange(alphabet) for _ in range(generator.randrange(30))]
+
+def edited(generator, items, new_item):
+    items = list(items)
+    for _ in range(generator.randrange(6)):
+        operation = generator.randrange(3)
+        if operation == 0:
+            items.insert(generator.randrange(len(items) + 1), new_item())
+        elif items and operation == 1:
+            del items[generator.randrange(len(items))]
+        elif items:
+            items.insert(generator.randrange(len(items) + 1), items.pop(generator.randrange(len(items))))
+    return items
+
+def random_value(generator, depth=0):
+    kind = generator.randrange(4 if depth < 3 else 2)
+    if kind == 0:
+        return generator.randrange(5)
+    if kind == 1:
+        return generator.choice(["a", "b", "A ", None, True])
+    if kind == 2:
+        return [random_value(generator, depth + 1) for _ in range(generator.randrange(5))]
+    return {generator.choice("abcde"): random_value(generator, depth + 1) for _ in range(generator.randrange(5))}
+
+def mutated(generator, value):
+    """
+    Copy of value with some leaves changed and some keys and list elements added, removed or moved.
+    """
+    if generator.random() < 0.15:
+        return random_value(generator)
+    if isinstance(value, dict):
+        result = {key: mutated(generator, item) for key, item in value.items() if generator.random() > 0.1}
+        if generator.random() < 0.2:
+            result[generator.choice("abcdef")] = random_value(generator)
+        return result
+    if isinstance(value, list):
+        return edited(generator, [mutated(generator, item) for item in value], lambda: random_value(generator))
+    return value
+
+def keyed_items(generator, ids):
+    return [{"line_number": i, "price": generator.randrange(3)} for i in ids]
+
+def test_common_subsequence_matches_dynamic_programming():
+    generator = random.Random(1)
+    for case in range(500):
+        a = random_list(generator, 1 + case % 6)
+        b = random_list(generator, 1 + case % 6) if case % 2 else edited(generator, a, lambda: generator.randrange(9))
+        pairs = diff.common_subsequence(a, b)
+        assert len(pairs) == lcs_length(a, b), (a, b)
+        assert all(a[i] == b[j] for i, j in pairs)
+        assert all(i1 < i2 and j1 < j2 for (i1, j1), (i2, j2) in zip(pairs, pairs[1:]))
+
+def test_common_subsequence_gives_up_after_max_edits():
+    generator = random.Random(2)
+    for _ in range(200):
+        a, b = random_list(generator, 4), random_list(generator, 4)
+        pairs = diff.common_subsequence(a, b, max_edits=2)
+        assert len(pairs) <= lcs_length(a, b)
+        assert all(a[i] == b[j] for i, j in pairs)
+        assert all(i1 < i2 and j1 < j2 for (i1, j1), (i2, j2) in zip(pairs, pairs[1:]))
+
+def test_unkeyed_lcs_match_accounts_for_every_element():
+    generator = random.Random(3)
+    for _ in range(300):
+        reference = random_list(generator, 5)
+        comparison = edited(generator, reference, lambda: generator.randrange(9))
+        matched, removed, added, moved = diff.match_lists(reference, comparison, None, "lcs")
+        common = lcs_length(reference, comparison)
+        assert len(matched) + len(removed) + len(moved) + common == len(reference)
+        assert len(matched) + len(added) + len(moved) + common == len(comparison)
+        assert all(reference[i] == comparison[j] for i, j in moved)
+        assert not {i for i, j in moved} & set(removed)
+        assert not {j for i, j in moved} & set(added)
+
+def test_unkeyed_moved_element_is_reported_as_move():
+    assert diff.match_lists(list("abcd"), list("bcda"), None, "lcs") == ([], [], [], [(0, 3)])
+    assert diff.match_lists(list("abcd"), list("axcd"), None, "lcs") == ([(1, 1)], [], [], [])
+
+def test_keyed_match_finds_inserted_removed_and_moved_elements():
+    generator = random.Random(4)
+    for _ in range(300):
+        reference_ids = generator.sample(range(40), generator.randrange(20))
+        new_ids = iter(range(40, 80))
+        comparison_ids = edited(generator, reference_ids, lambda: next(new_ids))
+        reference = keyed_items(generator, reference_ids)
+        comparison = keyed_items(generator, comparison_ids)
+        matched, removed, added, moved = diff.match_lists(reference, comparison, "line_number", "lcs")
+        assert all(reference_ids[i] == comparison_ids[j] for i, j in matched)
+        assert {reference_ids[i] for i, j in matched} == set(reference_ids) & set(comparison_ids)
+        assert {reference_ids[i] for i in removed} == set(reference_ids) - set(comparison_ids)
+        assert {comparison_ids[j] for j in added} == set(comparison_ids) - set(reference_ids)
+        #elements that kept their relative order form the longest increasing run, the rest moved
+        assert set(moved) <= set(matched)
+        positions = [j for i, j in matched]
+        assert len(matched) - len(moved) == increasing_length(positions)
+        kept = [j for pair in matched if pair not in moved for j in pair[1:]]
+        assert kept == sorted(kept)
+
+def test_keyed_list_differences():
+    rules = RuleSet()
+    rules.add_list_key("**.items[*].n")
+    reference = {"items": [{"n": i, "p": i} for i in range(1, 6)]}
+    comparison = {"items": [{"n": 5, "p": 5}, {"n": 1, "p": 1}, {"n": 3, "p": 30}, {"n": 4, "p": 4}, {"n": 6, "p": 6}]}
+    assert list(diff.iter_differences(reference, comparison, rules=rules)) == [
+        (diff.MISS_MACRO, ("items", 1), {"n": 2, "p": 2}, None),
+        (diff.ADD_MACRO, ("items", 4), None, {"n": 6, "p": 6}),
+        (diff.MOVE_MACRO, ("items", 4), 4, 0),
+        (diff.DIFF_MACRO, ("items", 2, "p"), 3, 30),
+    ]
+
+def test_iter_differences_finds_changed_leaf_and_nothing_else():
+    generator = random.Random(5)
+    for _ in range(200):
+        reference = {"root": random_value(generator)}
+        comparison = copy.deepcopy(reference)
+        parent, path = comparison, ("root",)
+        while isinstance(parent[path[-1]], (dict, list)) and parent[path[-1]]:
+            child = parent[path[-1]]
+            parent, path = child, path + (generator.choice(list(child) if isinstance(child, dict) else range(len(child))),)
+        old = parent[path[-1]]
+        parent[path[-1]] = "changed"
+        assert list(diff.iter_differences(reference, copy.deepcopy(reference))) == []
+        assert list(diff.iter_differences(reference, comparison)) == [(diff.DIFF_MACRO, path, old, "changed")]
+
+@pytest.mark.parametrize("list_match", ["position", "lcs"])
+def test_hash_short_circuit_gives_same_differences(list_match):
+    generator = random.Random(6)
+    rules = RuleSet()
+    rules.add_ignore("**.e")
+    rules.add_list_key("**.items[*].line_number")
+    for _ in range(200):
+        reference = {"doc": random_value(generator), "items": keyed_items(generator, generator.sample(range(9), 5))}
+        comparison = mutated(generator, reference)
+        hashes = (subtree_hashes(reference, rules.ignored_keys()), subtree_hashes(comparison, rules.ignored_keys()))
+        assert list(diff.iter_differences(reference, comparison, rules=rules, list_match=list_match, hashes=hashes)) == \
+            list(diff.iter_differences(reference, comparison, rules=rules, list_match=list_match))
+
+def test_iter_file_differences_matches_loaded_comparison(tmp_path):
+    pytest.importorskip("ijson")
+    generator = random.Random(7)
+    rules = RuleSet()
+    rules.add_ignore("**.e")
+    for case in range(100):
+        if case % 3 == 0:
+            reference = [random_value(generator) for _ in range(generator.randrange(5))]
+        else:
+            reference = {key: random_value(generator) for key in generator.sample("abcdefgh", generator.randrange(8))}
+        comparison = mutated(generator, reference)
+        if isinstance(comparison, dict) and case % 2:
+            comparison = dict(reversed(list(comparison.items())))
+        (tmp_path / "reference.json").write_text(json.dumps(reference))
+        (tmp_path / "comparison.json").write_text(json.dumps(comparison))
+        streamed = diff.iter_file_differences(str(tmp_path / "reference.json"), str(tmp_path / "comparison.json"), rules=rules)
+        #top level array items are always compared by position
+        expected = diff.iter_differences(reference, comparison, rules=rules)
+        assert sorted(map(repr, streamed)) == sorted(map(repr, expected))
+
+@pytest.mark.parametrize("list_match", ["position", "lcs"])
+def test_many_differences_agree_with_pairwise(list_match):
+    generator = random.Random(8)
+    rules = RuleSet()
+    rules.add_ignore("**.e")
+    rules.add_tolerance("**.a", absolute=1)
+    rules.add_list_key("**.items[*].line_number")
+    for _ in range(100):
+        reference = {"doc": random_value(generator), "items": keyed_items(generator, generator.sample(range(9), 5))}
+        candidates = [mutated(generator, reference) for _ in range(generator.randrange(1, 4))]
+        found = [set() for _ in candidates]
+        for path, reference_value, statuses in diff.iter_many_differences(reference, candidates, rules, list_match):
+            for c, status in enumerate(statuses):
+                if status is not None:
+                    found[c].add((status[0], path, repr(status[1])))
+        for c, candidate in enumerate(candidates):
+            pairwise = {(kind, path, repr(None if kind == diff.MISS_MACRO else new))
+                        for kind, path, original, new in diff.iter_differences(reference, candidate, rules=rules, list_match=list_match)}
+            assert found[c] == pairwise
+
+def write_json(directory, name, value):
+    directory.mkdir(exist_ok=True)
+    (directory / name).write_text(json.dumps(value), encoding="utf-8")
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_compare_directories(tmp_path, workers):
+    reference_dir, comparison_dir = tmp_path / "reference", tmp_path / "comparison"
+    write_json(reference_dir, "same.json", {"a": 1, "extraction_timestamp": "x"})
+    write_json(comparison_dir, "same.json", {"a": 1, "extraction_timestamp": "y"})
+    write_json(reference_dir, "changed.json", {"a": 1, "b": [1, 2]})
+    write_json(comparison_dir, "changed.json", {"a": 2, "b": [1, 2, 3], "c": 1})
+    write_json(reference_dir, "broken.json", {})
+    (comparison_dir / "broken.json").write_text("{", encoding="utf-8")
+    write_json(reference_dir, "reference_only.json", {})
+    write_json(comparison_dir, "comparison_only.json", {})
+    report = diff.compare_directories(str(reference_dir), str(comparison_dir), workers)
+    summary = report["summary"]
+    assert {key: summary[key] for key in ("pairs", "identical", "with_differences", "failed", "added", "different")} == \
+        {"pairs": 3, "identical": 1, "with_differences": 1, "failed": 1, "added": 2, "different": 1}
+    assert report["only_in_reference"] == ["reference_only.json"]
+    assert report["only_in_comparison"] == ["comparison_only.json"]
+    files = {result["file"]: result for result in report["files"]}
+    assert "error" in files["broken.json"]
+    assert files["changed.json"]["diffs"][diff.DIFF_MACRO] == [{"a": {"original": 1, "new": 2}}]
+
+def test_record_run_counts_runs_from_previous_report(monkeypatch, tmp_path):
+    monkeypatch.setattr(diff, "DIFFERENCE_DIR", str(tmp_path))
+    write_json(tmp_path, diff.DIFFERENCE_FILE, {"total_runs": 5, "total_diffs": 2})
+    assert diff.record_run(True) == {"total_runs": 6, "total_diffs": 3}
+    assert diff.record_run(False) == {"total_runs": 7, "total_diffs": 3}
@@ -0,0 +1,82 @@
+import json
+import random
+
+import pytest
+
+import json_merkle
+from json_merkle import file_hashes, subtree_hashes
+from json_difference_comparison import iter_differences, iter_many_differences
+
+def random_value(generator, depth=0):
+    kind = generator.randrange(4 if depth < 4 else 2)
+    if kind == 0:
+        return generator.randrange(3)
+    if kind == 1:
+        return generator.choice(["a", "b", None])
+    if kind == 2:
+        return [random_value(generator, depth + 1) for _ in range(generator.randrange(4))]
+    return {generator.choice("abcde"): random_value(generator, depth + 1) for _ in range(generator.randrange(4))}
+
+def write(tmp_path, name, value):
+    path = tmp_path / name
+    path.write_text(json.dumps(value), encoding="utf-8")
+    return str(path)
+
+def expand_all(digests, value):
+    """
+    Expands every container of value, the way a traversal that visits the whole document would.
+    """
+    stack = [value]
+    while stack:
+        node = stack.pop()
+        if node.__class__ is dict or node.__class__ is list:
+            digests.expand(node)
+            stack.extend(node.values() if node.__class__ is dict else node)
+
+def test_cached_digests_match_subtree_hashes(state_dir, tmp_path):
+    generator = random.Random(1)
+    for case in range(100):
+        value = {"root": random_value(generator), "e": random_value(generator)}
+        path = write(tmp_path, f"{case}.json", value)
+        expected = subtree_hashes(value, {"e"})
+        for _ in range(2):
+            #first call computes and caches digests, second one reads them
+            digests = file_hashes(path, value, {"e"})
+            assert dict(digests) == {id(value): expected[id(value)]}
+            expand_all(digests, value)
+            assert dict(digests) == expected
+
+def test_cache_hit_does_not_enumerate_document(monkeypatch, state_dir, tmp_path):
+    reference = {f"invoice_{i}": {"line_items": [{"amount": i}], "vendor": {"name": "V"}} for i in range(50)}
+    comparison = json.loads(json.dumps(reference))
+    comparison["invoice_7"]["line_items"][0]["amount"] = -1
+    paths = write(tmp_path, "reference.json", reference), write(tmp_path, "comparison.json", comparison)
+    file_hashes(paths[0], reference), file_hashes(paths[1], comparison)
+    def containers(value):
+        raise AssertionError("cached digests enumerated the document")
+    monkeypatch.setattr(json_merkle, "containers", containers)
+    hashes = file_hashes(paths[0], reference), file_hashes(paths[1], comparison)
+    assert list(iter_differences(reference, comparison, hashes=hashes)) == \
+        [("DIFFERENT from reference file", ("invoice_7", "line_items", 0, "amount"), 7, -1)]
+    #only the root and the changed invoice were expanded
+    assert len(hashes[0]) == 1 + 50 + 2 + 1
+
+@pytest.mark.parametrize("list_match", ["position", "lcs"])
+def test_cached_digests_give_same_differences(state_dir, tmp_path, list_match):
+    generator = random.Random(2)
+    for case in range(100):
+        reference, comparison = random_value(generator), random_value(generator)
+        hashes = (file_hashes(write(tmp_path, f"r{case}.json", reference), reference),
+                  file_hashes(write(tmp_path, f"c{case}.json", comparison), comparison))
+        assert list(iter_differences(reference, comparison, list_match=list_match, hashes=hashes)) == \
+            list(iter_differences(reference, comparison, list_match=list_match))
+
+def test_cached_digests_give_same_n_way_differences(state_dir, tmp_path):
+    generator = random.Random(3)
+    for case in range(50):
+        reference = random_value(generator)
+        candidates = [random_value(generator) for _ in range(3)]
+        hashes = (file_hashes(write(tmp_path, f"r{case}.json", reference), reference),
+                  [file_hashes(write(tmp_path, f"c{case}_{c}.json", value), value) for c, value in enumerate(candidates)])
+        assert list(iter_many_differences(reference, candidates, list_match="lcs", hashes=hashes)) == \
+            list(iter_many_differences(reference, candidates, list_match="lcs"))
@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import read_fixture
+from dhmz_html import parse_station_page, parse_station_rows
+
+pytest.importorskip("eywa")
+pytest.importorskip("selenium")
+import main
+
+class RecordingGraphQL:
+    """
+    Stub of eywa.graphql that records requests and answers them with handler(query, variables).
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    async def __call__(self, query, variables=None):
+        self.requests.append((query, variables))
+        return self.handler(query, variables)
+
+def deployment_graphql(deployed, import_errors=None, deployed_after_import=True):
+    state = {"deployed": deployed}
+    def handler(query, variables):
+        if "importDataset" in query:
+            if import_errors:
+                return {"errors": import_errors}
+            state["deployed"] = deployed_after_import
+            return {"data": {"importDataset": {"euuid": main.DATASET_EUUID}}}
+        return {"data": {"searchDatasetVersion": [{"euuid": main.DATASET_EUUID, "deployed": state["deployed"]}]}}
+    return RecordingGraphQL(handler)
+
+def imports(graphql):
+    return sum("importDataset" in query for query, variables in graphql.requests)
+
+@pytest.mark.parametrize("deployed", [True, False])
+def test_check_if_model_deployed_returns_bool(monkeypatch, deployed):
+    monkeypatch.setattr(main.eywa, "graphql", deployment_graphql(deployed))
+    assert asyncio.run(main.check_if_model_deployed()) is deployed
+
+def test_undeployed_model_is_deployed_and_cached(monkeypatch, state_dir):
+    graphql = deployment_graphql(False)
+    monkeypatch.setattr(main.eywa, "graphql", graphql)
+    assert asyncio.run(main.ensure_model_deployed())
+    assert imports(graphql) == 1
+    assert asyncio.run(main.ensure_model_deployed())
+    assert imports(graphql) == 1
+    assert len(graphql.requests) == 3
+
+@pytest.mark.parametrize("options", [{"import_errors": [{"message": "invalid dataset"}]}, {"deployed_after_import": False}])
+def test_failed_deployment_is_not_cached(monkeypatch, state_dir, options):
+    graphql = deployment_graphql(False, **options)
+    monkeypatch.setattr(main.eywa, "graphql", graphql)
+    assert not asyncio.run(main.ensure_model_deployed())
+    assert not asyncio.run(main.ensure_model_deployed())
+    assert imports(graphql) == 2
+    assert main.load_state(main.DEPLOYMENT_STATE_FILE) is None
+
+def entity_graphql(euuids, failing=()):
+    """
+    Recording stub of a search query (keyset pagination by euuid) and aliased delete mutations
+    over euuids, delete batch containing any of failing euuids is rejected.
+    """
+    stored = set(euuids)
+    def handler(query, variables):
+        if "searchMeasurement" in query:
+            after = variables.get("after", "")
+            rows = sorted(euuid for euuid in stored if euuid > after)[:variables["limit"]]
+            return {"data": {"searchMeasurement": [{"euuid": euuid} for euuid in rows]}}
+        batch = [variables[f"e{i}"] for i in range(len(variables))]
+        if failing and set(batch) & set(failing):
+            return {"errors": [{"message": "cannot delete"}]}
+        stored.difference_update(batch)
+        return {"data": {f"d{i}": True for i in range(len(batch))}}
+    graphql = RecordingGraphQL(handler)
+    graphql.stored = stored
+    return graphql
+
+def test_purge_measurements_deletes_every_page(monkeypatch):
+    euuids = [f"{i:08d}-0000-0000-0000-000000000000" for i in range(25)]
+    graphql = entity_graphql(euuids)
+    monkeypatch.setattr(main.eywa, "graphql", graphql)
+    monkeypatch.setattr(main, "fetch_page_size", 10)
+    monkeypatch.setattr(main, "delete_batch_size", 4)
+    result = asyncio.run(main.purge_measurements())
+    assert graphql.stored == set()
+    assert result == {"total": 25, "round_trips": 7, "deleted": 25, "failed": 0, "errors": []}
+    searches = [variables for query, variables in graphql.requests if "searchMeasurement" in query]
+    #pages continue after the last euuid of the previous page, deletes in the meantime don't shift them
+    assert searches == [{"limit": 10}, {"limit": 10, "after": euuids[9]}, {"limit": 10, "after": euuids[19]}]
+    deletes = [query for query, variables in graphql.requests if "deleteMeasurement" in query]
+    assert len(deletes) == 7
+    assert "d3: deleteMeasurement(euuid: $e3)" in deletes[0]
+
+def test_delete_entities_reports_failed_batches():
+    euuids = [f"euuid-{i}" for i in range(10)]
+    graphql = entity_graphql(euuids, failing={"euuid-5"})
+    result = asyncio.run(main.delete_entities("deleteMeasurement", euuids, batch_size=4, concurrency=2,
+                                              graphql=graphql, progress=None))
+    assert result["deleted"] == 6
+    assert result["failed"] == 4
+    assert [error["euuids"] for error in result["errors"]] == [euuids[4:8]]
+    assert graphql.stored == set(euuids[4:8])
+
+class RenderingDriver:
+    """
+    Fake browser that answers scripts of read_station_table as if it rendered html.
+    """
+    def __init__(self, html):
+        self.html = html
+        self.visited = []
+
+    def get(self, link):
+        self.visited.append(link)
+
+    def execute_script(self, script, *args):
+        if script == main.TABLE_TEXT_SCRIPT:
+            return parse_station_rows(self.html)
+        if script == main.PAGE_TEXT_SCRIPT:
+            return "Aktualni podaci 18.10.2026. u 16 h"
+        if "readyState" in script:
+            return "complete"
+        return 1
+
+    def quit(self):
+        pass
+
+class RecordingBuffer:
+    def __init__(self):
+        self.measurements = []
+
+    def append(self, measurements):
+        self.measurements.extend(measurements)
+
+@pytest.fixture
+def scrape(monkeypatch, state_dir):
+    monkeypatch.setattr(main, "incremental_import", False)
+    monkeypatch.setattr(main, "store_locally", False)
+    monkeypatch.setattr(main, "reference_stations_by_euuid", False)
+    async def ensure_model_deployed():
+        return True
+    monkeypatch.setattr(main, "ensure_model_deployed", ensure_model_deployed)
+    def scrape(link, factory):
+        buffer = RecordingBuffer()
+        with main.DriverPool(factory) as pool:
+            assert asyncio.run(main.scrape_and_import(link, pool, buffer))
+        return [data["station"]["name"] for data in buffer.measurements]
+    return scrape
+
+def test_scrape_reads_table_over_http(page_server, scrape):
+    page_server.pages["/aktpod"] = read_fixture("dhmz_station_table.html")
+    def factory():
+        raise AssertionError("browser started although table is in plain HTML")
+    assert scrape(page_server.url + "/aktpod", factory) == ["Zagreb-Grič", "Zavižan", "Split-Marjan"]
+
+def test_scrape_falls_back_to_selenium(page_server, scrape):
+    #table is rendered by javascript, plain HTML has only the shell of the page
+    page_server.pages["/aktpod"] = "<html><body><div id='app'></div><script src='app.js'></script></body></html>"
+    driver = RenderingDriver(read_fixture("dhmz_station_table.html"))
+    fallbacks = main.metrics.counters.get("selenium_fallbacks", 0)
+    assert scrape(page_server.url + "/aktpod", lambda: driver) == ["Zagreb-Grič", "Zavižan", "Split-Marjan"]
+    assert driver.visited == [page_server.url + "/aktpod"]
+    assert main.metrics.counters["selenium_fallbacks"] == fallbacks + 1
+
+def measurement(name, temperature):
+    return {"station": {"name": name}, "time": "2026-10-18T16:00:00", "air_temperature": temperature}
+
+def test_filter_changed_measurements_skips_unchanged_rows(state_dir):
+    rows = [measurement("Zavižan", 1.5), measurement("Split-Marjan", 20.1)]
+    changed, state, stats = main.filter_changed_measurements(rows, "2026-10-18T16:00")
+    assert changed == rows and stats == {"sent": 2, "skipped": 0}
+    main.save_measurement_digests(state)
+    rows = [measurement("Zavižan", 1.5), measurement("Split-Marjan", 19.8)]
+    changed, state, stats = main.filter_changed_measurements(rows, "2026-10-18T16:00")
+    assert changed == rows[1:] and stats == {"sent": 1, "skipped": 1}
+    assert state["totals"] == {"sent": 3, "skipped": 1}
+
+def test_filter_changed_measurements_sends_same_values_of_new_or_unknown_hour(state_dir):
+    rows = [measurement("Zavižan", 1.5)]
+    main.save_measurement_digests(main.filter_changed_measurements(rows, "2026-10-18T16:00")[1])
+    changed, state, stats = main.filter_changed_measurements(rows, "2026-10-18T17:00")
+    assert changed == rows and stats == {"sent": 1, "skipped": 0}
+    changed, state, stats = main.filter_changed_measurements(rows, None)
+    assert changed == rows and stats == {"sent": 1, "skipped": 0}
+    assert state["stations"]["Zavižan"]["hour"] is None
+
+def test_digests_are_saved_only_after_successful_import(monkeypatch, page_server, scrape):
+    page_server.pages["/aktpod"] = read_fixture("dhmz_station_table.html")
+    monkeypatch.setattr(main, "incremental_import", True)
+    responses = [{"errors": [{"message": "invalid measurement"}]}, {"data": {"stackMeasurementList": []}}]
+    sent = []
+    async def import_measures(data):
+        sent.append(len(data))
+        return responses[len(sent) - 1]
+    monkeypatch.setattr(main, "import_measures", import_measures)
+    def factory():
+        raise AssertionError("browser started although table is in plain HTML")
+    with main.DriverPool(factory) as pool:
+        assert not asyncio.run(main.scrape_and_import(page_server.url + "/aktpod", pool))
+        assert main.load_state(main.MEASUREMENT_DIGEST_FILE) is None
+        assert asyncio.run(main.scrape_and_import(page_server.url + "/aktpod", pool))
+    assert sent == [3, 3]
+    assert set(main.load_state(main.MEASUREMENT_DIGEST_FILE)["stations"]) == {"Zagreb-Grič", "Zavižan", "Split-Marjan"}
+
+def test_slow_fetch_does_not_block_event_loop(monkeypatch, scrape):
+    def fetch_station_page(link):
+        time.sleep(0.3)
+        return parse_station_page(read_fixture("dhmz_station_table.html"))
+    monkeypatch.setattr(main, "fetch_station_page", fetch_station_page)
+    async def run():
+        ticks = 0
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        ticker = asyncio.create_task(tick())
+        buffer = RecordingBuffer()
+        assert await main.scrape_and_import("http://dhmz.invalid/aktpod", None, buffer)
+        ticker.cancel()
+        return ticks, len(buffer.measurements)
+    ticks, buffered = asyncio.run(run())
+    assert buffered == 3
+    assert ticks >= 10
@@ -0,0 +1,79 @@
+import asyncio
+
+from measurement_buffer import MeasurementBuffer, flush
+
+class FlakyGraphQL:
+    """
+    Stub of import mutation that drops every third call and rejects batches containing
+    measurements with poison set. Stored measurements are kept by euuid, like eywa does.
+    """
+    def __init__(self, fail_every=3):
+        self.fail_every = fail_every
+        self.calls = 0
+        self.stored = {}
+        self.received = []
+
+    async def __call__(self, batch):
+        self.calls += 1
+        if self.calls % self.fail_every == 0:
+            raise ConnectionError("connection reset")
+        if any(data.get("poison") for data in batch):
+            return {"errors": [{"message": "invalid measurement"}]}
+        for data in batch:
+            self.received.append(data["euuid"])
+            self.stored[data["euuid"]] = data
+        return {"data": {"stackMeasurementList": batch}}
+
+def measurements(count, poison=()):
+    return [{"temperature": i, "poison": i in poison} for i in range(count)]
+
+def test_flush_retries_and_dead_letters_rejected(tmp_path):
+    buffer = MeasurementBuffer(str(tmp_path / "buffer.sqlite3"))
+    buffer.append(measurements(50, poison={7, 31}))
+    graphql = FlakyGraphQL()
+    stats = asyncio.run(flush(buffer, graphql, batch_size=20, retries=3, backoff=0))
+    assert stats["pending"] == 0
+    assert stats["dead_letters"] == 2
+    assert stats["sent"] == 48
+    assert stats["failed_attempts"] > 0
+    assert sorted(data["temperature"] for data in graphql.stored.values()) == [i for i in range(50) if i not in (7, 31)]
+    assert sorted(data["temperature"] for data, error in buffer.dead_letters()) == [7, 31]
+    assert all("invalid measurement" in error for data, error in buffer.dead_letters())
+    buffer.close()
+
+def test_flush_stops_when_sending_keeps_failing(tmp_path):
+    buffer = MeasurementBuffer(str(tmp_path / "buffer.sqlite3"))
+    buffer.append(measurements(10))
+    graphql = FlakyGraphQL(fail_every=1)
+    stats = asyncio.run(flush(buffer, graphql, batch_size=5, retries=2, backoff=0))
+    assert stats == {"sent": 0, "batches": 0, "failed_attempts": 3, "dead_letters": 0, "pending": 10}
+    buffer.close()
+
+def test_replay_after_restart_is_idempotent(tmp_path):
+    path = str(tmp_path / "buffer.sqlite3")
+    buffer = MeasurementBuffer(path)
+    buffer.append(measurements(30))
+    graphql = FlakyGraphQL()
+    #response of the first batch is lost after eywa stored it, so it stays in the buffer
+    ids, batch = buffer.peek(10)
+    asyncio.run(graphql(batch))
+    buffer.close()
+    buffer = MeasurementBuffer(path)
+    assert len(buffer) == 30
+    stats = asyncio.run(flush(buffer, graphql, batch_size=10, retries=3, backoff=0))
+    assert stats["pending"] == 0
+    assert len(graphql.received) == 40
+    assert len(graphql.stored) == 30
+    buffer.close()
+
+def test_requeue_dead_letters(tmp_path):
+    buffer = MeasurementBuffer(str(tmp_path / "buffer.sqlite3"))
+    buffer.append(measurements(5, poison={2}))
+    graphql = FlakyGraphQL(fail_every=100)
+    asyncio.run(flush(buffer, graphql, batch_size=5, retries=0, backoff=0))
+    [(data, error)] = buffer.dead_letters()
+    assert buffer.requeue_dead_letters() == 1
+    assert buffer.dead_letters() == []
+    ids, [requeued] = buffer.peek(5)
+    assert requeued["euuid"] == data["euuid"]
+    buffer.close()
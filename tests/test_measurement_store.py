@@ -0,0 +1,26 @@
+import os
+
+from measurement_store import MeasurementStore
+
+def measurements(time, count=3):
+    return [{"station": {"name": f"Station {i}"}, "air_temperature": float(i), "time": time} for i in range(count)]
+
+def chunks(store, day):
+    return [f for f in os.listdir(os.path.join(store.root, day)) if f.endswith(".npz")]
+
+def test_closed_days_are_compacted(tmp_path):
+    store = MeasurementStore(str(tmp_path))
+    store.append(measurements("2026-10-17T10:00:00Z"))
+    store.append(measurements("2026-10-17T11:00:00Z"))
+    assert len(chunks(store, "2026-10-17")) == 2
+    store.append(measurements("2026-10-18T00:00:00Z"))
+    assert len(chunks(store, "2026-10-17")) == 1
+    store.append(measurements("2026-10-18T01:00:00Z"))
+    assert len(chunks(store, "2026-10-18")) == 2
+    #late measurement of a closed day is merged right away
+    store = MeasurementStore(str(tmp_path))
+    store.append(measurements("2026-10-17T12:00:00Z") + measurements("2026-10-18T02:00:00Z"))
+    assert len(chunks(store, "2026-10-17")) == 1
+    assert len(chunks(store, "2026-10-18")) == 3
+    assert len(store.load()["time"]) == 18
+    assert store.station_min_max("air_temperature") == {f"Station {i}": (float(i), float(i)) for i in range(3)}
@@ -0,0 +1,32 @@
+from transform_spec import Rename, WrapEach, compile_spec
+
+SPEC = {
+    "number": "details.number",
+    "deep": "a.b.c",
+    "vendor": "vendor",
+    "totals": Rename("totals", {"tax_breakdown": "tax_breakdowns"}),
+    "meta": {"notes": WrapEach("metadata.notes", "note")},
+}
+
+def test_compile_spec_builds_target():
+    source = {"details": {"number": "INV-1"}, "a": {"b": {"c": 3}}, "vendor": {"name": "V"},
+              "totals": {"total": 10, "tax_breakdown": [1]}, "metadata": {"notes": ["x", "y"]}}
+    transform = compile_spec(SPEC, "build_invoice")
+    assert transform.__name__ == "build_invoice"
+    assert transform(source) == {"number": "INV-1", "deep": 3, "vendor": {"name": "V"},
+                                 "totals": {"total": 10, "tax_breakdowns": [1]},
+                                 "meta": {"notes": [{"note": "x"}, {"note": "y"}]}}
+    #source is not modified
+    assert source["totals"] == {"total": 10, "tax_breakdown": [1]}
+
+def test_missing_or_non_object_parts_give_none():
+    transform = compile_spec(SPEC)
+    assert transform({}) == {"number": None, "deep": None, "vendor": None, "totals": None, "meta": {"notes": None}}
+    assert transform({"details": "INV-1", "a": {"b": [1]}, "totals": [1], "metadata": None}) == \
+        {"number": None, "deep": None, "vendor": None, "totals": None, "meta": {"notes": None}}
+    assert transform({"totals": {"total": 1}})["totals"] == {"total": 1, "tax_breakdowns": None}
+
+def test_shared_parent_is_looked_up_once():
+    transform = compile_spec({"a": "meta.a", "b": "meta.b", "inner": {"c": "meta.c", "n": WrapEach("meta.n", "k")}})
+    assert transform.source.count("'meta'") == 1
+    assert transform({"meta": {"a": 1, "c": 3, "n": [4]}}) == {"a": 1, "b": None, "inner": {"c": 3, "n": [{"k": 4}]}}
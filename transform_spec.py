@@ -0,0 +1,79 @@
+from collections import namedtuple
+
+#spec values: "a.b.c" copies value from that source path, dict builds nested object,
+#Rename copies object with some keys renamed (renamed keys missing from it are set to None),
+#WrapEach turns list of values into list of objects ["a", "b"] -> [{key: "a"}, {key: "b"}],
+#both give None when there is nothing at path
+Rename = namedtuple("Rename", ["path", "renames"])
+WrapEach = namedtuple("WrapEach", ["path", "key"])
+
+#read-only stand-in for missing (or non-object) parts of source, never handed out
+EMPTY = {}
+
+def split_path(path) -> tuple:
+    return tuple(path.split(".")) if isinstance(path, str) else tuple(path)
+
+class _Compiler:
+    def __init__(self):
+        self.lines = []
+        #source path prefix -> name of variable holding it
+        self.variables = {(): "source"}
+        self.values = 0
+
+    def variable(self, prefix: tuple) -> str:
+        """
+        Object at prefix, resolved once per call of the compiled function no matter how many
+        fields read from it. Missing or non-object parts resolve to EMPTY.
+        """
+        name = self.variables.get(prefix)
+        if name is None:
+            parent = self.variable(prefix[:-1])
+            name = self.variables[prefix] = f"_{len(self.variables)}"
+            self.lines.append(f"    {name} = {parent}.get({prefix[-1]!r}, EMPTY)")
+            self.lines.append(f"    if {name}.__class__ is not dict: {name} = EMPTY")
+        return name
+
+    def value(self, path) -> str:
+        path = split_path(path)
+        return f"{self.variable(path[:-1])}.get({path[-1]!r})"
+
+    def statement_value(self, path) -> str:
+        name = f"_v{self.values}"
+        self.values += 1
+        self.lines.append(f"    {name} = {self.value(path)}")
+        return name
+
+    def expression(self, spec) -> str:
+        if isinstance(spec, Rename):
+            name = self.statement_value(spec.path)
+            self.lines.append(f"    if {name}.__class__ is dict:")
+            self.lines.append(f"        {name} = {name}.copy()")
+            self.lines.extend(f"        {name}[{new!r}] = {name}.pop({old!r}, None)" for old, new in dict(spec.renames).items())
+            self.lines.append(f"    else: {name} = None")
+            return name
+        if isinstance(spec, WrapEach):
+            name = self.statement_value(spec.path)
+            self.lines.append(f"    if {name} is not None:")
+            self.lines.append(f"        _wrapped = []")
+            self.lines.append(f"        for x in {name}: _wrapped.append({{{spec.key!r}: x}})")
+            self.lines.append(f"        {name} = _wrapped")
+            return name
+        if isinstance(spec, dict):
+            return "{" + ", ".join(f"{target!r}: {self.expression(source)}" for target, source in spec.items()) + "}"
+        return self.value(spec)
+
+def compile_spec(spec: dict, name: str = "transform"):
+    """
+    Compiles spec (target field -> source) into a function that builds target object from source.
+    Function is generated as Python source: fields are grouped by the source object they read from,
+    which is looked up once per call, Rename and WrapEach are plain statements and the result
+    is built by a single expression. Source is never modified.
+    """
+    compiler = _Compiler()
+    result = compiler.expression(spec)
+    source = "\n".join([f"def {name}(source):", *compiler.lines, f"    return {result}", ""])
+    namespace = {"EMPTY": EMPTY}
+    exec(compile(source, f"<spec {name}>", "exec"), namespace)
+    function = namespace[name]
+    function.source = source
+    return function
@@ -0,0 +1,162 @@
+import json
+import re
+from collections import namedtuple
+
+#decoder understands verbose Transit-JSON, the format eywa uses for dataset exports
+#(maps as JSON objects, "~:" keywords, "~u" uuids, "~#tag" tagged values)
+TAG_PREFIX = "~#neyho.eywa.dataset.core."
+#layout information of the ERD editor, not needed for anything here
+SKIPPED_KEYS = frozenset(("width", "height", "position", "clone", "original", "path"))
+
+Attribute = namedtuple("Attribute", ["euuid", "name", "field", "type", "constraint", "active", "seq"])
+Entity = namedtuple("Entity", ["euuid", "name", "type", "attributes", "unique"])
+Relation = namedtuple("Relation", ["euuid", "from_entity", "to_entity", "from_label", "to_label", "cardinality"])
+Model = namedtuple("Model", ["entities", "relations"])
+
+def field_name(name):
+    """
+    GraphQL field name eywa generates for attribute or relation label ("Wind Direction" -> "wind_direction").
+    """
+    return re.sub(r'[^0-9a-z]+', '_', name.strip().lower()).strip('_')
+
+def type_name(name):
+    """
+    GraphQL type name eywa generates for entity ("Invoice Details" -> "InvoiceDetails").
+    """
+    return "".join(part[:1].upper() + part[1:] for part in re.split(r'[^0-9A-Za-z]+', name) if part)
+
+def decode_value(value):
+    if value.__class__ is str:
+        if value[:1] == "~" and len(value) > 1:
+            prefix = value[1]
+            if prefix in ":u$":
+                return value[2:]
+            if prefix == "~":
+                return value[1:]
+    elif value.__class__ is list:
+        return [decode_value(v) for v in value]
+    return value
+
+def build_attribute(node):
+    return Attribute(node.get("euuid"), node.get("name"), field_name(node.get("name") or ""),
+                     node.get("type"), node.get("constraint"), node.get("active", True), node.get("seq", 0))
+
+def build_entity(node):
+    attributes = tuple(sorted((a for a in node.get("attributes") or () if isinstance(a, Attribute)),
+                              key=lambda a: a.seq))
+    constraints = (node.get("configuration") or {}).get("constraints") or {}
+    unique = tuple(tuple(group) for group in constraints.get("unique") or () if group)
+    return Entity(node.get("euuid"), node.get("name"), node.get("type"), attributes, unique)
+
+def build_relation(node):
+    return Relation(node.get("euuid"), node.get("from"), node.get("to"),
+                    node.get("from-label"), node.get("to-label"), node.get("cardinality"))
+
+def build_model(node):
+    entities = [e for e in (node.get("entities") or {}).values() if isinstance(e, Entity)]
+    relations = [r for r in (node.get("relations") or {}).values() if isinstance(r, Relation)]
+    return Model(entities, relations)
+
+BUILDERS = {
+    "ERDEntityAttribute": build_attribute,
+    "ERDEntity": build_entity,
+    "ERDRelation": build_relation,
+    "ERDModel": build_model,
+}
+
+def reduce_node(pairs):
+    """
+    object_pairs_hook for json decoder. Objects are decoded bottom-up, so every
+    tagged ERD node is turned into a small record as soon as it's parsed and layout keys
+    are dropped, full generic tree of the export is never held in memory.
+    """
+    if len(pairs) == 1 and pairs[0][0].startswith("~#"):
+        tag, value = pairs[0]
+        builder = BUILDERS.get(tag[len(TAG_PREFIX):]) if tag.startswith(TAG_PREFIX) else None
+        return builder(value) if builder and isinstance(value, dict) else value
+    node = {}
+    for key, value in pairs:
+        key = decode_value(key)
+        if key not in SKIPPED_KEYS:
+            node[key] = decode_value(value) if value.__class__ is str or value.__class__ is list else value
+    return node
+
+class ModelIndex:
+    """
+    Index of entities, attributes and relations of dataset version, by euuid and by name.
+    """
+    def __init__(self, version):
+        self.euuid = version.get("euuid")
+        self.name = version.get("name")
+        self.dataset = (version.get("dataset") or {}).get("name")
+        model = version.get("model") or Model([], [])
+        self.entities = {entity.euuid: entity for entity in model.entities}
+        self.entities_by_name = {entity.name: entity for entity in model.entities}
+        self.attributes = {a.euuid: a for entity in model.entities for a in entity.attributes}
+        self.relations = {relation.euuid: relation for relation in model.relations}
+        #entity euuid -> {field name: (relation, target entity euuid, to many)}
+        self.relation_fields = {}
+        for relation in model.relations:
+            many_targets = relation.cardinality in ("o2m", "m2m")
+            many_sources = relation.cardinality in ("m2o", "m2m")
+            if relation.to_label:
+                self.relation_fields.setdefault(relation.from_entity, {})[field_name(relation.to_label)] = \
+                    (relation, relation.to_entity, many_targets)
+            if relation.from_label:
+                self.relation_fields.setdefault(relation.to_entity, {})[field_name(relation.from_label)] = \
+                    (relation, relation.from_entity, many_sources)
+
+    def entity(self, name_or_euuid):
+        entity = self.entities_by_name.get(name_or_euuid) or self.entities.get(name_or_euuid)
+        if entity is None:
+            raise KeyError(f"Entity {name_or_euuid} is not in model {self.dataset} {self.name}")
+        return entity
+
+    def fields(self, entity_name):
+        """
+        Returns {GraphQL field name: Attribute} of active attributes of entity.
+        """
+        return {a.field: a for a in self.entity(entity_name).attributes if a.active}
+
+    def unique_fields(self, entity_name):
+        return [[self.attributes[euuid].field for euuid in group if euuid in self.attributes]
+                for group in self.entity(entity_name).unique]
+
+    def check_fields(self, entity_name, fields):
+        """
+        Returns {field: problem} for fields that are neither attributes nor relations of entity,
+        or whose type differs from the model. fields is {field name: expected model type or None}.
+        """
+        entity = self.entity(entity_name)
+        attributes = self.fields(entity_name)
+        relations = self.relation_fields.get(entity.euuid, {})
+        problems = {}
+        for field, expected_type in fields.items():
+            attribute = attributes.get(field)
+            if attribute is None and field not in relations:
+                problems[field] = f"not an attribute or relation of {entity.name}"
+            elif attribute is not None and expected_type and attribute.type != expected_type:
+                problems[field] = f"model type is {attribute.type}, not {expected_type}"
+        return problems
+
+    def stack_mutation(self, entity_name, selection="euuid"):
+        """
+        Mutation that stacks list of entity_name rows passed in $data.
+        """
+        name = type_name(self.entity(entity_name).name)
+        return f"""
+    mutation($data: [{name}Input])
+    {{
+        stack{name}List(data: $data)
+        {{
+            {selection}
+        }}
+    }}
+    """
+
+def decode(text):
+    return ModelIndex(json.loads(text, object_pairs_hook=reduce_node))
+
+def load_model(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return ModelIndex(json.load(f, object_pairs_hook=reduce_node))